@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import pubrunner.convert
+import pubrunner.xmlbackend
+import pubrunner.outputformats
+import syntheticcorpus
+
+# Times each converter and each output path of pubrunner_convert on a synthetic corpus (see syntheticcorpus.py) so
+# that it runs offline. The results are compared to a stored baseline and any benchmark that has slowed down by
+# more than the tolerance is reported as a regression (with a non-zero exit code so that it can be used in CI)
+
+defaultBaselineFilename = os.path.join(os.path.dirname(os.path.abspath(__file__)),'converters_baseline.json')
+
+def countDocuments(docs):
+	count = 0
+	for doc in docs:
+		count += 1
+	return count
+
+def getBenchmarks(corpus,outDir):
+	pubmedFiles,_ = corpus['pubmedxml']
+	pmcFiles,_ = corpus['pmcxml']
+	marcFiles,marcDocumentCount = corpus['marcxml']
+	xmiFiles,xmiDocumentCount = corpus['uimaxmi']
+
+	def outFile(name):
+		return os.path.join(outDir,name)
+
+	def processMedlineFiles():
+		return sum( countDocuments(pubrunner.convert.processMedlineFile(f)) for f in pubmedFiles )
+	def processPMCFiles():
+		return sum( countDocuments(pubrunner.convert.processPMCFile(f)) for f in pmcFiles )
+	def marcxml2bioc():
+		for f in marcFiles:
+			pubrunner.convert.marcxml2bioc(f,outFile('marc.bioc'))
+		return marcDocumentCount
+	def uimaxmi2bioc():
+		for f in xmiFiles:
+			pubrunner.convert.uimaxmi2bioc(f,outFile('xmi.bioc'))
+		return xmiDocumentCount
+
+	# Each benchmark is the input files and a function that converts them and returns the number of documents
+	benchmarks = [
+		('processMedlineFile', pubmedFiles, processMedlineFiles),
+		('processPMCFile', pmcFiles, processPMCFiles),
+		('marcxml2bioc', marcFiles, marcxml2bioc),
+		('uimaxmi2bioc', xmiFiles, uimaxmi2bioc)
+	]
+
+	outFormats = list(pubrunner.convert.acceptedOutFormats)
+	if pubrunner.outputformats.pyarrow is None:
+		print("Skipping Parquet and Arrow output as pyarrow isn't installed")
+		outFormats = [ f for f in outFormats if not f in ['parquet','arrow'] ]
+
+	for inFormat in ['pubmedxml','pmcxml','bioc']:
+		inFiles,documentCount = corpus[inFormat]
+		for outFormat in outFormats:
+			def convert(inFiles=inFiles,inFormat=inFormat,outFormat=outFormat,documentCount=documentCount):
+				pubrunner.convert.convertFiles(inFiles,inFormat,outFile('out.%s' % outFormat),outFormat)
+				return documentCount
+			benchmarks.append(('convert %s to %s' % (inFormat,outFormat), inFiles, convert))
+
+	return benchmarks
+
+# The best of the repeats is used as it is the least affected by anything else running on the machine
+def runBenchmark(inFiles,benchmarkFunction,repeats):
+	inputBytes = sum( os.path.getsize(f) for f in inFiles )
+	bestSeconds = None
+	for _ in range(repeats):
+		start = time.perf_counter()
+		documentCount = benchmarkFunction()
+		seconds = time.perf_counter() - start
+		if bestSeconds is None or seconds < bestSeconds:
+			bestSeconds = seconds
+	return {'documents':documentCount, 'seconds':bestSeconds, 'documentsPerSecond':documentCount / bestSeconds, 'mbPerSecond':inputBytes / bestSeconds / (1024*1024)}
+
+def getEnvironment(scale):
+	return {'scale':scale, 'python':platform.python_version(), 'machine':platform.machine(), 'xmlBackend':pubrunner.xmlbackend.getXMLBackend().name}
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark of the converters and output formats on a synthetic corpus compared to a stored baseline')
+	parser.add_argument('--scale',type=float,default=0.5,help='Size of the synthetic corpus (1 is about 35MB of files)')
+	parser.add_argument('--repeats',type=int,default=3,help='Number of times to run each benchmark (the best time is used)')
+	parser.add_argument('--baseline',type=str,default=defaultBaselineFilename,help='JSON file with the baseline results to compare to')
+	parser.add_argument('--saveBaseline',action='store_true',help='Save the results as the new baseline instead of comparing to it')
+	parser.add_argument('--tolerance',type=float,default=0.2,help='Fraction that a benchmark can be slower than the baseline before it is reported as a regression')
+	parser.add_argument('--filter',type=str,help='Only run benchmarks with this in their name')
+	args = parser.parse_args()
+
+	baseline = None
+	if not args.saveBaseline and os.path.isfile(args.baseline):
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		if baseline['environment'] != getEnvironment(args.scale):
+			print("WARNING: The baseline was run in a different environment (%s) so the comparison may not be meaningful" % json.dumps(baseline['environment']))
+
+	results = {}
+	regressions = []
+	with tempfile.TemporaryDirectory() as tempDir:
+		corpus = syntheticcorpus.writeSyntheticCorpus(os.path.join(tempDir,'corpus'),args.scale)
+		outDir = os.path.join(tempDir,'out')
+		os.makedirs(outDir)
+
+		print("%-30s %10s %10s %12s %10s %12s" % ('benchmark','documents','seconds','documents/s','MB/s','vs baseline'))
+		for name,inFiles,benchmarkFunction in getBenchmarks(corpus,outDir):
+			if args.filter and not args.filter in name:
+				continue
+
+			# The output of the converters is silenced
+			stdout = sys.stdout
+			sys.stdout = open(os.devnull,'w')
+			try:
+				result = runBenchmark(inFiles,benchmarkFunction,args.repeats)
+			finally:
+				sys.stdout.close()
+				sys.stdout = stdout
+			results[name] = result
+
+			comparison = ''
+			if baseline is not None and name in baseline['results']:
+				change = result['documentsPerSecond'] / baseline['results'][name]['documentsPerSecond'] - 1
+				comparison = '%+.1f%%' % (100*change)
+				if change < -args.tolerance:
+					comparison += ' REGRESSION'
+					regressions.append(name)
+
+			print("%-30s %10d %10.2f %12.1f %10.2f %12s" % (name,result['documents'],result['seconds'],result['documentsPerSecond'],result['mbPerSecond'],comparison))
+
+	if args.saveBaseline:
+		with open(args.baseline,'w') as f:
+			json.dump({'environment':getEnvironment(args.scale), 'results':results},f,indent=2,sort_keys=True)
+		print("Saved baseline to %s" % args.baseline)
+	elif regressions:
+		print("%d benchmark(s) are more than %.0f%% slower than the baseline: %s" % (len(regressions),100*args.tolerance,", ".join(regressions)))
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,100 @@
+import argparse
+import xml.etree.ElementTree as etree
+import unicodedata
+import html
+import time
+import re
+import pubrunner.convert
+
+# The text cleanup chain as it was before the fused normalizeTextList, kept here as the reference
+def legacyRemoveBracketsWithoutWords(text):
+	fixed = re.sub(r'\([\W\s]*\)', ' ', text)
+	fixed = re.sub(r'\[[\W\s]*\]', ' ', fixed)
+	fixed = re.sub(r'\{[\W\s]*\}', ' ', fixed)
+	return fixed
+
+def legacyRemoveWeirdBracketsFromOldTitles(titleText):
+	titleText = titleText.strip()
+	if titleText[0] == '[' and titleText[-2:] == '].':
+		titleText = titleText[1:-2] + '.'
+	return titleText
+
+def legacyCleanupText(text):
+	text = text.replace(u'\u2028',' ').replace(u'\u2029',' ')
+	text = "".join(ch for ch in text if unicodedata.category(ch)[0]!="C")
+	text = "".join(ch if unicodedata.category(ch)[0]!="Z" else " " for ch in text)
+	text = re.sub(r',(\s*,)*',',',text)
+	text = re.sub(r'(,\s*)*\.','.',text)
+	return text.strip()
+
+def legacyNormalizeTextList(textList, isTitle=False):
+	textList = [ legacyCleanupText(t.replace('\n', ' ')) for t in textList ]
+	if isTitle:
+		textList = [ legacyRemoveWeirdBracketsFromOldTitles(t) for t in textList if len(t) > 0 ]
+	textList = [ t for t in textList if len(t) > 0 ]
+	textList = [ html.unescape(t) for t in textList ]
+	textList = [ legacyRemoveBracketsWithoutWords(t) for t in textList ]
+	return textList
+
+# A few passages in the style of PubMed abstracts and PMC full text for when no files are provided
+samplePassages = [
+	(True, u"[Effects of α-interferon on hepatitis B virus replication in vitro]."),
+	(True, u"Genome-wide association study identifies novel loci for type 2 diabetes"),
+	(False, u"BACKGROUND: The p53 tumour suppressor ( [3] [4] ) is mutated in >50% of cancers , , and its loss is\nassociated with poor outcome (n = 245; P < 0.001) [5–7]."),
+	(False, u"Patients (n = 1,024) were recruited between 2001 and 2005 &amp; followed for a median of 7.4 years { }. Naïve CD4+ T-cells were isolated as described previously ( )."),
+	(False, u"Tumour volume was measured every 3 days , and mice were sacrificed at day 21 , . Data are shown as mean +/- SD [ ] (Figure 1)."),
+	(False, u"We used a Cox proportional hazards model , adjusting for age, sex , BMI and smoking status , . Hazard ratios (HR) with 95% confidence intervals (CI) are reported throughout."),
+	(False, u"Results are shown in Figure 2 ( ) and Table 1 [ ]. The\u200bsoft hyphen\u00ad and zero-width characters\u200b should be removed , ."),
+]
+
+def loadPassages(pubmedFiles, pmcFiles):
+	passages = []
+	for pubmedFile in pubmedFiles:
+		for event, elem in etree.iterparse(pubmedFile, events=('end',)):
+			if elem.tag == 'PubmedArticle':
+				passages.append((True, pubrunner.convert.extractRawTextFromElemList(elem.findall('./MedlineCitation/Article/ArticleTitle'))))
+				passages.append((False, pubrunner.convert.extractRawTextFromElemList(elem.findall('./MedlineCitation/Article/Abstract/AbstractText'))))
+				elem.clear()
+	for pmcFile in pmcFiles:
+		for event, elem in etree.iterparse(pmcFile, events=('end',)):
+			if elem.tag == 'article':
+				passages.append((True, pubrunner.convert.extractRawTextFromElemList(elem.findall('./front/article-meta/title-group/article-title'))))
+				for path in ['./front/article-meta/abstract','./body','./back','./floats-group']:
+					passages.append((False, pubrunner.convert.extractRawTextFromElemList(elem.findall(path))))
+				elem.clear()
+	return passages
+
+def timeNormalization(normalize, passages, repeats):
+	start = time.time()
+	for _ in range(repeats):
+		output = [ normalize(textList, isTitle) for isTitle,textList in passages ]
+	return time.time() - start, output
+
+def main():
+	parser = argparse.ArgumentParser(description='Micro-benchmark of the text normalization against the previous cleanup chain')
+	parser.add_argument('--pubmedXMLFiles',type=str,help='Comma-delimited Pubmed XML files to take titles and abstracts from')
+	parser.add_argument('--pmcXMLFiles',type=str,help='Comma-delimited PMC XML files to take titles and full text from')
+	parser.add_argument('--repeats',type=int,default=5,help='Number of times to normalize the passages')
+	args = parser.parse_args()
+
+	pubmedFiles = args.pubmedXMLFiles.split(',') if args.pubmedXMLFiles else []
+	pmcFiles = args.pmcXMLFiles.split(',') if args.pmcXMLFiles else []
+	if pubmedFiles or pmcFiles:
+		passages = loadPassages(pubmedFiles, pmcFiles)
+	else:
+		passages = [ (isTitle,[text]) for isTitle,text in samplePassages ] * 2000
+
+	characterCount = sum( len(t) for _,textList in passages for t in textList )
+	print("Normalizing %d passage groups (%d characters) %d times" % (len(passages),characterCount,args.repeats))
+
+	legacyTime,legacyOutput = timeNormalization(legacyNormalizeTextList, passages, args.repeats)
+	fusedTime,fusedOutput = timeNormalization(pubrunner.convert.normalizeTextList, passages, args.repeats)
+
+	assert legacyOutput == fusedOutput, "Fused normalization output differs from the previous cleanup chain"
+
+	print("Previous chain: %.3f seconds" % legacyTime)
+	print("Fused:          %.3f seconds" % fusedTime)
+	print("Speedup:        %.1fx" % (legacyTime / fusedTime))
+
+if __name__ == '__main__':
+	main()
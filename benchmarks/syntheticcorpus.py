@@ -0,0 +1,268 @@
+import os
+import random
+import argparse
+from xml.sax.saxutils import escape,quoteattr
+from pubrunner.biocreader import LeanBiocDocument,LeanBiocPassage
+from pubrunner.biocwriter import BiocWriter
+
+# Deterministic synthetic corpora in each of the input formats of pubrunner_convert so that the converters can be
+# benchmarked (and checked) offline. The same seed always gives byte-for-byte the same files. The text mixes in the
+# things that the text extraction and cleanup have to deal with: brackets left empty by removed citations, stray
+# commas, HTML entities, non-ASCII characters and inline markup
+
+vocabulary = ['cancer','gene','expression','p53','tumour','patients','cells','mice','protein','binding','receptor','pathway',
+	'significantly','increased','decreased','compared','treatment','analysis','α-helix','naïve','CD4+','IL-6','β-catenin',
+	'in vitro','e.g.,','(n = 24)','( )','[ ]','{ }',', ,','&amp;','&lt;0.05','résumé','Δ','±']
+inlineMarkup = ['italic','bold','sup','sub','sc']
+sectionTitles = ['Introduction','Background','Methods','Materials and methods','Results','Discussion','Conclusions','Limitations','Funding']
+months = ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
+
+def randomWords(r,count):
+	return ' '.join( r.choice(vocabulary) for _ in range(count) )
+
+# A sentence with some inline markup (already escaped for XML)
+def randomMarkedUpText(r,count):
+	words = randomWords(r,count).split(' ')
+	for _ in range(count // 8):
+		i = r.randrange(len(words))
+		tag = r.choice(inlineMarkup)
+		words[i] = '<%s>%s</%s>' % (tag,words[i],tag)
+	return ' '.join(words)
+
+def writePubmedArticle(f,r,pmid):
+	f.write('<PubmedArticle>\n<MedlineCitation Status="MEDLINE" Owner="NLM">\n<PMID Version="1">%d</PMID>\n' % pmid)
+	f.write('<Article PubModel="Print">\n<Journal>\n<ISSN IssnType="Print">%04d-%04d</ISSN>\n<JournalIssue CitedMedium="Print">\n<Volume>%d</Volume>\n<PubDate>\n' % (r.randrange(10000),r.randrange(10000),r.randint(1,80)))
+	if r.random() < 0.1:
+		f.write('<MedlineDate>%d %s-%s</MedlineDate>\n' % (r.randint(1950,2020),r.choice(months),r.choice(months)))
+	else:
+		f.write('<Year>%d</Year>\n' % r.randint(1950,2020))
+		if r.random() < 0.8:
+			f.write('<Month>%s</Month>\n' % r.choice(months))
+		if r.random() < 0.5:
+			f.write('<Day>%d</Day>\n' % r.randint(1,28))
+	f.write('</PubDate>\n</JournalIssue>\n<Title>Journal of %s</Title>\n<ISOAbbreviation>J %s</ISOAbbreviation>\n</Journal>\n' % (randomWords(r,2),randomWords(r,1)))
+
+	title = randomMarkedUpText(r,r.randint(6,20))
+	if r.random() < 0.05:
+		title = '[%s].' % title
+	f.write('<ArticleTitle>%s</ArticleTitle>\n' % title)
+
+	if r.random() < 0.85:
+		f.write('<Abstract>\n')
+		for label in r.sample(['BACKGROUND','METHODS','RESULTS','CONCLUSIONS'],r.randint(1,4)):
+			f.write('<AbstractText Label="%s" NlmCategory="%s">%s</AbstractText>\n' % (label,label,randomMarkedUpText(r,r.randint(20,80))))
+		f.write('</Abstract>\n')
+
+	f.write('<AuthorList CompleteYN="Y">\n')
+	for i in range(r.randint(1,8)):
+		if r.random() < 0.95:
+			f.write('<Author ValidYN="Y"><LastName>Author%d</LastName><ForeName>%s</ForeName><Initials>A</Initials></Author>\n' % (i,r.choice(['Jane','John','Zoë','Li'])))
+		else:
+			f.write('<Author ValidYN="Y"><CollectiveName>Consortium %d</CollectiveName></Author>\n' % i)
+	f.write('</AuthorList>\n</Article>\n')
+
+	if r.random() < 0.5:
+		f.write('<ChemicalList>\n')
+		for i in range(r.randint(1,4)):
+			f.write('<Chemical><RegistryNumber>0</RegistryNumber><NameOfSubstance UI="D%06d">%s</NameOfSubstance></Chemical>\n' % (r.randrange(1000000),randomWords(r,2)))
+		f.write('</ChemicalList>\n')
+
+	f.write('<MeshHeadingList>\n')
+	for i in range(r.randint(0,10)):
+		f.write('<MeshHeading><DescriptorName UI="D%06d" MajorTopicYN="N">%s</DescriptorName>' % (r.randrange(1000000),randomWords(r,2)))
+		for j in range(r.randint(0,2)):
+			f.write('<QualifierName UI="Q%06d" MajorTopicYN="Y">%s</QualifierName>' % (r.randrange(1000000),randomWords(r,1)))
+		f.write('</MeshHeading>\n')
+	f.write('</MeshHeadingList>\n</MedlineCitation>\n<PubmedData>\n<History>\n')
+	for status in r.sample(['received','accepted','pubmed','medline','entrez'],r.randint(1,5)):
+		f.write('<PubMedPubDate PubStatus="%s"><Year>%d</Year><Month>%d</Month><Day>%d</Day></PubMedPubDate>\n' % (status,r.randint(1950,2020),r.randint(1,12),r.randint(1,28)))
+	f.write('</History>\n<PublicationStatus>ppublish</PublicationStatus>\n</PubmedData>\n</PubmedArticle>\n')
+
+# A Pubmed XML file (like the baseline files) with the given number of citations and a few deleted citations
+def writePubmedFile(filename,articleCount,seed=0):
+	r = random.Random(seed)
+	with open(filename,'w',encoding='utf-8') as f:
+		f.write('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE PubmedArticleSet>\n<PubmedArticleSet>\n')
+		for i in range(articleCount):
+			writePubmedArticle(f,r,seed*10000000+i+1)
+		f.write('<DeleteCitation>\n<PMID Version="1">%d</PMID>\n</DeleteCitation>\n' % (seed*10000000+articleCount+1))
+		f.write('</PubmedArticleSet>\n')
+	return articleCount
+
+def randomParagraph(r):
+	text = randomMarkedUpText(r,r.randint(20,120))
+	citations = ''.join( '<xref ref-type="bibr" rid="B%d">%d</xref>' % (j,j) for j in range(r.randint(1,3)) )
+	return '<p>%s (%s) %s [<xref ref-type="fig" rid="F1">Figure 1</xref>].</p>' % (text,citations,randomWords(r,8))
+
+def randomSection(r,depth):
+	out = ['<sec id="s%d"><title>%d. %s</title>' % (r.randrange(1000),r.randint(1,9),r.choice(sectionTitles))]
+	for _ in range(r.randint(1,4)):
+		out.append(randomParagraph(r))
+	if r.random() < 0.3:
+		out.append('<table-wrap id="T1"><label>Table 1</label><caption><p>%s</p></caption><table><thead><tr><th>Group</th><th>n</th></tr></thead><tbody>' % randomWords(r,6))
+		for i in range(r.randint(2,10)):
+			out.append('<tr><td>%s</td><td>%d</td></tr>' % (randomWords(r,2),r.randint(1,500)))
+		out.append('</tbody></table></table-wrap>')
+	if r.random() < 0.2:
+		out.append('<disp-formula id="E1"><mml:math><mml:mi>x</mml:mi></mml:math></disp-formula>')
+	if r.random() < 0.2:
+		out.append('<list list-type="bullet">%s</list>' % ''.join( '<list-item><p>%s</p></list-item>' % randomWords(r,8) for _ in range(r.randint(2,5)) ))
+	if depth < 2 and r.random() < 0.4:
+		for _ in range(r.randint(1,3)):
+			out.append(randomSection(r,depth+1))
+	out.append('</sec>')
+	return ''.join(out)
+
+def randomPMCArticleContent(r,pmcid,isSubArticle):
+	front = 'front-stub' if isSubArticle else 'front'
+	out = ['<%s>' % front]
+	if not isSubArticle:
+		out.append('<journal-meta><journal-id journal-id-type="nlm-ta">J %s</journal-id><journal-id journal-id-type="iso-abbrev">J Iso</journal-id><journal-title-group><journal-title>Journal of %s</journal-title></journal-title-group></journal-meta><article-meta>' % (randomWords(r,1),randomWords(r,2)))
+	if not isSubArticle or r.random() < 0.5:
+		out.append('<article-id pub-id-type="pmid">%d</article-id><article-id pub-id-type="pmc">%d</article-id><article-id pub-id-type="doi">10.1000/j.%d</article-id>' % (pmcid+20000000,pmcid,pmcid))
+	subtitle = '<subtitle>%s</subtitle>' % randomWords(r,5) if r.random() < 0.2 else ''
+	out.append('<title-group><article-title>%s</article-title>%s</title-group>' % (randomMarkedUpText(r,r.randint(6,20)),subtitle))
+	out.append('<pub-date pub-type="epub"><day>%d</day><month>%d</month><year>%d</year></pub-date>' % (r.randint(1,28),r.randint(1,12),r.randint(1990,2020)))
+	out.append('<abstract>%s</abstract>' % ''.join( '<sec><title>%s</title>%s</sec>' % (r.choice(sectionTitles),randomParagraph(r)) for _ in range(r.randint(1,4)) ))
+	if not isSubArticle:
+		out.append('</article-meta>')
+	out.append('</%s>' % front)
+
+	out.append('<body>')
+	for _ in range(r.randint(3,8)):
+		out.append(randomSection(r,0))
+	out.append('</body>')
+
+	out.append('<back><ack><p>%s</p></ack><sec><title>Competing interests</title><p>None declared.</p></sec><ref-list>' % randomWords(r,10))
+	for i in range(r.randint(5,40)):
+		out.append('<ref id="B%d"><element-citation><article-title>%s</article-title></element-citation></ref>' % (i,randomWords(r,8)))
+	out.append('</ref-list></back>')
+	if r.random() < 0.5:
+		out.append('<floats-group><fig id="F1"><label>Figure 1</label><caption><p>%s</p></caption><graphic/></fig></floats-group>' % randomWords(r,12))
+	return ''.join(out)
+
+# A PMC article (as in a PMCOA .nxml file) with nested sections, tables, formulas, citations and sometimes sub-articles
+def randomPMCArticle(r,pmcid):
+	out = ['<article xmlns:mml="http://www.w3.org/1998/Math/MathML" article-type="research-article">', randomPMCArticleContent(r,pmcid,False)]
+	for i in range(r.choice([0,0,0,1,2])):
+		out.append('<sub-article article-type="reply">%s</sub-article>' % randomPMCArticleContent(r,pmcid*10+i,True))
+	out.append('</article>\n')
+	return ''.join(out)
+
+# A directory of PMC .nxml files with one article each. Sub-articles are separate documents so the document count
+# is returned
+def writePMCFiles(directory,fileCount,seed=0):
+	r = random.Random(seed)
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+
+	filenames,documentCount = [],0
+	for i in range(fileCount):
+		pmcid = seed*10000000+i+1
+		filename = os.path.join(directory,'PMC%d.nxml' % pmcid)
+		article = randomPMCArticle(r,pmcid)
+		with open(filename,'w',encoding='utf-8') as f:
+			f.write('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE article>\n')
+			f.write(article)
+		filenames.append(filename)
+		documentCount += 1 + article.count('<sub-article ')
+	return filenames,documentCount
+
+def marcSubfield(code,text):
+	return '<subfield code="%s">%s</subfield>' % (code,escape(text))
+
+# A MARC XML file of catalogue records where most are in English (and so are converted)
+def writeMarcFile(filename,recordCount,seed=0):
+	r = random.Random(seed)
+	englishCount = 0
+	with open(filename,'w',encoding='utf-8') as f:
+		f.write('<?xml version="1.0" encoding="UTF-8"?>\n<collection xmlns="http://www.loc.gov/MARC21/slim">\n')
+		for i in range(recordCount):
+			language = 'eng' if r.random() < 0.8 else r.choice(['fre','ger','spa'])
+			if language == 'eng':
+				englishCount += 1
+			f.write('<record><leader>00000nam a2200000 a 4500</leader>')
+			f.write('<controlfield tag="001">rec%d</controlfield>' % (seed*10000000+i))
+			f.write('<controlfield tag="008">%02d0101s%d    xx            000 0 %s d</controlfield>' % (r.randint(50,99),r.randint(1950,2020),language))
+			f.write('<datafield tag="100" ind1="1" ind2=" ">%s</datafield>' % marcSubfield('a','Author%d, Jane' % i))
+			f.write('<datafield tag="245" ind1="1" ind2="0">%s%s</datafield>' % (marcSubfield('a',randomWords(r,r.randint(4,12)) + ' :'),marcSubfield('b',randomWords(r,4))))
+			if r.random() < 0.7:
+				f.write('<datafield tag="520" ind1=" " ind2=" ">%s</datafield>' % marcSubfield('a',randomWords(r,r.randint(30,150))))
+			for _ in range(r.randint(0,3)):
+				f.write('<datafield tag="650" ind1=" " ind2="0">%s</datafield>' % marcSubfield('a',randomWords(r,2)))
+			f.write('</record>\n')
+		f.write('</collection>\n')
+	return englishCount
+
+# UIMA XMI files (from DKPro Core) with one document each
+def writeUimaXMIFiles(directory,fileCount,seed=0):
+	r = random.Random(seed)
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+
+	filenames = []
+	for i in range(fileCount):
+		filename = os.path.join(directory,'doc%d.xmi' % (seed*10000000+i))
+		content = '\n\n'.join( randomWords(r,r.randint(20,120)) for _ in range(r.randint(5,30)) )
+		with open(filename,'w',encoding='utf-8') as f:
+			f.write('<?xml version="1.0" encoding="UTF-8"?>')
+			f.write('<xmi:XMI xmlns:xmi="http://www.omg.org/XMI" xmlns:cas="http:///uima/cas.ecore" xmlns:type="http:///de/tudarmstadt/ukp/dkpro/core/api/metadata/type.ecore" xmi:version="2.0">')
+			f.write('<cas:NULL xmi:id="0"/>')
+			f.write('<type:DocumentMetaData xmi:id="1" sofa="2" begin="0" end="%d" language="en" documentTitle=%s documentId="%d"/>' % (len(content),quoteattr(randomWords(r,6)),i))
+			f.write('<cas:Sofa xmi:id="2" sofaNum="1" sofaID="_InitialView" mimeType="text" sofaString=%s/>' % quoteattr(content,{'\n':'&#10;'}))
+			f.write('<cas:View sofa="2" members="1"/></xmi:XMI>')
+		filenames.append(filename)
+	return filenames,fileCount
+
+# A BioC file with documents like those converted from Pubmed (a title and a few abstract passages each)
+def writeBiocFile(filename,documentCount,seed=0):
+	r = random.Random(seed)
+	with BiocWriter(filename) as writer:
+		for i in range(documentCount):
+			biocDoc = LeanBiocDocument()
+			biocDoc.id = str(seed*10000000+i+1)
+			for key in ['title','pmid','year','month','day','journal','journalISO','authors','chemicals','meshHeadings']:
+				biocDoc.infons[key] = biocDoc.id if key == 'pmid' else randomWords(r,3)
+			offset = 0
+			for section in ['title'] + ['abstract']*r.randint(0,4):
+				passage = LeanBiocPassage()
+				passage.infons['section'] = section
+				passage.offset = offset
+				passage.text = randomWords(r,r.randint(8,80))
+				offset += len(passage.text)
+				biocDoc.passages.append(passage)
+			writer.writedocument(biocDoc)
+	return documentCount
+
+# The synthetic inputs for each format at a scale (1 is about 35MB of files), returned as the files and the number
+# of documents that they convert to
+def writeSyntheticCorpus(directory,scale=1.0,seed=0):
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+
+	pubmedFile = os.path.join(directory,'pubmed.xml')
+	marcFile = os.path.join(directory,'marc.xml')
+	biocFile = os.path.join(directory,'pubmed.bioc')
+
+	corpus = {}
+	corpus['pubmedxml'] = ([pubmedFile], writePubmedFile(pubmedFile,int(5000*scale),seed))
+	corpus['pmcxml'] = writePMCFiles(os.path.join(directory,'pmc'),max(1,int(200*scale)),seed)
+	corpus['marcxml'] = ([marcFile], writeMarcFile(marcFile,int(5000*scale),seed))
+	corpus['uimaxmi'] = writeUimaXMIFiles(os.path.join(directory,'xmi'),max(1,int(200*scale)),seed)
+	corpus['bioc'] = ([biocFile], writeBiocFile(biocFile,int(5000*scale),seed))
+	return corpus
+
+def main():
+	parser = argparse.ArgumentParser(description='Generate a deterministic synthetic corpus in each of the input formats')
+	parser.add_argument('--outDir',type=str,required=True,help='Directory to write the corpus to')
+	parser.add_argument('--scale',type=float,default=1.0,help='Size of the corpus (1 is about 35MB of files)')
+	parser.add_argument('--seed',type=int,default=0,help='Random seed for the corpus')
+	args = parser.parse_args()
+
+	corpus = writeSyntheticCorpus(args.outDir,args.scale,args.seed)
+	for inFormat in sorted(corpus.keys()):
+		files,documentCount = corpus[inFormat]
+		print("%s\t%d files\t%d documents" % (inFormat,len(files),documentCount))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,34 @@
+import argparse
+import time
+import pubrunner.convert
+import pubrunner.xmlbackend
+
+def timeBackend(processFunction, files, backendName):
+	start = time.time()
+	docCount = 0
+	for f in files:
+		for doc in processFunction(f, xmlBackend=backendName):
+			docCount += 1
+	return docCount, time.time() - start
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark of the Pubmed and PMC parsing with each of the available XML backends')
+	parser.add_argument('--pubmedXMLFiles',type=str,help='Comma-delimited Pubmed XML files to parse')
+	parser.add_argument('--pmcXMLFiles',type=str,help='Comma-delimited PMC XML files to parse')
+	args = parser.parse_args()
+
+	assert args.pubmedXMLFiles or args.pmcXMLFiles, "Must provide Pubmed and/or PMC XML files"
+
+	benchmarks = []
+	if args.pubmedXMLFiles:
+		benchmarks.append(('pubmedxml', pubrunner.convert.processMedlineFile, args.pubmedXMLFiles.split(',')))
+	if args.pmcXMLFiles:
+		benchmarks.append(('pmcxml', pubrunner.convert.processPMCFile, args.pmcXMLFiles.split(',')))
+
+	for inFormat, processFunction, files in benchmarks:
+		for backendName in sorted(pubrunner.xmlbackend.backends.keys()):
+			docCount, seconds = timeBackend(processFunction, files, backendName)
+			print("%s\t%s\t%d documents\t%.2f seconds\t%.1f documents/second" % (inFormat, backendName, docCount, seconds, docCount / seconds))
+
+if __name__ == '__main__':
+	main()
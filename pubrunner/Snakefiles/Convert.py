@@ -26,6 +26,9 @@ if not missingVariables == []:
 	print("  INFORMAT is the input format (e.g. pubmedxml, pmcxml, marcxml, etc)")
 	print("  OUTFORMAT is the output format for the converted data (e.g. bioc, txt)")
 	print("  PMIDCHUNKDIR is an optional argument that gives a directory containing PMIDs file listings corresponding to the CHUNKDIR")
+	print("  ZSTDDICTIONARY is an optional zstd dictionary for compressing outputs with a .zst suffix")
+	print("  WORKERS optionally sets the number of processes used to convert each chunk (1 by default)")
+	print("  PUBRUNNER_PROFILE=1 optionally saves timing and memory stats for each conversion next to its output")
 	sys.exit(1)
 
 chunkDir = os.environ.get("CHUNKDIR")
@@ -33,6 +36,8 @@ outDir = os.environ.get("OUTDIR")
 inFormat = os.environ.get("INFORMAT")
 outFormat = os.environ.get("OUTFORMAT")
 pmidChunkDir = os.environ.get("PMIDCHUNKDIR")
+zstdDictionary = os.environ.get("ZSTDDICTIONARY")
+workers = int(os.environ.get("WORKERS","1"))
 
 chunkFiles = list(os.listdir(chunkDir))
 inputFiles = [ os.path.join(chunkDir,f) for f in chunkFiles ]
@@ -53,16 +58,18 @@ if pmidChunkDir:
 			pmidChunkFile=os.path.join(pmidChunkDir,'{filename}')
 		output: 
 			os.path.join(outDir,'{filename}')
+		threads: workers
 		run: 
-			pubrunner.convertFilesFromFilelist(input.chunkFile,inFormat,output[0],outFormat,input.pmidChunkFile)
+			pubrunner.convertFilesFromFilelist(input.chunkFile,inFormat,output[0],outFormat,input.pmidChunkFile,workers=workers,zstdDictionaryFilename=zstdDictionary)
 else:
 	rule convert:
 		input: 
 			os.path.join(chunkDir,'{filename}')
 		output: 
 			os.path.join(outDir,'{filename}')
+		threads: workers
 		run: 
-			pubrunner.convertFilesFromFilelist(input[0],inFormat,output[0],outFormat)
+			pubrunner.convertFilesFromFilelist(input[0],inFormat,output[0],outFormat,workers=workers,zstdDictionaryFilename=zstdDictionary)
 
 #for inputFile,outputFile in zip(inputFiles,outputFiles):
 #	rule:
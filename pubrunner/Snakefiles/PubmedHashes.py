@@ -39,15 +39,23 @@ if not missingVariables == []:
 	print()
 	print("  INDIR is the input directory of the Pubmed resource")
 	print("  OUTDIR is the output directory for the hash data")
+	print("  CACHEDOCUMENTS=1 optionally caches the extracted documents next to each Pubmed file for the conversion to use")
+	print("  DIGEST optionally sets the digest algorithm for the hashes (md5 by default, blake2b or xxhash)")
+	print("  HASHMODE=fingerprint optionally hashes the raw XML of each citation instead of its extracted fields (which is quicker)")
+	print("  WORKERS optionally sets the number of processes used to hash each group of files (1 by default)")
 	sys.exit(1)
 
 inDir = os.environ.get("INDIR")
 outDir = os.environ.get("OUTDIR")
+cacheDocuments = os.environ.get("CACHEDOCUMENTS") == "1"
+digestAlgorithm = os.environ.get("DIGEST","md5")
+workers = int(os.environ.get("WORKERS","1"))
+hashMode = os.environ.get("HASHMODE","fields")
 chunkSize = 5
 
 inAndOut = []
 for f in findFiles(inDir):
-	if f.endswith('.xml'):
+	if f.endswith('.xml') or f.endswith('.xml.gz'):
 		outFile = f.replace(inDir,outDir) + '.hashes'
 		if not os.path.isdir(os.path.dirname(outFile)):
 			os.makedirs(os.path.dirname(outFile))
@@ -64,7 +72,7 @@ for chunk in chunks(inAndOut,chunkSize):
 	rule:
 		input: [ inFile for inFile,outFile in chunk ]
 		output: [ outFile for inFile,outFile in chunk ]
+		threads: workers
 		run:
-			for inFile,outFile in zip(input,output):
-				pubrunner.pubmed_hash(inFile,outFile)
+			pubrunner.hashPubmedFiles(list(input),list(output),cacheDocuments,digestAlgorithm=digestAlgorithm,workers=workers,hashMode=hashMode)
 
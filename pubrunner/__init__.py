@@ -3,7 +3,7 @@ from pubrunner.upload import pushToFTP, pushToLocalDirectory, pushToZenodo
 from pubrunner.getresource import getResource,calcSHA256,download,getResourceInfo
 from pubrunner.pubrun import pubrun,cleanWorkingDirectory
 from pubrunner.convert import convertFiles,convertFilesFromFilelist,processMedlineFile
-from pubrunner.pubmed_hash import pubmed_hash
+from pubrunner.pubmed_hash import pubmed_hash,hashPubmedFiles
 from pubrunner.gather_pmids import gatherPMIDs
 from pubrunner.snakemake import launchSnakemake
 from pubrunner.globalsettings import loadYAML,getGlobalSettings
@@ -0,0 +1,147 @@
+import os
+import io
+import re
+import json
+import mmap
+
+# Finds the next start tag for an element in a buffer (e.g. an mmap of the file) from a position
+def findStartTag(buf,tag,pos):
+	openTag = ('<%s' % tag).encode('utf8')
+	while True:
+		start = buf.find(openTag, pos)
+		if start == -1:
+			return -1
+
+		# Skip any other tags that start the same way (e.g. PubmedArticleSet)
+		nextByte = buf[start+len(openTag):start+len(openTag)+1]
+		if nextByte in [b'>',b' ',b'\t',b'\r',b'\n']:
+			return start
+		pos = start + len(openTag)
+
+# Finds the byte offsets of the start and end of every element with a tag (e.g. PubmedArticle) in an XML file.
+# This is a plain search for the tags (rather than parsing the XML) which works for elements that can't be
+# nested or appear inside comments or CDATA, e.g. PubmedArticle in the Pubmed XML files
+def scanArticleOffsets(filename,tag):
+	closeTag = ('</%s>' % tag).encode('utf8')
+
+	offsets = []
+	if os.path.getsize(filename) == 0:
+		return offsets
+
+	with open(filename,'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+		pos = 0
+		while True:
+			start = findStartTag(mm,tag,pos)
+			if start == -1:
+				break
+
+			end = mm.find(closeTag, start)
+			if end == -1:
+				raise RuntimeError("Couldn't find end of <%s> element starting at byte %d in %s" % (tag,start,filename))
+			end += len(closeTag)
+
+			offsets.append((start,end))
+			pos = end
+
+	return offsets
+
+# The offsets are cached in a hidden file next to the XML file, e.g. .pubmed18n0001.xml.offsets
+def getOffsetsCacheFilename(filename):
+	return os.path.join(os.path.dirname(filename), '.' + os.path.basename(filename) + '.offsets')
+
+# Loads the offsets from the cache if it matches the size and modification time of the file,
+# otherwise scans the file and tries to update the cache
+def loadArticleOffsets(filename,tag):
+	cacheFilename = getOffsetsCacheFilename(filename)
+	size,mtime = os.path.getsize(filename),os.path.getmtime(filename)
+
+	if os.path.isfile(cacheFilename):
+		try:
+			with open(cacheFilename) as f:
+				cache = json.load(f)
+			if cache['size'] == size and cache['mtime'] == mtime and cache['tag'] == tag:
+				return list(zip(cache['starts'],cache['ends']))
+		except (ValueError,KeyError):
+			pass
+
+	offsets = scanArticleOffsets(filename,tag)
+
+	cache = {'size':size, 'mtime':mtime, 'tag':tag, 'starts':[ s for s,e in offsets ], 'ends':[ e for s,e in offsets ]}
+	try:
+		with open(cacheFilename,'w') as f:
+			json.dump(cache,f)
+	except OSError:
+		# The resource directory may not be writeable so just don't cache
+		pass
+
+	return offsets
+
+# Splits the elements of a file into (at most) rangeCount contiguous byte ranges with a similar number of elements each
+def splitIntoByteRanges(filename,tag,rangeCount):
+	offsets = loadArticleOffsets(filename,tag)
+	if len(offsets) == 0:
+		return []
+
+	rangeSize = (len(offsets) + rangeCount - 1) // rangeCount
+	byteRanges = []
+	for i in range(0, len(offsets), rangeSize):
+		group = offsets[i:i+rangeSize]
+		byteRanges.append((group[0][0],group[-1][1]))
+	return byteRanges
+
+# The prolog of an XML file (an optional byte order mark, the XML declaration, comments, processing instructions and
+# DOCTYPE, including any internal subset) followed by the start tag of the root element
+prologRegex = re.compile(rb'''(?:\xef\xbb\xbf)?(?:\s|<\?.*?\?>|<!--.*?-->|<!DOCTYPE(?:[^\[>"']|"[^"]*"|'[^']*'|\[.*?\])*>)*<([A-Za-z_][\w.:-]*)(?:\s+[^\s=>/]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*>''', re.S)
+
+# Creates a stand-alone XML document containing a byte range of a file. The prolog of the file up to the end of the
+# root start tag is kept at the start and the root element is closed after it. Anything else between the root start
+# tag and the byte range (e.g. a PubmedBookArticle before the first PubmedArticle) is left out
+def readByteRange(filename,byteRange,tag):
+	start,end = byteRange
+	with open(filename,'rb') as f:
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			rootMatch = prologRegex.match(mm)
+			assert rootMatch and rootMatch.end() <= start, "Couldn't find the root element before the <%s> elements in %s" % (tag,filename)
+			header = mm[:rootMatch.end()]
+			rootTag = rootMatch.group(1)
+			body = mm[start:end]
+
+	footer = b'</' + rootTag + b'>\n'
+
+	return io.BytesIO(header + body + footer)
+
+# Yields the bytes of every element with a tag (from its start tag to its end tag) from a stream, reading it in chunks
+# so that it works for compressed streams too. As with scanArticleOffsets, this is a plain search for the tags
+def iterElementBytes(stream,tag,chunkSize=1024*1024):
+	openTag = ('<%s' % tag).encode('utf8')
+	closeTag = ('</%s>' % tag).encode('utf8')
+
+	buf = b''
+	pos = 0
+	start = -1
+	while True:
+		chunk = stream.read(chunkSize)
+		buf = buf[pos:] + chunk
+		pos = 0
+
+		while True:
+			start = findStartTag(buf,tag,pos)
+			if start == -1:
+				# Keep enough of the end to find a start tag that is split across chunks
+				pos = max(pos,len(buf)-len(openTag))
+				break
+
+			end = buf.find(closeTag,start)
+			if end == -1:
+				pos = start
+				break
+			end += len(closeTag)
+
+			yield buf[start:end]
+			pos = end
+
+		if not chunk:
+			break
+
+	if start != -1:
+		raise RuntimeError("Couldn't find end of <%s> element at the end of the stream" % tag)
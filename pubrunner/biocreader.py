@@ -0,0 +1,102 @@
+from pubrunner.xmlbackend import getXMLBackend,ParseErrors
+from pubrunner.inputfiles import openInputFile
+import pubrunner.profiling as profiling
+
+# Lighter versions of bioc.BioCDocument and bioc.BioCPassage with only the fields that the converters
+# fill in and the lean reader reads (with the same defaults). They have no annotations, relations or
+# sentences so none of those lists are created for every document and passage
+class LeanBiocPassage:
+	__slots__ = ['offset','infons','text']
+
+	def __init__(self):
+		self.offset = -1
+		self.infons = {}
+		self.text = ''
+
+class LeanBiocDocument:
+	__slots__ = ['id','infons','passages']
+
+	def __init__(self):
+		self.id = ''
+		self.infons = {}
+		self.passages = []
+
+# The fields to read from each BioC document. documentInfons and passageInfons are lists of the infon keys
+# to keep (or None to keep all of them). Passages can be left out entirely or limited to those with a
+# section infon in sections. The document ID is always read as it is needed for filtering
+class BiocFields:
+	def __init__(self,documentInfons=None,passages=True,passageInfons=None,passageText=True,sections=None):
+		self.documentInfons = None if documentInfons is None else set(documentInfons)
+		self.passages = passages
+		self.passageInfons = None if passageInfons is None else set(passageInfons)
+		self.passageText = passageText
+		self.sections = None if sections is None else set(sections)
+
+allBiocFields = BiocFields()
+
+def readInfons(backend,elem,keys,infons):
+	for infonElem in backend.findall(elem,'infon'):
+		key = infonElem.get('key')
+		if keys is None or key in keys:
+			infons[key] = infonElem.text
+
+def readLeanBiocPassage(backend,passageElem,fields):
+	passage = LeanBiocPassage()
+	if fields.sections is not None:
+		sectionElems = [ e for e in backend.findall(passageElem,'infon') if e.get('key') == 'section' ]
+		if not (sectionElems and sectionElems[-1].text in fields.sections):
+			return None
+
+	offsetElem = backend.find(passageElem,'offset')
+	if offsetElem is not None:
+		passage.offset = int(offsetElem.text)
+	if fields.passageText:
+		textElem = backend.find(passageElem,'text')
+		if textElem is not None:
+			passage.text = textElem.text
+	if fields.passageInfons is None or fields.passageInfons:
+		readInfons(backend,passageElem,fields.passageInfons,passage.infons)
+
+	return passage
+
+# Reads a document element into a LeanBiocDocument with just the requested fields, or returns None if the
+# document isn't in the ID filter. Only the direct children are looked at (as bioc.iterparse does) and any
+# fields that aren't requested are skipped without looking at their elements
+def readLeanBiocDocument(backend,documentElem,fields,idFilter):
+	biocDoc = LeanBiocDocument()
+	idElem = backend.find(documentElem,'id')
+	if idElem is not None:
+		biocDoc.id = idElem.text
+
+	# Documents without an ID element can't be in the filter
+	if idFilter is not None and not biocDoc.id in idFilter:
+		return None
+
+	if fields.documentInfons is None or fields.documentInfons:
+		readInfons(backend,documentElem,fields.documentInfons,biocDoc.infons)
+
+	if fields.passages:
+		for passageElem in backend.findall(documentElem,'passage'):
+			passage = readLeanBiocPassage(backend,passageElem,fields)
+			if passage is not None:
+				biocDoc.passages.append(passage)
+
+	return biocDoc
+
+# Streams the documents from a BioC XML file (which may be gzipped) without building the full BioC objects
+# that bioc.iterparse creates. Only the fields requested are kept (everything but annotations, relations
+# and sentences by default) and any documents not in the ID filter are skipped
+def iterparseLeanBiocDocuments(biocFilename,fields=None,idFilter=None,xmlBackend=None):
+	if fields is None:
+		fields = allBiocFields
+
+	backend = getXMLBackend(xmlBackend)
+	try:
+		with openInputFile(biocFilename) as f:
+			for documentElem in profiling.timeIterator('parse', backend.iterparse(f,'document')):
+				with profiling.stage('extract'):
+					biocDoc = readLeanBiocDocument(backend,documentElem,fields,idFilter)
+				if biocDoc is not None:
+					yield biocDoc
+	except ParseErrors:
+		raise RuntimeError("Parsing error in BioC file: %s" % biocFilename)
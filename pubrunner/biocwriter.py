@@ -0,0 +1,204 @@
+import os
+import re
+import time
+import mmap
+from pubrunner.articleoffsets import findStartTag
+from pubrunner.compression import getCompression,openOutputFile
+import pubrunner.profiling as profiling
+
+# Writes BioC XML directly as text instead of building an lxml tree for every document as bioc.iterwrite does.
+# The output is byte-for-byte the same as bioc.iterwrite (for a default collection): the same declaration, the
+# same escaping as libxml2, one document per line and the same elements for the optional fields
+
+xmlDeclaration = "<?xml version='1.0' encoding='utf-8' standalone='yes'?>\n"
+
+# Characters that aren't allowed in XML 1.0. lxml refuses to write them so the same error is raised here
+invalidXMLCharRegex = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+# Most text doesn't need escaping so it is checked for first
+textToEscapeRegex = re.compile(r'[&<>\r]')
+def escapeText(text):
+	if textToEscapeRegex.search(text) is None:
+		return text
+	return text.replace('&','&amp;').replace('<','&lt;').replace('>','&gt;').replace('\r','&#13;')
+
+def escapeAttribute(value):
+	value = value.replace('&','&amp;').replace('<','&lt;').replace('>','&gt;').replace('"','&quot;')
+	if '\n' in value or '\t' in value or '\r' in value:
+		value = value.replace('\n','&#10;').replace('\t','&#9;').replace('\r','&#13;')
+	return value
+
+# An element with just text (which is an empty element if the text is None)
+def encodeTextElement(out,tag,text):
+	if text is None:
+		out.append('<%s/>' % tag)
+	else:
+		out.append('<%s>%s</%s>' % (tag,escapeText(text),tag))
+
+# The same few infon keys are used for every document so their start tags are cached
+infonStartTags = {}
+def encodeInfons(out,infons):
+	for k,v in infons.items():
+		startTag = infonStartTags.get(k)
+		if startTag is None:
+			startTag = '<infon key="%s">' % escapeAttribute(str(k))
+			infonStartTags[k] = startTag
+		out.append(startTag + escapeText(str(v)) + '</infon>')
+
+def encodeAnnotation(out,annotation):
+	out.append('<annotation id="%s">' % escapeAttribute(annotation.id))
+	encodeInfons(out,annotation.infons)
+	for location in annotation.locations:
+		out.append('<location offset="%d" length="%d"/>' % (location.offset,location.length))
+	encodeTextElement(out,'text',annotation.text)
+	out.append('</annotation>')
+
+def encodeRelation(out,relation):
+	out.append('<relation id="%s">' % escapeAttribute(relation.id))
+	encodeInfons(out,relation.infons)
+	for node in relation.nodes:
+		out.append('<node refid="%s" role="%s"/>' % (escapeAttribute(node.refid),escapeAttribute(node.role)))
+	out.append('</relation>')
+
+# Documents from the converters don't have annotations, relations or sentences (see LeanBiocDocument)
+# but full bioc.BioCDocument objects (e.g. read from BioC files) do
+def encodeAnnotationsAndRelations(out,elem):
+	for annotation in getattr(elem,'annotations',()):
+		encodeAnnotation(out,annotation)
+	for relation in getattr(elem,'relations',()):
+		encodeRelation(out,relation)
+
+def encodeSentence(out,sentence):
+	out.append('<sentence>')
+	encodeInfons(out,sentence.infons)
+	out.append('<offset>%d</offset>' % sentence.offset)
+	if sentence.text:
+		encodeTextElement(out,'text',sentence.text)
+	encodeAnnotationsAndRelations(out,sentence)
+	out.append('</sentence>')
+
+def encodePassage(out,passage):
+	out.append('<passage><offset>%d</offset>' % passage.offset)
+	if passage.text:
+		encodeTextElement(out,'text',passage.text)
+	encodeInfons(out,passage.infons)
+	for sentence in getattr(passage,'sentences',()):
+		encodeSentence(out,sentence)
+	encodeAnnotationsAndRelations(out,passage)
+	out.append('</passage>')
+
+def encodeDocument(document):
+	out = ['<document>']
+	encodeTextElement(out,'id',document.id)
+	encodeInfons(out,document.infons)
+	for passage in document.passages:
+		encodePassage(out,passage)
+	encodeAnnotationsAndRelations(out,document)
+	out.append('</document>\n')
+
+	encoded = "".join(out)
+	if invalidXMLCharRegex.search(encoded):
+		raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+	return encoded
+
+collectionEndRegex = re.compile(rb'\s*</collection>\s*\Z')
+
+# Finds the bytes of a BioC file from the start of the first document to the end of the last one (or None if there
+# are no documents). Only the collection header before and the closing tag after are checked, not the documents
+def findBiocDocumentsByteRange(biocFilename):
+	if os.path.getsize(biocFilename) == 0:
+		raise RuntimeError("Empty BioC file: %s" % biocFilename)
+
+	with open(biocFilename,'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+		start = findStartTag(mm,'document',0)
+		if start == -1:
+			return None
+		if mm.find(b'<collection', 0, start) == -1:
+			raise RuntimeError("Couldn't find the collection element in BioC file: %s" % biocFilename)
+
+		end = mm.rfind(b'</document>')
+		assert end != -1, "Couldn't find the end of the last document in BioC file: %s" % biocFilename
+		end += len(b'</document>')
+		if not collectionEndRegex.match(mm[end:]):
+			raise RuntimeError("Unexpected content after the last document in BioC file: %s" % biocFilename)
+
+	return start,end
+
+copyBufferSize = 1024*1024
+
+# Copies a byte range of one file to the end of another, using sendfile where possible so the data stays in the kernel
+def copyByteRange(inFile,outFile,start,end,useSendfile=True):
+	if useSendfile and hasattr(os,'sendfile'):
+		try:
+			while start < end:
+				sent = os.sendfile(outFile.fileno(), inFile.fileno(), start, end-start)
+				if sent == 0:
+					break
+				start += sent
+		except OSError:
+			# Not supported for these files (e.g. on some filesystems) so fall back to reading
+			pass
+
+	# A raw (unbuffered) file can write less than it is given, so this carries on until all of each chunk is written
+	inFile.seek(start)
+	while start < end:
+		chunk = memoryview(inFile.read(min(copyBufferSize,end-start)))
+		if not chunk:
+			raise RuntimeError("Unexpected end of file while copying %s" % inFile.name)
+		start += len(chunk)
+		while chunk:
+			written = outFile.write(chunk)
+			chunk = chunk[written:]
+
+# The start of a BioC file (up to the first document) for a default collection dated today
+def encodeCollectionHeader():
+	header = [xmlDeclaration, '<collection>']
+	encodeTextElement(header,'source','')
+	header.append('\n')
+	encodeTextElement(header,'date',time.strftime("%Y-%m-%d"))
+	header.append('\n')
+	encodeTextElement(header,'key','')
+	header.append('\n')
+	return "".join(header)
+
+collectionFooter = '</collection>'
+
+# A drop-in replacement for the writer from bioc.iterwrite that streams the documents into a buffered file
+# (which is compressed if the filename ends with .gz or .zst)
+class BiocWriter:
+	def __init__(self,biocFilename,zstdDictionaryFilename=None):
+		self.compressed = getCompression(biocFilename) is not None
+		self.outFile = openOutputFile(biocFilename,zstdDictionaryFilename)
+		self.outFile.write(encodeCollectionHeader().encode('utf-8'))
+
+	def writedocument(self,document):
+		with profiling.stage('encode'):
+			data = encodeDocument(document).encode('utf-8')
+		self.outFile.write(data)
+
+	# Copies all the documents of an uncompressed BioC file straight into the output without parsing them. The
+	# collection information of the input is dropped and the documents are kept exactly as they are in the file
+	def copydocuments(self,biocFilename):
+		byteRange = findBiocDocumentsByteRange(biocFilename)
+		if byteRange is None:
+			return
+
+		start,end = byteRange
+		profiling.addCount('copiedBytes',end-start)
+		with open(biocFilename,'rb') as inFile:
+			if self.compressed:
+				copyByteRange(inFile,self.outFile,start,end,useSendfile=False)
+			else:
+				self.outFile.flush()
+				copyByteRange(inFile,self.outFile.raw,start,end)
+		self.outFile.write(b'\n')
+
+	def close(self):
+		self.outFile.write(collectionFooter.encode('utf-8'))
+		self.outFile.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
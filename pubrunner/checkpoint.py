@@ -0,0 +1,102 @@
+import os
+import json
+import tempfile
+from pubrunner.compression import openOutputFile
+
+# A long conversion writes to a hidden partial file next to the output and regularly saves a checkpoint of how far it
+# has got. If it is killed, a rerun with the same settings cuts the partial file back to the last checkpoint and
+# continues from there. The partial file is only renamed to the output once it is complete. The partial filename
+# keeps the suffix of the output so that it is compressed the same way (e.g. .partial.PUBMED.00000001.bioc.gz)
+def getPartialFilename(outFile):
+	return os.path.join(os.path.dirname(outFile), '.partial.' + os.path.basename(outFile))
+
+def getCheckpointFilename(outFile):
+	return os.path.join(os.path.dirname(outFile), '.' + os.path.basename(outFile) + '.checkpoint')
+
+# Settings are compared after a round trip through JSON (so that tuples match the lists they are saved as)
+def normalizeSettings(settings):
+	return json.loads(json.dumps(settings))
+
+# Loads the checkpoint for an output file if there is one for the same settings with its partial file
+def loadCheckpoint(outFile,settings):
+	checkpointFilename = getCheckpointFilename(outFile)
+	partialFilename = getPartialFilename(outFile)
+	if not os.path.isfile(checkpointFilename) or not os.path.isfile(partialFilename):
+		return None
+
+	try:
+		with open(checkpointFilename) as f:
+			checkpoint = json.load(f)
+	except ValueError:
+		return None
+
+	if checkpoint.get('settings') != normalizeSettings(settings):
+		return None
+	if os.path.getsize(partialFilename) < checkpoint['offset']:
+		return None
+
+	return checkpoint
+
+# The checkpoint is written to a temporary file and renamed so that a checkpoint is never half written
+def saveCheckpoint(outFile,settings,taskIndex,documentIndex,documentCount,offset):
+	checkpoint = {'settings':normalizeSettings(settings), 'taskIndex':taskIndex, 'documentIndex':documentIndex, 'documentCount':documentCount, 'offset':offset}
+
+	checkpointFilename = getCheckpointFilename(outFile)
+	tempHandle,tempFilename = tempfile.mkstemp(prefix='.checkpoint.',dir=os.path.dirname(checkpointFilename) or '.')
+	with os.fdopen(tempHandle,'w') as f:
+		json.dump(checkpoint,f)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tempFilename,checkpointFilename)
+
+def removeCheckpoint(outFile):
+	checkpointFilename = getCheckpointFilename(outFile)
+	if os.path.isfile(checkpointFilename):
+		os.remove(checkpointFilename)
+
+def syncFile(filename):
+	with open(filename,'rb') as f:
+		os.fsync(f.fileno())
+
+# An output file that is written through a partial file which can be synced to disk at a checkpoint and later continued
+# from it. openDocumentWriter is given the (binary) output stream and returns a function to write a document to it
+class ResumableOutput:
+	def __init__(self,outFile,header,footer,openDocumentWriter,zstdDictionaryFilename=None,offset=None):
+		self.outFile = outFile
+		self.partialFilename = getPartialFilename(outFile)
+		self.footer = footer
+		self.openDocumentWriter = openDocumentWriter
+		self.zstdDictionaryFilename = zstdDictionaryFilename
+
+		if offset is None:
+			self.open(append=False)
+			self.stream.write(header)
+		else:
+			# Drop anything written after the checkpoint
+			with open(self.partialFilename,'r+b') as f:
+				f.truncate(offset)
+			self.open(append=True)
+
+	def open(self,append):
+		self.stream = openOutputFile(self.partialFilename,self.zstdDictionaryFilename,append=append)
+		self.writeDocument = self.openDocumentWriter(self.stream)
+
+	# Closes the output (which ends the gzip member or zstd frame of a compressed file so that it can be appended
+	# to later) and syncs it to disk. Returns the size of the partial file to be saved in the checkpoint
+	def sync(self):
+		self.stream.close()
+		syncFile(self.partialFilename)
+		offset = os.path.getsize(self.partialFilename)
+		self.open(append=True)
+		return offset
+
+	# Closes the partial file without finishing it (e.g. if the conversion fails). Anything written since the last
+	# checkpoint is dropped when it is resumed
+	def close(self):
+		self.stream.close()
+
+	def finish(self):
+		self.stream.write(self.footer)
+		self.stream.close()
+		syncFile(self.partialFilename)
+		os.replace(self.partialFilename,self.outFile)
@@ -25,6 +25,7 @@ def main():
 	parser.add_argument('--outputdir',type=str,required=False,help='Where to store the results of the run (instead of the default location defined by ~/.pubrunner.settings.yml)')
 	parser.add_argument('--nogetresource',action='store_true',help='Do not fetch resources before executing a project. Will fail if old versions of resources do not already exists.')
 	parser.add_argument('--test',action='store_true',help='Run the test functionality instead of the full run')
+	parser.add_argument('--profile',action='store_true',help='Save timing and memory stats for each conversion to a hidden JSON file next to its output (the same as setting PUBRUNNER_PROFILE=1)')
 	parser.add_argument('--getresource',required=False,type=str,help='Fetch a specific resource (instead of doing a normal PubRunner run). This is really only needed for debugging and understanding resources.')
 
 	args = parser.parse_args()
@@ -35,6 +36,10 @@ def main():
 	if args.defaultsettings:
 		globalSettings = pubrunner.getGlobalSettings(useDefault=True)
 
+	# The conversions run in Snakemake jobs so this is passed on to them through the environment
+	if args.profile:
+		os.environ['PUBRUNNER_PROFILE'] = '1'
+
 	if args.forceresource_dir:
 		args.forceresource_dir = os.path.abspath(args.forceresource_dir)
 	if args.outputdir:
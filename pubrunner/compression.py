@@ -0,0 +1,139 @@
+import io
+import os
+import gzip
+import argparse
+import tempfile
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# The compression of a file is chosen by its suffix
+compressionSuffixes = {'.gz':'gzip', '.zst':'zstd'}
+
+# gzip's own default level (rather than Python's 9) and a zstd level that still compresses faster than gzip
+gzipCompressionLevel = 6
+zstdCompressionLevel = 10
+
+# Default size of a trained dictionary (the same as the zstd command line tool)
+zstdDictionarySize = 112640
+
+zstdMaxFrameHeaderSize = 18
+
+def getCompression(filename):
+	for suffix,compression in compressionSuffixes.items():
+		if filename.endswith(suffix):
+			return compression
+	return None
+
+def requireZstandard():
+	if zstandard is None:
+		raise RuntimeError("The zstandard package is required for zstd compressed files. Install it with: pip install zstandard")
+
+# A dictionary is stored next to the files compressed with it, named by the dictionary ID that zstd records in each
+# frame (e.g. .zstd.1234567.dict), so that the files can be read without knowing which dictionary was used
+def getZstdDictionaryFilename(filename,dictID):
+	return os.path.join(os.path.dirname(filename), '.zstd.%d.dict' % dictID)
+
+def loadZstdDictionary(dictionaryFilename):
+	requireZstandard()
+	with open(dictionaryFilename,'rb') as f:
+		return zstandard.ZstdCompressionDict(f.read())
+
+# Copies the dictionary next to the compressed file if it isn't already there. It is written to a temporary file
+# first as other conversions may be writing the same dictionary into the directory at the same time
+def storeZstdDictionary(dictionary,filename):
+	dictionaryFilename = getZstdDictionaryFilename(filename,dictionary.dict_id())
+	if os.path.isfile(dictionaryFilename):
+		return
+
+	tempHandle,tempFilename = tempfile.mkstemp(prefix='.zstd.',dir=os.path.dirname(dictionaryFilename) or '.')
+	with os.fdopen(tempHandle,'wb') as f:
+		f.write(dictionary.as_bytes())
+	os.replace(tempFilename,dictionaryFilename)
+
+# Opens a file to write bytes to, compressing them if the filename ends with .gz or .zst. A zstd dictionary
+# (trained with trainZstdDictionary) can be used for better compression of zstd files. When appending to a
+# compressed file, a new gzip member or zstd frame is started (which are read as one stream)
+def openOutputFile(filename,zstdDictionaryFilename=None,append=False):
+	mode = 'ab' if append else 'wb'
+	compression = getCompression(filename)
+	if zstdDictionaryFilename and compression != 'zstd':
+		raise RuntimeError("A zstd dictionary can only be used for zstd compressed output (with a .zst suffix): %s" % filename)
+
+	if compression == 'gzip':
+		return gzip.open(filename,mode,compresslevel=gzipCompressionLevel)
+	elif compression == 'zstd':
+		requireZstandard()
+		dictionary = None
+		if zstdDictionaryFilename:
+			dictionary = loadZstdDictionary(zstdDictionaryFilename)
+			storeZstdDictionary(dictionary,filename)
+		compressor = zstandard.ZstdCompressor(level=zstdCompressionLevel,dict_data=dictionary)
+		return compressor.stream_writer(open(filename,mode))
+	else:
+		return open(filename,mode)
+
+def openOutputTextFile(filename,zstdDictionaryFilename=None):
+	return io.TextIOWrapper(openOutputFile(filename,zstdDictionaryFilename),encoding='utf-8',newline='')
+
+# Opens a file to read bytes from, decompressing it if it is gzip or zstd compressed. The dictionary for a zstd
+# file compressed with one is found from the dictionary ID in the frame header
+def openInputFile(filename):
+	compression = getCompression(filename)
+	if compression == 'gzip':
+		return gzip.open(filename,'rb')
+	elif compression == 'zstd':
+		requireZstandard()
+		f = open(filename,'rb')
+		header = f.read(zstdMaxFrameHeaderSize)
+		f.seek(0)
+
+		dictionary = None
+		dictID = zstandard.get_frame_parameters(header).dict_id if header else 0
+		if dictID != 0:
+			dictionaryFilename = getZstdDictionaryFilename(filename,dictID)
+			if not os.path.isfile(dictionaryFilename):
+				f.close()
+				raise RuntimeError("%s was compressed with a zstd dictionary that couldn't be found. Expected it at %s" % (filename,dictionaryFilename))
+			dictionary = loadZstdDictionary(dictionaryFilename)
+
+		return zstandard.ZstdDecompressor(dict_data=dictionary).stream_reader(f,read_across_frames=True)
+	else:
+		return open(filename,'rb')
+
+# Trains a zstd dictionary on the lines (e.g. one BioC document per line) of a sample of converted files
+def trainZstdDictionary(sampleFilenames,dictionaryFilename,dictionarySize=zstdDictionarySize,maxSampleBytes=100*1024*1024):
+	requireZstandard()
+	samples,sampleBytes = [],0
+	for sampleFilename in sampleFilenames:
+		with openInputFile(sampleFilename) as f:
+			for line in io.BufferedReader(f):
+				samples.append(line)
+				sampleBytes += len(line)
+				if sampleBytes >= maxSampleBytes:
+					break
+		if sampleBytes >= maxSampleBytes:
+			break
+
+	if len(samples) == 0:
+		raise RuntimeError("No samples found to train a zstd dictionary")
+
+	dictionary = zstandard.train_dictionary(dictionarySize,samples,level=zstdCompressionLevel)
+	with open(dictionaryFilename,'wb') as f:
+		f.write(dictionary.as_bytes())
+
+	print("Trained a zstd dictionary (ID %d) on %d samples (%d bytes) and saved to %s" % (dictionary.dict_id(),len(samples),sampleBytes,dictionaryFilename))
+
+def main():
+	parser = argparse.ArgumentParser(description='Trains a zstd dictionary on a sample of converted files for compressing the conversion outputs')
+	parser.add_argument('--i',type=str,required=True,help='Comma-delimited list of sample files (e.g. converted BioC files)')
+	parser.add_argument('--o',type=str,required=True,help='Filename for the trained dictionary')
+	parser.add_argument('--dictionarySize',type=int,default=zstdDictionarySize,help='Maximum size of the dictionary in bytes')
+	args = parser.parse_args()
+
+	trainZstdDictionary(args.i.split(','),args.o,args.dictionarySize)
+
+if __name__ == '__main__':
+	main()
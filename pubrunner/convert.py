@@ -1,23 +1,41 @@
 import argparse
-import xml.etree.cElementTree as etree
-import codecs
-from six.moves.html_parser import HTMLParser
+import xml.etree.ElementTree as etree
+import html
 import re
-import tempfile
 import bioc
 import pymarc
-import shutil
+import multiprocessing
 import six
 import unicodedata
 import calendar
 import json
+import os
+import time
+import itertools
+from collections import defaultdict,deque
+import array
+import bisect
+from pubrunner.xmlbackend import getXMLBackend,ParseErrors
+from pubrunner.inputfiles import openInputFile,iterInputStreams,iterArchiveMembers,isArchive,isVirtualFile,splitVirtualFilename
+from pubrunner.articleoffsets import splitIntoByteRanges,readByteRange
+from pubrunner.biocreader import iterparseLeanBiocDocuments,BiocFields,LeanBiocDocument,LeanBiocPassage
+from pubrunner.biocwriter import BiocWriter,encodeDocument,encodeCollectionHeader,collectionFooter
+from pubrunner.compression import getCompression,openOutputTextFile
+from pubrunner.outputformats import writeDocumentsToJSONL,writeDocumentsToParquet,writeDocumentsToArrow,openJSONLDocumentWriter
+from pubrunner.documentcache import hasDocumentCache,loadCachedDocuments
+from pubrunner.checkpoint import ResumableOutput,loadCheckpoint,saveCheckpoint,removeCheckpoint
+import pubrunner.profiling as profiling
 
 # Remove empty brackets (that could happen if the contents have been removed already
 # e.g. for citation ( [3] [4] ) -> ( ) -> nothing
+# Each bracket type is removed in turn (and only if that bracket appears at all) as
+# a combined pattern would match differently for nested brackets
+emptyBracketRegexes = [ ('(', re.compile(r'\([\W\s]*\)')), ('[', re.compile(r'\[[\W\s]*\]')), ('{', re.compile(r'\{[\W\s]*\}')) ]
 def removeBracketsWithoutWords(text):
-	fixed = re.sub(r'\([\W\s]*\)', ' ', text)
-	fixed = re.sub(r'\[[\W\s]*\]', ' ', fixed)
-	fixed = re.sub(r'\{[\W\s]*\}', ' ', fixed)
+	fixed = text
+	for openBracket,regex in emptyBracketRegexes:
+		if openBracket in fixed:
+			fixed = regex.sub(' ', fixed)
 	return fixed
 
 # Some older articles have titles like "[A study of ...]."
@@ -28,103 +46,271 @@ def removeWeirdBracketsFromOldTitles(titleText):
 		titleText = titleText[1:-2] + '.'
 	return titleText
 
+# Translation table that removes "control-like" characters (unicode category C) and
+# changes separators (category Z, e.g. no-break space or left/right separator) to spaces.
+# Entries are filled in on first sight of a character and then reused for the rest of the process
+class CleanupTable(dict):
+	def __missing__(self, codepoint):
+		category = unicodedata.category(chr(codepoint))[0]
+		if category == "C":
+			replacement = None
+		elif category == "Z":
+			replacement = " "
+		else:
+			replacement = codepoint
+		self[codepoint] = replacement
+		return replacement
+
+cleanupTable = CleanupTable()
+
+# Same as above but newlines become spaces (instead of being removed) for text extracted from XML
+passageCleanupTable = CleanupTable()
+passageCleanupTable[ord('\n')] = " "
+
+# Remove commas next to periods and then repeated commas
+commasBeforePeriodRegex = re.compile(r',[\s,]*\.')
+repeatedCommasRegex = re.compile(r',[\s,]*,')
+def removeExtraCommas(text):
+	if ',' in text:
+		text = commasBeforePeriodRegex.sub('.', text)
+		text = repeatedCommasRegex.sub(',', text)
+	return text
+
 def cleanupText(text):
-	# Remove some "control-like" characters (left/right separator)
-	text = text.replace(u'\u2028',' ').replace(u'\u2029',' ')
-	text = "".join(ch for ch in text if unicodedata.category(ch)[0]!="C")
-	text = "".join(ch if unicodedata.category(ch)[0]!="Z" else " " for ch in text)
+	text = text.translate(cleanupTable)
+	return removeExtraCommas(text).strip()
 
-	# Remove repeated commands and commas next to periods
-	text = re.sub(',(\s*,)*',',',text)
-	text = re.sub('(,\s*)*\.','.',text)
-	return text.strip()
+# Equivalent to cleanupText(text.replace('\n',' '))
+def cleanupPassage(text):
+	text = text.translate(passageCleanupTable)
+	return removeExtraCommas(text).strip()
 
 # Unescape HTML special characters e.g. &gt; is changed to >
-htmlParser = HTMLParser()
 def htmlUnescape(text):
-	return htmlParser.unescape(text)
+	return html.unescape(text)
+
+# The full cleanup of text extracted from XML that is done for titles, abstracts and other passages.
+# Gives the same result as cleanupText, removeWeirdBracketsFromOldTitles (for titles), htmlUnescape and
+# removeBracketsWithoutWords run in turn, except that passages which are empty after cleanup are dropped
+def normalizeTextList(textList, isTitle=False):
+	normalized = []
+	for text in textList:
+		text = cleanupPassage(text)
+		if isTitle and len(text) > 0:
+			text = removeWeirdBracketsFromOldTitles(text)
+		if len(text) == 0:
+			continue
+		if '&' in text:
+			text = html.unescape(text)
+		normalized.append(removeBracketsWithoutWords(text))
+	return normalized
 
 # XML elements to ignore the contents of
 ignoreList = ['table', 'table-wrap', 'xref', 'disp-formula', 'inline-formula', 'ref-list', 'bio', 'ack', 'graphic', 'media', 'tex-math', 'mml:math', 'object-id', 'ext-link']
 
 # XML elements to separate text between
 separationList = ['title', 'p', 'sec', 'break', 'def-item', 'list-item', 'caption']
+
+ignoreSet = frozenset(ignoreList)
+separationSet = frozenset(separationList)
+
+# Walks the XML tree (without recursion) and yields the text blocks in document order
+# with a zero delimiter wherever text should be separated
+def iterTextFromElem(elem):
+	# The stack holds elements still to visit and tail text still to be output
+	stack = [elem]
+	while stack:
+		item = stack.pop()
+		if isinstance(item, str):
+			yield item
+			continue
+
+		tail = item.tail if item.tail else ""
+
+		# Check if the tag should be ignored (so don't use main contents)
+		if item.tag in ignoreSet:
+			yield tail.strip()
+			continue
+
+		# Add a zero delimiter if it should be separated
+		if item.tag in separationSet:
+			yield 0
+		yield item.text if item.text else ""
+
+		# The tail comes after all the children so goes on the stack first
+		stack.append(tail)
+		stack.extend(reversed(item))
+
 def extractTextFromElem(elem):
-	# Extract any raw text directly in XML element or just after
-	head = ""
-	if elem.text:
-		head = elem.text
-	tail = ""
-	if elem.tail:
-		tail = elem.tail
-	
-	# Then get the text from all child XML nodes recursively
-	childText = []
-	for child in elem:
-		childText = childText + extractTextFromElem(child)
-		
-	# Check if the tag should be ignore (so don't use main contents)
-	if elem.tag in ignoreList:
-		return [tail.strip()]
-	# Add a zero delimiter if it should be separated
-	elif elem.tag in separationList:
-		return [0] + [head] + childText + [tail]
-	# Or just use the whole text
-	else:
-		return [head] + childText + [tail]
-	
+	return list(iterTextFromElem(elem))
 
-# Merge a list of extracted text blocks and deal with the zero delimiter
+# Merge a stream of extracted text blocks and deal with the zero delimiter
 def extractTextFromElemList_merge(list):
 	textList = []
-	current = ""
+	current = []
 	# Basically merge a list of text, except separate into a new list
-	# whenever a zero appears
+	# whenever a zero appears. Joining each block once (instead of repeatedly
+	# stripping a growing string) gives the same spacing in linear time
 	for t in list:
 		if t == 0: # Zero delimiter so split
-			if len(current) > 0:
-				textList.append(current)
-				current = ""
+			if current:
+				textList.append(" ".join(current).lstrip())
+				current = []
 		else: # Just keep adding
-			current = current + " " + t
-			current = current.strip()
-	if len(current) > 0:
-		textList.append(current)
+			t = t.rstrip()
+			if t:
+				current.append(t)
+	if current:
+		textList.append(" ".join(current).lstrip())
 	return textList
+
+def iterTextFromElemList(elemList):
+	if not isinstance(elemList, list):
+		elemList = [elemList]
+	for e in elemList:
+		for t in iterTextFromElem(e):
+			yield t
+		yield 0
 	
-# Main function that extracts text from XML element or list of XML elements
-def extractTextFromElemList(elemList):
+# Extracts text from XML element(s) and merges the text blocks. This does the same as
+# extractTextFromElemList_merge(iterTextFromElemList(elemList)) but does the walk and merge in
+# one loop, as it is the main cost of converting PMC articles
+def extractRawTextFromElemList(elemList):
+	if not isinstance(elemList, list):
+		elemList = [elemList]
+
 	textList = []
-	# Extracts text and adds delimiters (so text is accidentally merged later)
-	if isinstance(elemList, list):
-		for e in elemList:
-			textList = textList + extractTextFromElem(e) + [0]
-	else:
-		textList = extractTextFromElem(elemList) + [0]
+	current = []
+	for elem in elemList:
+		stack = [elem]
+		while stack:
+			item = stack.pop()
+			if isinstance(item, str):
+				text = item
+			else:
+				tail = item.tail if item.tail else ""
+				if item.tag in ignoreSet:
+					text = tail.strip()
+				else:
+					if item.tag in separationSet and current:
+						textList.append(" ".join(current).lstrip())
+						current = []
+					text = item.text if item.text else ""
+					stack.append(tail)
+					stack.extend(reversed(item))
+
+			text = text.rstrip()
+			if text:
+				current.append(text)
+
+		# Separate the text of each element in the list
+		if current:
+			textList.append(" ".join(current).lstrip())
+			current = []
+
+	return textList
 
-	# Merge text blocks with awareness of zero delimiters
-	mergedList = extractTextFromElemList_merge(textList)
+# Main function that extracts text from XML element or list of XML elements
+def extractTextFromElemList(elemList):
+	mergedList = extractRawTextFromElemList(elemList)
 	
 	# Remove any newlines (as they can be trusted to be syntactically important)
-	mergedList = [ text.replace('\n', ' ') for text in mergedList ]
+	# and no-break spaces
+	return [ cleanupPassage(text) for text in mergedList ]
+
+# Extracts text from XML element(s) and applies the full text normalization to it
+def extractNormalizedTextFromElemList(elemList, isTitle=False):
+	textList = extractRawTextFromElemList(elemList)
+	with profiling.stage('cleanup'):
+		return normalizeTextList(textList, isTitle)
+
+# Lookup tables for month names (e.g. January or Jan) that are built once rather than for every article
+monthMapping = { m:i for i,m in enumerate(calendar.month_name) }
+monthMapping.update( { m:i for i,m in enumerate(calendar.month_abbr) } )
+monthNames = [ c for c in (list(calendar.month_name) + list(calendar.month_abbr)) if c != '' ]
+
+yearRegex = re.compile(r'(18|19|20)\d\d')
+
+# An extraction plan maps the tag of a child element to either the name of a field (and the element is
+# collected for that field) or to another plan for the children of that element. Only the branches in the
+# plan are visited so each article is walked once instead of running a path query for each field
+def collectPlanFields(elem,plan,fields=None):
+	if fields is None:
+		fields = defaultdict(list)
+	for child in elem:
+		entry = plan.get(child.tag)
+		if entry is None:
+			continue
+		elif isinstance(entry,dict):
+			collectPlanFields(child,entry,fields)
+		else:
+			fields[entry].append(child)
+	return fields
 
-	# Remove no-break spaces
-	mergedList = [ cleanupText(text) for text in mergedList ]
-	
-	return mergedList
+# Gets the first child for each tag of an element, the same as elem.find('./tag') for each of the tags
+def getFirstChildren(elem):
+	firstChildren = {}
+	for child in elem:
+		if not child.tag in firstChildren:
+			firstChildren[child.tag] = child
+	return firstChildren
+
+pubmedArticlePlan = {
+	'MedlineCitation': {
+		'Article': {
+			'Journal': {
+				'JournalIssue': { 'PubDate':'pubDate' },
+				'Title':'journalTitle',
+				'ISOAbbreviation':'journalISO'
+			},
+			'ArticleTitle':'title',
+			'Abstract': { 'AbstractText':'abstract' },
+			'AuthorList': { 'Author':'author' }
+		},
+		'ChemicalList': { 'Chemical': { 'NameOfSubstance':'chemical' } },
+		'MeshHeadingList': { 'MeshHeading':'meshHeading' }
+	},
+	'PubmedData': { 'History': { 'PubMedPubDate':'pubmedPubDate' } }
+}
+
+# The fields under front and front-stub are kept separate as they are combined in that order
+pmcArticlePlan = {
+	'front': {
+		'article-meta': {
+			'article-id':'frontArticleID',
+			'pub-date':'frontPubDate',
+			'title-group': { 'article-title':'frontTitle', 'subtitle':'frontSubtitle' },
+			'abstract':'frontAbstract'
+		},
+		'journal-meta': {
+			'journal-title':'frontJournalTitle',
+			'journal-title-group': { 'journal-title':'frontJournalTitleGroup' },
+			'journal-id':'frontJournalID'
+		}
+	},
+	'front-stub': {
+		'article-id':'stubArticleID',
+		'pub-date':'stubPubDate',
+		'title-group': { 'article-title':'stubTitle', 'subtitle':'stubSubtitle' },
+		'abstract':'stubAbstract',
+		'journal-title-group': { 'journal-title':'stubJournalTitle' },
+		'journal-id':'stubJournalID'
+	},
+	'body':'body',
+	'back':'back',
+	'floats-group':'floats',
+	'sub-article':'subArticle'
+}
 
 def getMetaInfoForPMCArticle(articleElem):
-	monthMapping = {}
-	for i,m in enumerate(calendar.month_name):
-		monthMapping[m] = i
-	for i,m in enumerate(calendar.month_abbr):
-		monthMapping[m] = i
+	return getMetaInfoFromPMCFields(collectPlanFields(articleElem,pmcArticlePlan))
 
+def getMetaInfoFromPMCFields(fields):
 	# Attempt to extract the PubMed ID, PubMed Central IDs and DOIs
 	pmidText = ''
 	pmcidText = ''
 	doiText = ''
-	article_id = articleElem.findall('./front/article-meta/article-id') + articleElem.findall('./front-stub/article-id')
+	article_id = fields['frontArticleID'] + fields['stubArticleID']
 	for a in article_id:
 		if a.text and 'pub-id-type' in a.attrib and a.attrib['pub-id-type'] == 'pmid':
 			pmidText = a.text.strip().replace('\n',' ')
@@ -134,24 +320,25 @@ def getMetaInfoForPMCArticle(articleElem):
 			doiText = a.text.strip().replace('\n',' ')
 			
 	# Attempt to get the publication date
-	pubdates = articleElem.findall('./front/article-meta/pub-date') + articleElem.findall('./front-stub/pub-date')
+	pubdates = fields['frontPubDate'] + fields['stubPubDate']
 	pubYear,pubMonth,pubDay = None,None,None
 	if len(pubdates) >= 1:
 		mostComplete,completeness = None,0
 		for pubdate in pubdates:
-			pubYear_Field = pubdate.find("./year")
+			pubdateChildren = getFirstChildren(pubdate)
+			pubYear_Field = pubdateChildren.get("year")
 			if not pubYear_Field is None:
 				pubYear = pubYear_Field.text.strip().replace('\n',' ')
-			pubSeason_Field = pubdate.find("./season")
+			pubSeason_Field = pubdateChildren.get("season")
 			if not pubSeason_Field is None:
 				pubSeason = pubSeason_Field.text.strip().replace('\n',' ')
-				monthSearch = [ c for c in (list(calendar.month_name) + list(calendar.month_abbr)) if c != '' and c in pubSeason ]
+				monthSearch = [ c for c in monthNames if c in pubSeason ]
 				if len(monthSearch) > 0:
 					pubMonth = monthMapping[monthSearch[0]]
-			pubMonth_Field = pubdate.find("./month")
+			pubMonth_Field = pubdateChildren.get("month")
 			if not pubMonth_Field is None:
 				pubMonth = pubMonth_Field.text.strip().replace('\n',' ')
-			pubDay_Field = pubdate.find("./day")
+			pubDay_Field = pubdateChildren.get("day")
 			if not pubDay_Field is None:
 				pubDay = pubDay_Field.text.strip().replace('\n',' ')
 
@@ -160,44 +347,34 @@ def getMetaInfoForPMCArticle(articleElem):
 				mostComplete = pubYear,pubMonth,pubDay
 		pubYear,pubMonth,pubDay = mostComplete
 					
-	journal = articleElem.findall('./front/journal-meta/journal-title') + articleElem.findall('./front/journal-meta/journal-title-group/journal-title') + articleElem.findall('./front-stub/journal-title-group/journal-title')
+	journal = fields['frontJournalTitle'] + fields['frontJournalTitleGroup'] + fields['stubJournalTitle']
 	assert len(journal) <= 1
 	journalText = " ".join(extractTextFromElemList(journal))
 	
 	journalISOText = ''
-	journalISO = articleElem.findall('./front/journal-meta/journal-id') + articleElem.findall('./front-stub/journal-id')
+	journalISO = fields['frontJournalID'] + fields['stubJournalID']
 	for field in journalISO:
 		if 'journal-id-type' in field.attrib and field.attrib['journal-id-type'] == "iso-abbrev":
 			journalISOText = field.text
 
 	return pmidText,pmcidText,doiText,pubYear,pubMonth,pubDay,journalText,journalISOText
 
-def getJournalDateForMedlineFile(elem,pmid):
-	yearRegex = re.compile(r'(18|19|20)\d\d')
-
-	monthMapping = {}
-	for i,m in enumerate(calendar.month_name):
-		monthMapping[m] = i
-	for i,m in enumerate(calendar.month_abbr):
-		monthMapping[m] = i
-
-	# Try to extract the publication date
-	pubDateField = elem.find('./MedlineCitation/Article/Journal/JournalIssue/PubDate')
-	medlineDateField = elem.find('./MedlineCitation/Article/Journal/JournalIssue/PubDate/MedlineDate')
-
+# Gets the journal publication date from the Journal/JournalIssue/PubDate element
+def getJournalDateForMedlineFile(pubDateField,pmid):
 	assert not pubDateField is None, "Couldn't find PubDate field for PMID=%s" % pmid
 
-	medlineDateField = pubDateField.find('./MedlineDate')
-	pubDateField_Year = pubDateField.find('./Year')
-	pubDateField_Month = pubDateField.find('./Month')
-	pubDateField_Day = pubDateField.find('./Day')
+	pubDateChildren = getFirstChildren(pubDateField)
+	medlineDateField = pubDateChildren.get('MedlineDate')
+	pubDateField_Year = pubDateChildren.get('Year')
+	pubDateField_Month = pubDateChildren.get('Month')
+	pubDateField_Day = pubDateChildren.get('Day')
 
 	pubYear,pubMonth,pubDay = None,None,None
 	if not medlineDateField is None:
 		regexSearch = re.search(yearRegex,medlineDateField.text)
 		if regexSearch:
 			pubYear = regexSearch.group()
-		monthSearch = [ c for c in (list(calendar.month_name) + list(calendar.month_abbr)) if c != '' and c in medlineDateField.text ]
+		monthSearch = [ c for c in monthNames if c in medlineDateField.text ]
 		if len(monthSearch) > 0:
 			pubMonth = monthSearch[0]
 	else:
@@ -222,15 +399,16 @@ def getJournalDateForMedlineFile(elem,pmid):
 
 	return pubYear,pubMonth,pubDay
 
-def getPubmedEntryDate(elem,pmid):
-	pubDateFields = elem.findall('./PubmedData/History/PubMedPubDate')
+# Gets the date that the citation was added to PubMed from the PubmedData/History/PubMedPubDate elements
+def getPubmedEntryDate(pubDateFields,pmid):
 	allDates = {}
 	for pubDateField in pubDateFields:
 		assert 'PubStatus' in pubDateField.attrib
 		#if 'PubStatus' in pubDateField.attrib and pubDateField.attrib['PubStatus'] == "pubmed":
-		pubDateField_Year = pubDateField.find('./Year')
-		pubDateField_Month = pubDateField.find('./Month')
-		pubDateField_Day = pubDateField.find('./Day')
+		pubDateChildren = getFirstChildren(pubDateField)
+		pubDateField_Year = pubDateChildren.get('Year')
+		pubDateField_Month = pubDateChildren.get('Month')
+		pubDateField_Day = pubDateChildren.get('Day')
 		pubYear = int(pubDateField_Year.text)
 		pubMonth = int(pubDateField_Month.text)
 		pubDay = int(pubDateField_Day.text)
@@ -253,199 +431,228 @@ def getPubmedEntryDate(elem,pmid):
 
 	return pubYear,pubMonth,pubDay
 
-def processMedlineFile(pubmedFile):
-	for event, elem in etree.iterparse(pubmedFile, events=('start', 'end', 'start-ns', 'end-ns')):
-		if (event=='end' and elem.tag=='PubmedArticle'): #MedlineCitation'):
-			# Try to extract the pmidID
-			pmidField = elem.find('./MedlineCitation/PMID')
-			assert not pmidField is None
-			pmid = pmidField.text
-
-			journalYear,journalMonth,journalDay = getJournalDateForMedlineFile(elem,pmid)
-			entryYear,entryMonth,entryDay = getPubmedEntryDate(elem,pmid)
-
-			jComparison = tuple ( 9999 if d is None else d for d in [ journalYear,journalMonth,journalDay ] )
-			eComparison = tuple ( 9999 if d is None else d for d in [ entryYear,entryMonth,entryDay ] )
-			if jComparison < eComparison: # The PubMed entry has been delayed for some reason so let's try the journal data
-				pubYear,pubMonth,pubDay = journalYear,journalMonth,journalDay
-			else:
-				pubYear,pubMonth,pubDay = entryYear,entryMonth,entryDay
-
-			# Extract the authors
-			authorElems = elem.findall('./MedlineCitation/Article/AuthorList/Author')
-			authors = []
-			for authorElem in authorElems:
-				forename = authorElem.find('./ForeName')
-				lastname = authorElem.find('./LastName')
-				collectivename = authorElem.find('./CollectiveName')
-
-				name = None
-				if forename is not None and lastname is not None and forename.text is not None and lastname.text is not None:
-					name = "%s %s" % (forename.text, lastname.text)
-				elif lastname is not None and lastname.text is not None:
-					name = lastname.text
-				elif forename is not None and forename.text is not None:
-					name = forename.text
-				elif collectivename is not None and collectivename.text is not None:
-					name = collectivename.text
-				else:
-					raise RuntimeError("Unable to find authors in Pubmed citation (PMID=%s)" % pmid)
-				authors.append(name)
-
-			chemicals = []
-			chemicalElems = elem.findall('./MedlineCitation/ChemicalList/Chemical/NameOfSubstance')
-			for chemicalElem in chemicalElems:
-				chemID = chemicalElem.attrib['UI']
-				name = chemicalElem.text
-				#chemicals.append((chemID,name))
-				chemicals.append("%s|%s" % (chemID,name))
-			chemicalsTxt = "\t".join(chemicals)
-
-			meshHeadings = []
-			meshElems = elem.findall('./MedlineCitation/MeshHeadingList/MeshHeading')
-			for meshElem in meshElems:
-				descriptorElem = meshElem.find('./DescriptorName')
-				meshID = descriptorElem.attrib['UI']
-				majorTopicYN = descriptorElem.attrib['MajorTopicYN']
-				name = descriptorElem.text
-				#meshHeading = {'Descriptor':name,'MajorTopicYN':majorTopicYN,'ID':meshID,'Qualifiers':[]}
-				meshHeading = "Qualifier|%s|%s|%s" % (meshID,majorTopicYN,name)
-
-				qualifierElems = meshElem.findall('./QualifierName')
-				for qualifierElem in qualifierElems:
-					meshID = qualifierElem.attrib['UI']
-					majorTopicYN = qualifierElem.attrib['MajorTopicYN']
-					name = qualifierElem.text
-					qualifier = {'Descriptor':name,'MajorTopicYN':majorTopicYN,'ID':meshID}
-					#meshHeading['Qualifiers'].append(qualifier)
-					meshHeading += "%%Descriptor|%s|%s|%s" % (meshID,majorTopicYN,name)
-
-				meshHeadings.append(meshHeading)
-			meshHeadingsTxt = "\t".join(meshHeadings)
-					
-			# Extract the title of paper
-			title = elem.findall('./MedlineCitation/Article/ArticleTitle')
-			titleText = extractTextFromElemList(title)
-			titleText = [ removeWeirdBracketsFromOldTitles(t) for t in titleText ]
-			titleText = [ t for t in titleText if len(t) > 0 ]
-			titleText = [ htmlUnescape(t) for t in titleText ]
-			titleText = [ removeBracketsWithoutWords(t) for t in titleText ]
-			
-			# Extract the abstract from the paper
-			abstract = elem.findall('./MedlineCitation/Article/Abstract/AbstractText')
-			abstractText = extractTextFromElemList(abstract)
-			abstractText = [ t for t in abstractText if len(t) > 0 ]
-			abstractText = [ htmlUnescape(t) for t in abstractText ]
-			abstractText = [ removeBracketsWithoutWords(t) for t in abstractText ]
-			
-			journalTitleFields = elem.findall('./MedlineCitation/Article/Journal/Title')
-			journalTitleISOFields = elem.findall('./MedlineCitation/Article/Journal/ISOAbbreviation')
-			journalTitle = " ".join(extractTextFromElemList(journalTitleFields))
-			journalISOTitle = " ".join(extractTextFromElemList(journalTitleISOFields))
-
-			document = {}
-			document["pmid"] = pmid
-			document["pubYear"] = pubYear
-			document["pubMonth"] = pubMonth
-			document["pubDay"] = pubDay
-			document["title"] = titleText
-			document["abstract"] = abstractText
-			document["journal"] = journalTitle
-			document["journalISO"] = journalISOTitle
-			document["authors"] = authors
-			document["chemicals"] = chemicalsTxt
-			document["meshHeadings"] = meshHeadingsTxt
+# The files inside archives that are used for each input format
+xmlMemberSuffixes = {'pubmedxml':('.xml',), 'pmcxml':('.nxml','.xml')}
+
+# Streams the elements with a specific tag from an XML file, a gzipped XML file or the XML members of a tar archive
+def iterparseInputFile(backend,inputFile,tag,memberSuffixes):
+	for name,stream in iterInputStreams(inputFile,memberSuffixes):
+		for elem in profiling.timeIterator('parse', backend.iterparse(stream, tag)):
+			yield elem
+
+# An optional idFilter (e.g. from loadIDFilter) skips any citation whose PMID isn't in it before the rest is extracted.
+# An optional byteRange (from splitIntoByteRanges) processes only the citations in that part of the file
+def processMedlineFile(pubmedFile,xmlBackend=None,idFilter=None,byteRange=None):
+	backend = getXMLBackend(xmlBackend)
+	if byteRange is None:
+		elems = iterparseInputFile(backend, pubmedFile, 'PubmedArticle', xmlMemberSuffixes['pubmedxml'])
+	else:
+		elems = profiling.timeIterator('parse', backend.iterparse(readByteRange(pubmedFile, byteRange, 'PubmedArticle'), 'PubmedArticle'))
 
+	for elem in elems:
+		with profiling.stage('extract'):
+			document = extractMedlineCitation(backend,elem,idFilter)
+		if document is not None:
 			yield document
-		
 
-			# Important: clear the current element from memory to keep memory usage low
-			elem.clear()
+# Extracts the document for a PubmedArticle element, or None if its PMID isn't in the idFilter
+def extractMedlineCitation(backend,elem,idFilter):
+	# Try to extract the pmidID
+	pmidField = backend.find(elem,'./MedlineCitation/PMID')
+	assert not pmidField is None
+	pmid = pmidField.text
 
-def processPMCFile(pmcFile):
-	with open(pmcFile, 'r') as openfile:
+	if idFilter is not None:
+		with profiling.stage('filter'):
+			if not pmid in idFilter:
+				return None
 
-		# Skip to the article element in the file
-		for event, elem in etree.iterparse(openfile, events=('start', 'end', 'start-ns', 'end-ns')):
-			if (event=='end' and elem.tag=='article'):
+	fields = collectPlanFields(elem,pubmedArticlePlan)
+
+	pubDateField = fields['pubDate'][0] if fields['pubDate'] else None
+	journalYear,journalMonth,journalDay = getJournalDateForMedlineFile(pubDateField,pmid)
+	entryYear,entryMonth,entryDay = getPubmedEntryDate(fields['pubmedPubDate'],pmid)
+
+	jComparison = tuple ( 9999 if d is None else d for d in [ journalYear,journalMonth,journalDay ] )
+	eComparison = tuple ( 9999 if d is None else d for d in [ entryYear,entryMonth,entryDay ] )
+	if jComparison < eComparison: # The PubMed entry has been delayed for some reason so let's try the journal data
+		pubYear,pubMonth,pubDay = journalYear,journalMonth,journalDay
+	else:
+		pubYear,pubMonth,pubDay = entryYear,entryMonth,entryDay
+
+	# Extract the authors
+	authors = []
+	for authorElem in fields['author']:
+		authorChildren = getFirstChildren(authorElem)
+		forename = authorChildren.get('ForeName')
+		lastname = authorChildren.get('LastName')
+		collectivename = authorChildren.get('CollectiveName')
+
+		name = None
+		if forename is not None and lastname is not None and forename.text is not None and lastname.text is not None:
+			name = "%s %s" % (forename.text, lastname.text)
+		elif lastname is not None and lastname.text is not None:
+			name = lastname.text
+		elif forename is not None and forename.text is not None:
+			name = forename.text
+		elif collectivename is not None and collectivename.text is not None:
+			name = collectivename.text
+		else:
+			raise RuntimeError("Unable to find authors in Pubmed citation (PMID=%s)" % pmid)
+		authors.append(name)
+
+	chemicals = []
+	for chemicalElem in fields['chemical']:
+		chemID = chemicalElem.attrib['UI']
+		name = chemicalElem.text
+		#chemicals.append((chemID,name))
+		chemicals.append("%s|%s" % (chemID,name))
+	chemicalsTxt = "\t".join(chemicals)
+
+	meshHeadings = []
+	for meshElem in fields['meshHeading']:
+		descriptorElem = getFirstChildren(meshElem).get('DescriptorName')
+		meshID = descriptorElem.attrib['UI']
+		majorTopicYN = descriptorElem.attrib['MajorTopicYN']
+		name = descriptorElem.text
+		#meshHeading = {'Descriptor':name,'MajorTopicYN':majorTopicYN,'ID':meshID,'Qualifiers':[]}
+		meshHeading = "Qualifier|%s|%s|%s" % (meshID,majorTopicYN,name)
+
+		qualifierElems = [ child for child in meshElem if child.tag == 'QualifierName' ]
+		for qualifierElem in qualifierElems:
+			meshID = qualifierElem.attrib['UI']
+			majorTopicYN = qualifierElem.attrib['MajorTopicYN']
+			name = qualifierElem.text
+			qualifier = {'Descriptor':name,'MajorTopicYN':majorTopicYN,'ID':meshID}
+			#meshHeading['Qualifiers'].append(qualifier)
+			meshHeading += "%%Descriptor|%s|%s|%s" % (meshID,majorTopicYN,name)
+
+		meshHeadings.append(meshHeading)
+	meshHeadingsTxt = "\t".join(meshHeadings)
 			
-				pmidText,pmcidText,doiText,pubYear,pubMonth,pubDay,journal,journalISO = getMetaInfoForPMCArticle(elem)
+	# Extract the title of paper
+	titleText = extractNormalizedTextFromElemList(fields['title'], isTitle=True)
+	
+	# Extract the abstract from the paper
+	abstractText = extractNormalizedTextFromElemList(fields['abstract'])
+	
+	journalTitle = " ".join(extractTextFromElemList(fields['journalTitle']))
+	journalISOTitle = " ".join(extractTextFromElemList(fields['journalISO']))
+
+	document = {}
+	document["pmid"] = pmid
+	document["pubYear"] = pubYear
+	document["pubMonth"] = pubMonth
+	document["pubDay"] = pubDay
+	document["title"] = titleText
+	document["abstract"] = abstractText
+	document["journal"] = journalTitle
+	document["journalISO"] = journalISOTitle
+	document["authors"] = authors
+	document["chemicals"] = chemicalsTxt
+	document["meshHeadings"] = meshHeadingsTxt
+
+	return document
+
+# An optional idFilter skips any article (or subarticle) whose PMID isn't in it before the text is extracted
+def processPMCFile(pmcFile,xmlBackend=None,idFilter=None):
+	backend = getXMLBackend(xmlBackend)
+
+	# Skip to the article element in the file
+	for elem in iterparseInputFile(backend, pmcFile, 'article', xmlMemberSuffixes['pmcxml']):
+		with profiling.stage('extract'):
+			documents = extractPMCArticle(elem,idFilter)
+		for document in documents:
+			yield document
 
-				# We're going to process the main article along with any subarticles
-				# And if any of the subarticles have distinguishing IDs (e.g. PMID), then
-				# that'll be used, otherwise the parent article IDs will be used
-				subarticles = [elem] + elem.findall('./sub-article')
+# Extracts the documents for an article element and any subarticles in it that are in the idFilter
+def extractPMCArticle(elem,idFilter):
+	elemFields = collectPlanFields(elem,pmcArticlePlan)
+	pmidText,pmcidText,doiText,pubYear,pubMonth,pubDay,journal,journalISO = getMetaInfoFromPMCFields(elemFields)
+
+	# We're going to process the main article along with any subarticles
+	# And if any of the subarticles have distinguishing IDs (e.g. PMID), then
+	# that'll be used, otherwise the parent article IDs will be used
+	subarticles = [(elem,elemFields)] + [ (subElem,collectPlanFields(subElem,pmcArticlePlan)) for subElem in elemFields['subArticle'] ]
+	
+	documents = []
+	for articleElem,fields in subarticles:
+		if articleElem == elem:
+			# This is the main parent article. Just use its IDs
+			subPmidText,subPmcidText,subDoiText,subPubYear,subPubMonth,subPubDay,subJournal,subJournalISO = pmidText,pmcidText,doiText,pubYear,pubMonth,pubDay,journal,journalISO
+		else:
+			# Check if this subarticle has any distinguishing IDs and use them instead
+			subPmidText,subPmcidText,subDoiText,subPubYear,subPubMonth,subPubDay,subJournal,subJournalISO = getMetaInfoFromPMCFields(fields)
+			if subPmidText=='' and subPmcidText == '' and subDoiText == '':
+				subPmidText,subPmcidText,subDoiText = pmidText,pmcidText,doiText
+			if subPubYear == None:
+				subPubYear = pubYear
+				subPubMonth = pubMonth
+				subPubDay = pubDay
+			if subJournal == None:
+				subJournal = journal
+				subJournalISO = journalISO
+
+		if idFilter is not None:
+			with profiling.stage('filter'):
+				if not subPmidText in idFilter:
+					continue
 				
-				for articleElem in subarticles:
-					if articleElem == elem:
-						# This is the main parent article. Just use its IDs
-						subPmidText,subPmcidText,subDoiText,subPubYear,subPubMonth,subPubDay,subJournal,subJournalISO = pmidText,pmcidText,doiText,pubYear,pubMonth,pubDay,journal,journalISO
-					else:
-						# Check if this subarticle has any distinguishing IDs and use them instead
-						subPmidText,subPmcidText,subDoiText,subPubYear,subPubMonth,subPubDay,subJournal,subJournalISO = getMetaInfoForPMCArticle(articleElem)
-						if subPmidText=='' and subPmcidText == '' and subDoiText == '':
-							subPmidText,subPmcidText,subDoiText = pmidText,pmcidText,doiText
-						if subPubYear == None:
-							subPubYear = pubYear
-							subPubMonth = pubMonth
-							subPubDay = pubDay
-						if subJournal == None:
-							subJournal = journal
-							subJournalISO = journalISO
-							
-					# Extract the title of paper
-					title = articleElem.findall('./front/article-meta/title-group/article-title') + articleElem.findall('./front-stub/title-group/article-title')
-					assert len(title) <= 1
-					titleText = extractTextFromElemList(title)
-					titleText = [ removeWeirdBracketsFromOldTitles(t) for t in titleText ]
-					
-					# Get the subtitle (if it's there)
-					subtitle = articleElem.findall('./front/article-meta/title-group/subtitle') + articleElem.findall('./front-stub/title-group/subtitle')
-					subtitleText = extractTextFromElemList(subtitle)
-					subtitleText = [ removeWeirdBracketsFromOldTitles(t) for t in subtitleText ]
-					
-					# Extract the abstract from the paper
-					abstract = articleElem.findall('./front/article-meta/abstract') + articleElem.findall('./front-stub/abstract')
-					abstractText = extractTextFromElemList(abstract)
+		# Extract the title of paper
+		title = fields['frontTitle'] + fields['stubTitle']
+		assert len(title) <= 1
+		titleText = extractNormalizedTextFromElemList(title, isTitle=True)
+		
+		# Get the subtitle (if it's there)
+		subtitle = fields['frontSubtitle'] + fields['stubSubtitle']
+		subtitleText = extractNormalizedTextFromElemList(subtitle, isTitle=True)
+		
+		# Extract the abstract from the paper
+		abstract = fields['frontAbstract'] + fields['stubAbstract']
+		abstractText = extractNormalizedTextFromElemList(abstract)
 
-					
-					# Extract the full text from the paper as well as supplementaries and floating blocks of text
-					articleText = extractTextFromElemList(articleElem.findall('./body'))
-					backText = extractTextFromElemList(articleElem.findall('./back'))
-					floatingText = extractTextFromElemList(articleElem.findall('./floats-group'))
-					
-					document = {'pmid':subPmidText, 'pmcid':subPmcidText, 'doi':subDoiText, 'pubYear':subPubYear, 'pubMonth':subPubMonth, 'pubDay':subPubDay, 'journal':subJournal, 'journalISO':subJournalISO}
-
-					textSources = {}
-					textSources['title'] = titleText
-					textSources['subtitle'] = subtitleText
-					textSources['abstract'] = abstractText
-					textSources['article'] = articleText
-					textSources['back'] = backText
-					textSources['floating'] = floatingText
-
-					for k in textSources.keys():
-						tmp = textSources[k]
-						tmp = [ t for t in tmp if len(t) > 0 ]
-						tmp = [ htmlUnescape(t) for t in tmp ]
-						tmp = [ removeBracketsWithoutWords(t) for t in tmp ]
-						textSources[k] = tmp
-
-					document['textSources'] = textSources
-					yield document
-			
-				# Less important here (compared to abstracts) as each article file is not too big
-				elem.clear()
+		
+		# Extract the full text from the paper as well as supplementaries and floating blocks of text
+		articleText = extractNormalizedTextFromElemList(fields['body'])
+		backText = extractNormalizedTextFromElemList(fields['back'])
+		floatingText = extractNormalizedTextFromElemList(fields['floats'])
+		
+		document = {'pmid':subPmidText, 'pmcid':subPmcidText, 'doi':subDoiText, 'pubYear':subPubYear, 'pubMonth':subPubMonth, 'pubDay':subPubDay, 'journal':subJournal, 'journalISO':subJournalISO}
+
+		textSources = {}
+		textSources['title'] = titleText
+		textSources['subtitle'] = subtitleText
+		textSources['abstract'] = abstractText
+		textSources['article'] = articleText
+		textSources['back'] = backText
+		textSources['floating'] = floatingText
+
+		document['textSources'] = textSources
+		documents.append(document)
+
+	return documents
 
 def trimSentenceLengths(text):
 	MAXLENGTH = 90000
 	return ".".join( line[:MAXLENGTH] for line in text.split('.') )
 
-def writeMarcXMLRecordToBiocFile(record,biocWriter):
+# Writing a document to BioC and reading it back in turns empty strings into None, so that an empty ID
+# is written as <id/> and an empty infon as "None". Conversions used to go through a temporary BioC file
+# so this is applied to newly created documents to keep the output the same
+def emptyBiocValuesToNone(biocDoc):
+	if biocDoc.id == '':
+		biocDoc.id = None
+	for infons in [biocDoc.infons] + [ passage.infons for passage in biocDoc.passages ]:
+		for k,v in infons.items():
+			if str(v) == '':
+				infons[k] = None
+	return biocDoc
+
+def marcXMLRecordToBiocDocument(record):
 	metadata = record['008'].value()
 	language = metadata[35:38]
 	if language != 'eng':
-		return
+		return None
 
 	recordid = record['001'].value()
 
@@ -458,23 +665,29 @@ def writeMarcXMLRecordToBiocFile(record,biocWriter):
 		textSources.append(abstract)
 
 	#print recordid, language, title, abstract
-	biocDoc = bioc.BioCDocument()
+	biocDoc = LeanBiocDocument()
 	biocDoc.id = recordid
 
 	offset = 0
 	for textSource in textSources:
 		if isinstance(textSource,six.string_types):
 			textSource = trimSentenceLengths(textSource)
-			passage = bioc.BioCPassage()
+			passage = LeanBiocPassage()
 			passage.text = textSource
 			passage.offset = offset
 			offset += len(textSource)
-			biocDoc.add_passage(passage)
+			biocDoc.passages.append(passage)
 
-	biocWriter.writedocument(biocDoc)
+	return emptyBiocValuesToNone(biocDoc)
 
-def uimaxmi2bioc(xmiFilename, biocFilename):
-	tree = etree.parse(xmiFilename)
+def writeMarcXMLRecordToBiocFile(record,biocWriter):
+	biocDoc = marcXMLRecordToBiocDocument(record)
+	if biocDoc is not None:
+		biocWriter.writedocument(biocDoc)
+
+def uimaxmi2biocDocuments(xmiFilename,idFilter=None):
+	with openInputFile(xmiFilename) as f:
+		tree = etree.parse(f)
 	root = tree.getroot()
 
 	metadataNode = root.find('{http:///de/tudarmstadt/ukp/dkpro/core/api/metadata/type.ecore}DocumentMetaData')
@@ -483,111 +696,228 @@ def uimaxmi2bioc(xmiFilename, biocFilename):
 	contentNode = root.find('{http:///uima/cas.ecore}Sofa')
 	content = contentNode.attrib['sofaString']
 
-	with bioc.iterwrite(biocFilename) as writer:
-		biocDoc = bioc.BioCDocument()
-		biocDoc.id = None
-		biocDoc.infons['title'] = documentTitle
-
-		passage = bioc.BioCPassage()
-		passage.infons['section'] = 'article'
-		passage.text = content
-		passage.offset = 0
-		biocDoc.add_passage(passage)
-
-		writer.writedocument(biocDoc)
+	biocDoc = LeanBiocDocument()
+	biocDoc.id = None
+	biocDoc.infons['title'] = documentTitle
+
+	passage = LeanBiocPassage()
+	passage.infons['section'] = 'article'
+	passage.text = content
+	passage.offset = 0
+	biocDoc.passages.append(passage)
+
+	for biocDoc in filterBiocDocuments([emptyBiocValuesToNone(biocDoc)],idFilter):
+		yield biocDoc
+
+# The documents cached while the file was hashed (see pubmed_hash) are used instead of parsing the file if there are any
+def pubmedxml2biocDocuments(pubmedxmlFilename,idFilter=None,byteRange=None):
+	pmDocs = loadCachedDocuments(pubmedxmlFilename,idFilter) if byteRange is None else None
+	if pmDocs is None:
+		pmDocs = processMedlineFile(pubmedxmlFilename,idFilter=idFilter,byteRange=byteRange)
+
+	for pmDoc in pmDocs:
+		biocDoc = LeanBiocDocument()
+		biocDoc.id = pmDoc["pmid"]
+		biocDoc.infons['title'] = " ".join(pmDoc["title"])
+		biocDoc.infons['pmid'] = pmDoc["pmid"]
+		biocDoc.infons['year'] = pmDoc["pubYear"]
+		biocDoc.infons['month'] = pmDoc["pubMonth"]
+		biocDoc.infons['day'] = pmDoc["pubDay"]
+		biocDoc.infons['journal'] = pmDoc["journal"]
+		biocDoc.infons['journalISO'] = pmDoc["journalISO"]
+		biocDoc.infons['authors'] = ", ".join(pmDoc["authors"])
+		biocDoc.infons['chemicals'] = pmDoc['chemicals']
+		biocDoc.infons['meshHeadings'] = pmDoc['meshHeadings']
+
+		offset = 0
+		for section in ["title","abstract"]:
+			for textSource in pmDoc[section]:
+				textSource = trimSentenceLengths(textSource)
+				passage = LeanBiocPassage()
+				passage.infons['section'] = section
+				passage.text = textSource
+				passage.offset = offset
+				offset += len(textSource)
+				biocDoc.passages.append(passage)
+
+		with profiling.stage('cleanup'):
+			biocDoc = emptyBiocValuesToNone(biocDoc)
+		yield biocDoc
 
+allowedSubsections = {"abbreviations","additional information","analysis","author contributions","authors' contributions","authors’ contributions","background","case report","competing interests","conclusion","conclusions","conflict of interest","conflicts of interest","consent","data analysis","data collection","discussion","ethics statement","funding","introduction","limitations","material and methods","materials","materials and methods","measures","method","methods","participants","patients and methods","pre-publication history","related literature","results","results and discussion","statistical analyses","statistical analysis","statistical methods","statistics","study design","summary","supplementary data","supplementary information","supplementary material","supporting information"}
+def pmcxml2biocDocuments(pmcxmlFilename,idFilter=None):
+	try:
+		for pmcDoc in processPMCFile(pmcxmlFilename,idFilter=idFilter):
+			biocDoc = LeanBiocDocument()
+			biocDoc.id = pmcDoc["pmid"]
+			biocDoc.infons['title'] = " ".join(pmcDoc["textSources"]["title"])
+			biocDoc.infons['pmid'] = pmcDoc["pmid"]
+			biocDoc.infons['pmcid'] = pmcDoc["pmcid"]
+			biocDoc.infons['doi'] = pmcDoc["doi"]
+			biocDoc.infons['year'] = pmcDoc["pubYear"]
+			biocDoc.infons['month'] = pmcDoc["pubMonth"]
+			biocDoc.infons['day'] = pmcDoc["pubDay"]
+			biocDoc.infons['journal'] = pmcDoc["journal"]
+			biocDoc.infons['journalISO'] = pmcDoc["journalISO"]
 
-def pubmedxml2bioc(pubmedxmlFilename, biocFilename):
-	with bioc.iterwrite(biocFilename) as writer:
-		for pmDoc in processMedlineFile(pubmedxmlFilename):
-			biocDoc = bioc.BioCDocument()
-			biocDoc.id = pmDoc["pmid"]
-			biocDoc.infons['title'] = " ".join(pmDoc["title"])
-			biocDoc.infons['pmid'] = pmDoc["pmid"]
-			biocDoc.infons['year'] = pmDoc["pubYear"]
-			biocDoc.infons['month'] = pmDoc["pubMonth"]
-			biocDoc.infons['day'] = pmDoc["pubDay"]
-			biocDoc.infons['journal'] = pmDoc["journal"]
-			biocDoc.infons['journalISO'] = pmDoc["journalISO"]
-			biocDoc.infons['authors'] = ", ".join(pmDoc["authors"])
-			biocDoc.infons['chemicals'] = pmDoc['chemicals']
-			biocDoc.infons['meshHeadings'] = pmDoc['meshHeadings']
-	
 			offset = 0
-			for section in ["title","abstract"]:
-				for textSource in pmDoc[section]:
+			for groupName,textSourceGroup in pmcDoc["textSources"].items():
+				subsection = None
+				for textSource in textSourceGroup:
 					textSource = trimSentenceLengths(textSource)
-					passage = bioc.BioCPassage()
-					passage.infons['section'] = section
+					passage = LeanBiocPassage()
+
+					subsectionCheck = textSource.lower().strip('01234567890. ')
+					if subsectionCheck in allowedSubsections:
+						subsection = subsectionCheck
+
+					passage.infons['section'] = groupName
+					passage.infons['subsection'] = subsection
 					passage.text = textSource
 					passage.offset = offset
 					offset += len(textSource)
-					biocDoc.add_passage(passage)
+					biocDoc.passages.append(passage)
+
+			with profiling.stage('cleanup'):
+				biocDoc = emptyBiocValuesToNone(biocDoc)
+			yield biocDoc
+	except ParseErrors:
+		raise RuntimeError("Parsing error in PMC xml file: %s" % pmcxmlFilename)	
+
+def marcxml2biocDocuments(marcxmlFilename,idFilter=None):
+	biocDocs = []
+	def marcxml2bioc_helper(record):
+		with profiling.stage('extract'):
+			biocDoc = marcXMLRecordToBiocDocument(record)
+		if biocDoc is not None:
+			biocDocs.append(biocDoc)
 
+	with openInputFile(marcxmlFilename) as inF:
+		pymarc.map_xml(marcxml2bioc_helper,inF)
+
+	for biocDoc in filterBiocDocuments(biocDocs,idFilter):
+		yield biocDoc
+
+# Reads the full BioC documents (including any annotations and relations) unless only some fields are
+# requested, in which case the lean reader is used
+def bioc2biocDocuments(biocFilename,idFilter=None,biocFields=None):
+	if biocFields is not None:
+		for biocDoc in iterparseLeanBiocDocuments(biocFilename,biocFields,idFilter):
+			yield biocDoc
+		return
+
+	# The decoder is given the file object so that compressed files can be read
+	with openInputFile(biocFilename) as f, bioc.BioCDecoderIter(f) as parser:
+		for biocDoc in filterBiocDocuments(parser,idFilter):
+			yield biocDoc
+
+def writeDocumentsToBioc(biocDocs, biocFilename, zstdDictionaryFilename=None):
+	with BiocWriter(biocFilename, zstdDictionaryFilename) as writer:
+		for biocDoc in biocDocs:
 			writer.writedocument(biocDoc)
 
+def uimaxmi2bioc(xmiFilename, biocFilename):
+	writeDocumentsToBioc(uimaxmi2biocDocuments(xmiFilename), biocFilename)
+
+def pubmedxml2bioc(pubmedxmlFilename, biocFilename):
+	writeDocumentsToBioc(pubmedxml2biocDocuments(pubmedxmlFilename), biocFilename)
 
-allowedSubsections = {"abbreviations","additional information","analysis","author contributions","authors' contributions","authors’ contributions","background","case report","competing interests","conclusion","conclusions","conflict of interest","conflicts of interest","consent","data analysis","data collection","discussion","ethics statement","funding","introduction","limitations","material and methods","materials","materials and methods","measures","method","methods","participants","patients and methods","pre-publication history","related literature","results","results and discussion","statistical analyses","statistical analysis","statistical methods","statistics","study design","summary","supplementary data","supplementary information","supplementary material","supporting information"}
 def pmcxml2bioc(pmcxmlFilename, biocFilename):
-	try:
-		with bioc.iterwrite(biocFilename) as writer:
-			for pmcDoc in processPMCFile(pmcxmlFilename):
-				biocDoc = bioc.BioCDocument()
-				biocDoc.id = pmcDoc["pmid"]
-				biocDoc.infons['title'] = " ".join(pmcDoc["textSources"]["title"])
-				biocDoc.infons['pmid'] = pmcDoc["pmid"]
-				biocDoc.infons['pmcid'] = pmcDoc["pmcid"]
-				biocDoc.infons['doi'] = pmcDoc["doi"]
-				biocDoc.infons['year'] = pmcDoc["pubYear"]
-				biocDoc.infons['month'] = pmcDoc["pubMonth"]
-				biocDoc.infons['day'] = pmcDoc["pubDay"]
-				biocDoc.infons['journal'] = pmcDoc["journal"]
-				biocDoc.infons['journalISO'] = pmcDoc["journalISO"]
-
-				offset = 0
-				for groupName,textSourceGroup in pmcDoc["textSources"].items():
-					subsection = None
-					for textSource in textSourceGroup:
-						textSource = trimSentenceLengths(textSource)
-						passage = bioc.BioCPassage()
-
-						subsectionCheck = textSource.lower().strip('01234567890. ')
-						if subsectionCheck in allowedSubsections:
-							subsection = subsectionCheck
-
-						passage.infons['section'] = groupName
-						passage.infons['subsection'] = subsection
-						passage.text = textSource
-						passage.offset = offset
-						offset += len(textSource)
-						biocDoc.add_passage(passage)
-
-				writer.writedocument(biocDoc)
-	except etree.ParseError:
-		raise RuntimeError("Parsing error in PMC xml file: %s" % pmcxmlFilename)	
+	writeDocumentsToBioc(pmcxml2biocDocuments(pmcxmlFilename), biocFilename)
+
+def marcxml2bioc(marcxmlFilename,biocFilename):
+	writeDocumentsToBioc(marcxml2biocDocuments(marcxmlFilename), biocFilename)
+
+def writeBiocDocumentAsTxt(biocDoc, txtHandle):
+	with profiling.stage('encode'):
+		for passage in biocDoc.passages:
+			txtHandle.write(passage.text)
+			txtHandle.write("\n\n")
+
+def writeDocumentsToTxt(biocDocs, txtFilename, zstdDictionaryFilename=None):
+	with openOutputTextFile(txtFilename, zstdDictionaryFilename) as txtHandle:
+		for biocDoc in biocDocs:
+			writeBiocDocumentAsTxt(biocDoc,txtHandle)
+
+# Functions that write a single document to an open (binary) stream, for outputs written with checkpoints
+def openBiocDocumentWriter(stream):
+	def writeDocument(biocDoc):
+		with profiling.stage('encode'):
+			data = encodeDocument(biocDoc).encode('utf-8')
+		stream.write(data)
+	return writeDocument
+
+def openTxtDocumentWriter(stream):
+	def writeDocument(biocDoc):
+		with profiling.stage('encode'):
+			for passage in biocDoc.passages:
+				stream.write(passage.text.encode('utf-8'))
+				stream.write(b"\n\n")
+	return writeDocument
+
+# Uncompressed BioC files can have their documents copied into the output without parsing them
+def canCopyBiocDocuments(biocFilename,outBiocWriter,idFilter):
+	return idFilter is None and isinstance(outBiocWriter,BiocWriter) and getCompression(biocFilename) is None
 
 def mergeBioc(biocFilename, outBiocWriter,idFilter):
-	with bioc.iterparse(biocFilename) as parser:
-		for biocDoc in parser:
-			if idFilter is None or biocDoc.id in idFilter:
-				outBiocWriter.writedocument(biocDoc)
+	if canCopyBiocDocuments(biocFilename,outBiocWriter,idFilter):
+		outBiocWriter.copydocuments(biocFilename)
+		return
+
+	for biocDoc in bioc2biocDocuments(biocFilename,idFilter):
+		outBiocWriter.writedocument(biocDoc)
 
 def bioc2txt(biocFilename, txtHandle,idFilter):
-	with bioc.iterparse(biocFilename) as parser:
-		for biocDoc in parser:
-			if idFilter is None or biocDoc.id in idFilter:
-				for passage in biocDoc.passages:
-					txtHandle.write(passage.text)
-					txtHandle.write("\n\n")
+	for biocDoc in bioc2biocDocuments(biocFilename,idFilter,outFormatBiocFields['txt']):
+		writeBiocDocumentAsTxt(biocDoc, txtHandle)
+
+def filterBiocDocuments(biocDocs, idFilter):
+	for biocDoc in biocDocs:
+		if idFilter is not None:
+			with profiling.stage('filter'):
+				wanted = biocDoc.id in idFilter
+			if not wanted:
+				continue
+		yield biocDoc
+
+# A set of document IDs for filtering. The PMID lists (from gatherPMIDs) can have tens of thousands of
+# PMIDs per input file so they are stored as a sorted array of integers instead of a set of strings.
+# Any ID that isn't written as a plain integer is kept as a string so that it can only match exactly
+plainIntegerRegex = re.compile(r'(0|[1-9][0-9]{0,17})\Z')
+class IDFilter:
+	def __init__(self,ids):
+		intIDs,self.otherIDs = set(),set()
+		for id in ids:
+			if plainIntegerRegex.match(id):
+				intIDs.add(int(id))
+			else:
+				self.otherIDs.add(id)
+		self.intIDs = array.array('q',sorted(intIDs))
+
+	def __contains__(self,id):
+		# Documents without an ID are never in the filter
+		if not id:
+			return False
+		elif plainIntegerRegex.match(id):
+			intID = int(id)
+			i = bisect.bisect_left(self.intIDs,intID)
+			return i < len(self.intIDs) and self.intIDs[i] == intID
+		else:
+			return id in self.otherIDs
 
-def marcxml2bioc(marcxmlFilename,biocFilename):
-	with open(marcxmlFilename,'rb') as inF, bioc.iterwrite(biocFilename) as writer:
-		def marcxml2bioc_helper(record):
-			writeMarcXMLRecordToBiocFile(record,writer)
+	def __len__(self):
+		return len(self.intIDs) + len(self.otherIDs)
 
-		pymarc.map_xml(marcxml2bioc_helper,inF)
+def loadIDFilter(idFilterfile):
+	if idFilterfile is None:
+		return None
+	with open(idFilterfile) as f:
+		return IDFilter( line.strip() for line in f )
+
+# How often (in seconds) a conversion from a file list (e.g. in the Convert Snakefile) saves a checkpoint
+defaultCheckpointInterval = 300
 
-def convertFilesFromFilelist(listFile,inFormat,outFile,outFormat,idFilterListfile=None):
+def convertFilesFromFilelist(listFile,inFormat,outFile,outFormat,idFilterListfile=None,workers=1,zstdDictionaryFilename=None,checkpointInterval=defaultCheckpointInterval,profile=False):
 	with open(listFile) as f:
 		inFiles = json.load(f)
 
@@ -596,59 +926,279 @@ def convertFilesFromFilelist(listFile,inFormat,outFile,outFormat,idFilterListfil
 		with open(idFilterListfile) as f:
 			idFilterfiles = json.load(f)
 
-	convertFiles(inFiles,inFormat,outFile,outFormat,idFilterfiles)
+	convertFiles(inFiles,inFormat,outFile,outFormat,idFilterfiles,workers,zstdDictionaryFilename,checkpointInterval,profile)
+
+inFormatReaders = {'bioc':bioc2biocDocuments, 'pubmedxml':pubmedxml2biocDocuments, 'marcxml':marcxml2biocDocuments, 'pmcxml':pmcxml2biocDocuments, 'uimaxmi':uimaxmi2biocDocuments}
+
+# The fields of BioC input documents that each output format uses. These are read with the lean BioC reader
+# while BioC output needs the full documents (with any annotations and relations)
+outFormatBiocFields = {'txt':BiocFields(documentInfons=[],passageInfons=[]), 'jsonl':BiocFields(), 'parquet':BiocFields(), 'arrow':BiocFields()}
+
+# Streams the BioC documents for an input file (or a byte range of it) that pass the ID filter
+def convertToBiocDocuments(inFile,inFormat,idFilterfile=None,byteRange=None,biocFields=None):
+	if not inFormat in inFormatReaders:
+		raise RuntimeError("Unknown input format: %s" % inFormat)
+
+	with profiling.stage('filter'):
+		idFilter = loadIDFilter(idFilterfile)
+	kwargs = {}
+	if byteRange is not None:
+		kwargs['byteRange'] = byteRange
+	if biocFields is not None:
+		kwargs['biocFields'] = biocFields
+	return inFormatReaders[inFormat](inFile, idFilter, **kwargs)
+
+# Converts a single input file (or a byte range of it, or an archive member that has already been read) to a list of
+# BioC documents. Takes a tuple so that it can be mapped across a process pool
+def convertToBiocDocumentList(task):
+	return list(convertToBiocDocuments(*task))
+
+# Converts a task in a worker process. It comes with whether the profiling stats should be collected (as the worker
+# may not have been forked from the main process) and they are sent back with the documents
+def convertToBiocDocumentListInWorker(taskWithProfile):
+	task,profile = taskWithProfile
+	with profiling.collectStats(profile) as workerProfile:
+		biocDocs = convertToBiocDocumentList(task)
+	return biocDocs, None if workerProfile is None else workerProfile.getStats()
+
+def countDocuments(biocDocs):
+	for biocDoc in biocDocs:
+		profiling.addCount('documents',1)
+		yield biocDoc
+
+# Input formats where a large file can be split into byte ranges of these elements that are parsed in parallel
+splittableFormats = {'pubmedxml':'PubmedArticle'}
+
+# Splits up the input files into tasks for the workers. Uncompressed files of a splittable format are split into
+# byte ranges (one per worker) so that the workers aren't left idle when there are fewer files than workers.
+# Consecutive members of the same archive (archive::member) are grouped together so that the archive is only
+# streamed once for them
+def getConversionTasks(inFiles,inFormat,idFilterfiles,workers,biocFields=None):
+	tasks = []
+	for inFile,idFilterfile in zip(inFiles,idFilterfiles):
+		if isVirtualFile(inFile) and inFormat in xmlMemberSuffixes:
+			archive,_ = splitVirtualFilename(inFile)
+			previous = tasks[-1] if tasks else None
+			if previous and isinstance(previous[0],list) and splitVirtualFilename(previous[0][0])[0] == archive and previous[2] == idFilterfile:
+				previous[0].append(inFile)
+			else:
+				tasks.append( ([inFile],inFormat,idFilterfile,None,biocFields) )
+			continue
+
+		# Files with cached documents are quick enough to read that they aren't split
+		byteRanges = []
+		if workers > 1 and inFormat in splittableFormats and not isArchive(inFile) and getCompression(inFile) is None and not hasDocumentCache(inFile):
+			byteRanges = splitIntoByteRanges(inFile, splittableFormats[inFormat], workers)
 
-acceptedInFormats = ['bioc','pubmedxml','marcxml','pmcxml','uimaxmi']
-acceptedOutFormats = ['bioc','txt']
-def convertFiles(inFiles,inFormat,outFile,outFormat,idFilterfiles=None):
-	outBiocHandle,outTxtHandle = None,None
+		if len(byteRanges) > 0:
+			for byteRange in byteRanges:
+				tasks.append( (inFile,inFormat,idFilterfile,byteRange,biocFields) )
+		else:
+			tasks.append( (inFile,inFormat,idFilterfile,None,biocFields) )
+	return tasks
+
+# A task for the members of an archive (a whole archive or a group of its virtual files)
+def isArchiveTask(task):
+	inFile,inFormat = task[0],task[1]
+	return inFormat in xmlMemberSuffixes and (isinstance(inFile,list) or (not isVirtualFile(inFile) and isArchive(inFile)))
+
+# Splits the tasks into the pieces that are sent to the workers, each with the index of its task. An archive can only
+# be decompressed from the start, so an archive task is read here in a single pass and split into a piece for each
+# member as it is read. An archive task without any members gets an empty piece (None) so that every task has results
+def iterTaskPieces(tasks):
+	for taskIndex,task in enumerate(tasks):
+		if not isArchiveTask(task):
+			yield taskIndex,task
+			continue
+
+		inFile,inFormat = task[0],task[1]
+		memberCount = 0
+		for member in iterArchiveMembers(inFile,xmlMemberSuffixes[inFormat]):
+			yield taskIndex,(member,)+tuple(task[1:])
+			memberCount += 1
+		if memberCount == 0:
+			yield taskIndex,None
+
+# Maps a function across the pieces in a process pool and yields the results (with the index of their task) in order.
+# Only a few pieces are sent ahead of the results being used so that an archive isn't read into memory
+def iterPoolResults(pool,func,pieces,maxPending):
+	pending = deque()
+	for taskIndex,piece in pieces:
+		pending.append( (taskIndex, None if piece is None else pool.apply_async(func,(piece,))) )
+		if len(pending) > maxPending:
+			taskIndex,result = pending.popleft()
+			yield taskIndex, None if result is None else result.get()
+	while pending:
+		taskIndex,result = pending.popleft()
+		yield taskIndex, None if result is None else result.get()
+
+# The documents from the results of the workers, with their profiling stats added to those of the main process
+def iterWorkerDocuments(results):
+	for _,result in results:
+		if result is None:
+			continue
+		biocDocs,workerStats = result
+		if workerStats is not None:
+			profiling.addStats(workerStats)
+		for biocDoc in countDocuments(biocDocs):
+			yield biocDoc
+
+# Yields the BioC documents of each task (as an iterable) in the order of the tasks. With multiple
+# workers, the tasks are converted in parallel but are still returned in the original order
+def iterConvertTasks(tasks,workers=1):
+	hasArchiveTasks = any( isArchiveTask(task) for task in tasks )
+	if workers > 1 and (len(tasks) > 1 or hasArchiveTasks):
+		profile = profiling.isEnabled()
+		pieces = ( (taskIndex, None if piece is None else (piece,profile)) for taskIndex,piece in iterTaskPieces(tasks) )
+		with multiprocessing.Pool(workers if hasArchiveTasks else min(workers,len(tasks))) as pool:
+			results = iterPoolResults(pool,convertToBiocDocumentListInWorker,pieces,2*workers)
+			for _,taskResults in itertools.groupby(results,key=lambda result: result[0]):
+				yield iterWorkerDocuments(taskResults)
+	else:
+		for task in tasks:
+			biocDocs = convertToBiocDocuments(*task)
+			yield countDocuments(biocDocs) if profiling.isEnabled() else biocDocs
+
+# Yields the converted BioC documents in the same order as the input files
+def iterConvertToBiocDocuments(inFiles,inFormat,idFilterfiles,workers=1,biocFields=None):
+	tasks = getConversionTasks(inFiles,inFormat,idFilterfiles,workers,biocFields)
+	for biocDocs in iterConvertTasks(tasks,workers):
+		for biocDoc in biocDocs:
+			yield biocDoc
 
-	if outFormat == 'bioc':
-		outBiocHandle = bioc.BioCEncoderIter(outFile)
-	elif outFormat == 'txt':
-		outTxtHandle = codecs.open(outFile,'w','utf-8')
+outFormatWriters = {'bioc':writeDocumentsToBioc, 'txt':writeDocumentsToTxt, 'jsonl':writeDocumentsToJSONL, 'parquet':writeDocumentsToParquet, 'arrow':writeDocumentsToArrow}
+
+acceptedInFormats = ['bioc','pubmedxml','marcxml','pmcxml','uimaxmi']
+acceptedOutFormats = ['bioc','txt','jsonl','parquet','arrow']
+
+# Output formats that can be gzip or zstd compressed (by giving the output file a .gz or .zst suffix). Parquet
+# and Arrow files are compressed internally
+compressibleOutFormats = ['bioc','txt','jsonl']
+
+# Output formats that can be written with checkpoints and resumed. Each has the bytes at the start and end of the
+# file and a function to get a document writer for a stream. Parquet and Arrow files are written with a footer
+# that describes the whole file so can't be appended to
+resumableOutFormats = {
+	'bioc': (lambda: encodeCollectionHeader().encode('utf-8'), collectionFooter.encode('utf-8'), openBiocDocumentWriter),
+	'txt': (lambda: b'', b'', openTxtDocumentWriter),
+	'jsonl': (lambda: b'', b'', openJSONLDocumentWriter)
+}
+
+# Identifies the input of a conversion so that a checkpoint is only resumed for exactly the same input files (that
+# haven't changed since) split into the same tasks
+def getCheckpointSettings(tasks,inFormat,outFormat,zstdDictionaryFilename):
+	filenames = set()
+	for inFile,_,idFilterfile,_,_ in tasks:
+		for filename in (inFile if isinstance(inFile,list) else [inFile]):
+			filenames.add(splitVirtualFilename(filename)[0])
+		if idFilterfile is not None:
+			filenames.add(idFilterfile)
+	fileStats = { f:[os.path.getsize(f),os.path.getmtime(f)] for f in sorted(filenames) }
+
+	taskSettings = [ [inFile,idFilterfile,byteRange] for inFile,_,idFilterfile,byteRange,_ in tasks ]
+	return {'inFormat':inFormat, 'outFormat':outFormat, 'zstdDictionary':zstdDictionaryFilename, 'tasks':taskSettings, 'files':fileStats}
+
+# Converts the tasks into a partial output file and saves a checkpoint (of the task and the document within it
+# that the output has got to) every checkpointInterval seconds. If a checkpoint from a previous run of the same
+# conversion is found, the output is continued from it. The partial output is renamed to outFile once complete
+def convertFilesWithCheckpoints(tasks,inFormat,outFile,outFormat,workers,zstdDictionaryFilename,checkpointInterval):
+	settings = getCheckpointSettings(tasks,inFormat,outFormat,zstdDictionaryFilename)
+	checkpoint = loadCheckpoint(outFile,settings)
+
+	startTask,startDocument,documentCount,offset = 0,0,0,None
+	if checkpoint is not None:
+		startTask,startDocument,documentCount,offset = checkpoint['taskIndex'],checkpoint['documentIndex'],checkpoint['documentCount'],checkpoint['offset']
+		print("Resuming from checkpoint at document %d of input %d/%d (%d documents already written)" % (startDocument+1,startTask+1,len(tasks),documentCount))
+
+	header,footer,openDocumentWriter = resumableOutFormats[outFormat]
+	out = ResumableOutput(outFile,header(),footer,openDocumentWriter,zstdDictionaryFilename,offset)
+
+	lastCheckpoint = time.time()
+	try:
+		for taskIndex,biocDocs in enumerate(iterConvertTasks(tasks[startTask:],workers),startTask):
+			documentIndex = 0
+			for biocDoc in biocDocs:
+				if taskIndex == startTask and documentIndex < startDocument:
+					documentIndex += 1
+					continue
+
+				out.writeDocument(biocDoc)
+				documentIndex += 1
+				documentCount += 1
+
+				if time.time() - lastCheckpoint >= checkpointInterval:
+					saveCheckpoint(outFile,settings,taskIndex,documentIndex,documentCount,out.sync())
+					lastCheckpoint = time.time()
+	except:
+		out.close()
+		raise
+
+	out.finish()
+	removeCheckpoint(outFile)
+
+# With a checkpointInterval (in seconds), BioC/txt/JSONL output is written with checkpoints so that a conversion
+# that is killed can be resumed by running it again. With profile (or the PUBRUNNER_PROFILE environmental variable),
+# the time spent in each stage of the conversion is saved to a JSON file next to the output
+def convertFiles(inFiles,inFormat,outFile,outFormat,idFilterfiles=None,workers=1,zstdDictionaryFilename=None,checkpointInterval=None,profile=False):
+	if not inFormat in inFormatReaders:
+		raise RuntimeError("Unknown input format: %s" % inFormat)
+	if not outFormat in outFormatWriters:
+		raise RuntimeError("Unknown output format: %s" % outFormat)
+	if getCompression(outFile) is not None and not outFormat in compressibleOutFormats:
+		raise RuntimeError("Only %s output can be compressed, not %s: %s" % ("/".join(compressibleOutFormats),outFormat,outFile))
+	if zstdDictionaryFilename is not None and not outFormat in compressibleOutFormats:
+		raise RuntimeError("A zstd dictionary can only be used for %s output, not %s" % ("/".join(compressibleOutFormats),outFormat))
+
+	writerArgs = {}
+	if zstdDictionaryFilename is not None:
+		writerArgs['zstdDictionaryFilename'] = zstdDictionaryFilename
 
 	if idFilterfiles is None:
 		idFilterfiles = [ None for _ in inFiles ]
 
 	print("Converting %d files to %s" % (len(inFiles),outFile))
-	for inFile,idFilterfile in zip(inFiles,idFilterfiles):
-		if idFilterfile is None:
-			idFilter = None
+
+	# The stats are only collected for this conversion and whatever was being collected before is put back afterwards
+	profile = profile or profiling.isProfilingRequested()
+	with profiling.collectStats(profile) as conversionProfile:
+		if profile:
+			# Archive members are counted as they are read
+			for inFile in inFiles:
+				if not isVirtualFile(inFile) and not isArchive(inFile):
+					profiling.addCount('inputBytes',os.path.getsize(inFile))
+		startTime = time.time()
+
+		# BioC input only needs the fields used by the output format
+		biocFields = outFormatBiocFields.get(outFormat) if inFormat == 'bioc' else None
+
+		if inFormat == 'bioc' and outFormat == 'bioc' and all( idFilterfile is None for idFilterfile in idFilterfiles ):
+			# Merging BioC files without any filtering is just a copy of the documents from each file
+			with BiocWriter(outFile,zstdDictionaryFilename) as writer:
+				for inFile in inFiles:
+					mergeBioc(inFile,writer,None)
+		elif checkpointInterval is not None and outFormat in resumableOutFormats:
+			tasks = getConversionTasks(inFiles,inFormat,idFilterfiles,workers,biocFields)
+			convertFilesWithCheckpoints(tasks,inFormat,outFile,outFormat,workers,zstdDictionaryFilename,checkpointInterval)
 		else:
-			with open(idFilterfile) as f:
-				idFilter = set([ line.strip() for line in f ])
-
-
-		with tempfile.NamedTemporaryFile() as temp:
-			if inFormat == 'bioc':
-				shutil.copyfile(inFile,temp.name)
-			elif inFormat == 'pubmedxml':
-				pubmedxml2bioc(inFile,temp.name)
-			elif inFormat == 'marcxml':
-				marcxml2bioc(inFile,temp.name)
-			elif inFormat == 'pmcxml':
-				pmcxml2bioc(inFile,temp.name)
-			elif inFormat == 'uimaxmi':
-				uimaxmi2bioc(inFile,temp.name)
-			else:
-				raise RuntimeError("Unknown input format: %s" % inFormat)
+			biocDocs = iterConvertToBiocDocuments(inFiles,inFormat,idFilterfiles,workers,biocFields)
+			outFormatWriters[outFormat](biocDocs,outFile,**writerArgs)
 
-			if outFormat == 'bioc':
-				mergeBioc(temp.name,outBiocHandle,idFilter)
-			elif outFormat == 'txt':
-				bioc2txt(temp.name,outTxtHandle,idFilter)
-			else:
-				raise RuntimeError("Unknown output format: %s" % outFormat)
-	print("Output to %s complete" % outFile)
+		print("Output to %s complete" % outFile)
+
+		if profile:
+			profiling.writeStats(conversionProfile,outFile,time.time()-startTime,{'inFormat':inFormat, 'outFormat':outFormat, 'inputFiles':len(inFiles), 'workers':workers})
 
 def main():
 	parser = argparse.ArgumentParser(description='Tool to convert corpus between different formats')
-	parser.add_argument('--i',type=str,required=True,help="Comma-delimited list of documents to convert")
+	parser.add_argument('--i',type=str,required=True,help="Comma-delimited list of documents to convert (gzipped files and .tar.gz archives of XML files are read directly)")
 	parser.add_argument('--iFormat',type=str,required=True,help="Format of input corpus. Options: %s" % "/".join(acceptedInFormats))
 	parser.add_argument('--idFilters',type=str,help="Optional set of ID files to filter the documents by")
-	parser.add_argument('--o',type=str,required=True,help="Where to store resulting converted docs")
+	parser.add_argument('--o',type=str,required=True,help="Where to store resulting converted docs (a .gz or .zst suffix compresses the output)")
 	parser.add_argument('--oFormat',type=str,required=True,help="Format for output corpus. Options: %s" % "/".join(acceptedOutFormats))
+	parser.add_argument('--workers',type=int,default=1,help="Number of processes to use to parse the input files")
+	parser.add_argument('--zstdDictionary',type=str,help="Optional zstd dictionary (from pubrunner_train_zstd_dictionary) to compress .zst output with")
+	parser.add_argument('--profile',action='store_true',help="Time each stage of the conversion and save the stats to a hidden JSON file next to the output (also enabled with the PUBRUNNER_PROFILE environmental variable)")
+	parser.add_argument('--checkpointInterval',type=float,help="Save a checkpoint this often (in seconds) so that the conversion can be resumed if it is killed (by running it again). Only for %s output" % "/".join(resumableOutFormats))
 
 	args = parser.parse_args()
 
@@ -665,5 +1215,7 @@ def main():
 	else:
 		idFilterfiles = None
 
-	convertFiles(inFiles,inFormat,args.o,outFormat,idFilterfiles)
+	assert args.workers >= 1, "The number of workers must be at least one"
+
+	convertFiles(inFiles,inFormat,args.o,outFormat,idFilterfiles,args.workers,args.zstdDictionary,args.checkpointInterval,args.profile)
 
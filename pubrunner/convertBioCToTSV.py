@@ -1,9 +1,13 @@
 import argparse
-import bioc
 import codecs
+from pubrunner.biocreader import iterparseLeanBiocDocuments,BiocFields
+
+# Only the metadata and abstract passages are read from each document
+tsvBiocFields = BiocFields(documentInfons=['pmid','year','title'],passageInfons=['section'],sections=['abstract'])
 
 def convertBioC2TSV(biocFilename,tsvFilename):
-	with bioc.iterparse(biocFilename) as inBioC, codecs.open(tsvFilename,'w','utf-8') as outTSV:
+	inBioC = iterparseLeanBiocDocuments(biocFilename,tsvBiocFields)
+	with codecs.open(tsvFilename,'w','utf-8') as outTSV:
 		# Output the headers to the TSV file
 		headers = ['pmid','year','title','abstract']
 		outTSV.write("\t".join(headers) + "\n")
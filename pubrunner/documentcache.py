@@ -0,0 +1,77 @@
+import os
+import json
+from pubrunner.compression import openOutputFile,openInputFile
+from pubrunner.inputfiles import isVirtualFile
+
+# The documents extracted from a Pubmed XML file by processMedlineFile can be cached while the file is hashed (by
+# pubmed_hash) so that the conversion doesn't have to parse the XML again. They are cached as gzipped JSON lines in
+# a hidden file next to the XML file, e.g. .pubmed18n0001.xml.documents.jsonl.gz, with a first line that records
+# the size and modification time of the XML file so that a cache for an older version of the file isn't used. The
+# version is changed whenever processMedlineFile extracts anything differently so that old caches aren't used either
+documentCacheVersion = 1
+
+def getDocumentCacheFilename(filename):
+	return os.path.join(os.path.dirname(filename), '.' + os.path.basename(filename) + '.documents.jsonl.gz')
+
+def getDocumentCacheHeader(filename):
+	return {'version':documentCacheVersion, 'size':os.path.getsize(filename), 'mtime':os.path.getmtime(filename)}
+
+def hasDocumentCache(filename):
+	# Archive members (and groups or already read contents of them) aren't cached
+	if not isinstance(filename,str) or isVirtualFile(filename):
+		return False
+
+	cacheFilename = getDocumentCacheFilename(filename)
+	if not os.path.isfile(cacheFilename):
+		return False
+
+	try:
+		with openInputFile(cacheFilename) as f:
+			header = json.loads(f.readline())
+	except (OSError,EOFError,ValueError):
+		return False
+	return header == getDocumentCacheHeader(filename)
+
+def iterCachedDocuments(filename,idFilter=None):
+	with openInputFile(getDocumentCacheFilename(filename)) as f:
+		f.readline()
+		for line in f:
+			doc = json.loads(line)
+			if idFilter is None or doc['pmid'] in idFilter:
+				yield doc
+
+# Loads the cached documents of a file (that are in the idFilter) or returns None if there isn't a cache for it
+def loadCachedDocuments(filename,idFilter=None):
+	if not hasDocumentCache(filename):
+		return None
+	return iterCachedDocuments(filename,idFilter)
+
+# Writes the cache for a file to a temporary file that replaces any existing cache once it is complete. The
+# temporary file is named by the process so that two processes caching the same file don't clash
+class DocumentCacheWriter:
+	def __init__(self,filename):
+		self.cacheFilename = getDocumentCacheFilename(filename)
+		self.tempFilename = os.path.join(os.path.dirname(self.cacheFilename), '.%d%s' % (os.getpid(),os.path.basename(self.cacheFilename)))
+
+		self.outFile = openOutputFile(self.tempFilename)
+		self.write(getDocumentCacheHeader(filename))
+
+	def write(self,doc):
+		self.outFile.write(json.dumps(doc,ensure_ascii=False).encode('utf-8'))
+		self.outFile.write(b'\n')
+
+	def close(self):
+		self.outFile.close()
+		os.replace(self.tempFilename,self.cacheFilename)
+
+	# Drops the incomplete cache (e.g. if parsing the file fails)
+	def discard(self):
+		self.outFile.close()
+		os.remove(self.tempFilename)
+
+# Opens a cache writer for a file or returns None if the directory isn't writeable (so the documents aren't cached)
+def openDocumentCacheWriter(filename):
+	try:
+		return DocumentCacheWriter(filename)
+	except OSError:
+		return None
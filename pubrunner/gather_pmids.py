@@ -1,10 +1,298 @@
 import argparse
 import os
 import json
+import heapq
+import itertools
 from collections import defaultdict
 import pubrunner
+from pubrunner.hashstore import isHashStore,HashStore,truncatableDigestAlgorithms
+from pubrunner.pubmed_hash import fingerprintFields
+from pubrunner.pmidstate import loadPMIDState,removePMIDState,PMIDStateWriter,writeUpdatedPMIDState,digestHashValue,packPMIDs
 
-def gatherPMIDs(inHashDir,outPMIDDir,whichHashes=None,pmidExclusions=None):
+# The JSON hash files (from older versions of pubmed_hash) have full MD5 digests
+jsonDigestSize = 16
+
+def getDigest(filename):
+	if not isHashStore(filename):
+		return 'md5',jsonDigestSize
+	with HashStore(filename) as store:
+		return store.digestAlgorithm,store.digestSize
+
+# The hash files can be a mix of binary (with shorter digests) and JSON files, so MD5 digests are compared at the
+# shortest size across all of them. Digests from different algorithms (or sizes of them) can't be compared at all
+def getComparableDigest(files):
+	digests = set( getDigest(filename) for filename in files )
+	comparableDigests = set( (algorithm, None if algorithm in truncatableDigestAlgorithms else digestSize) for algorithm,digestSize in digests )
+	if len(comparableDigests) > 1:
+		raise RuntimeError("The Pubmed hash files were made with different digests (%s) so can't be compared. They need to be regenerated with the same digest" % ", ".join( "%s-%d" % (algorithm,8*digestSize) for algorithm,digestSize in sorted(digests) ))
+
+	if not digests:
+		return 'md5',jsonDigestSize
+	return min(digests)
+
+# A shorthand in the usePubmedHashes option for the fingerprint of the whole citation
+hashAliases = {'fingerprint':['rawArticle']}
+
+def expandHashAliases(whichHashes):
+	if whichHashes is None:
+		return None
+	return [ field for h in whichHashes for field in hashAliases.get(h,[h]) ]
+
+def getSelectedFields(fields,whichHashes):
+	if whichHashes is None:
+		return sorted(fields)
+	for h in whichHashes:
+		if not h in fields:
+			hint = " The fingerprints are only there when the hashes are generated with the fingerprint hash mode (pubmedHashMode: fingerprint for the resource)." if h in fingerprintFields else ""
+			raise RuntimeError("The selected hash (%s) from the 'usePubmedHashes' option has not been found in the hash files.%s" % (repr(h),hint))
+	return whichHashes
+
+# Iterates through the PMIDs of a section of a hash store (in ascending order) with their hash values. Each value is
+# the selected digests (truncated to digestSize bytes) joined together
+def iterSectionHashValues(section,fields,storeDigestSize,digestSize):
+	selectedDigests = [ section.digests[field] for field in fields ]
+	for i,pmid in enumerate(section.pmids):
+		start = i*storeDigestSize
+		yield pmid, b''.join( bytes(digests[start:start+digestSize]) for digests in selectedDigests )
+
+# Opens the hashes of each source file in a hash file as a stream of PMIDs (in ascending order) and their hash values.
+# Hash stores are read through their memory maps (and are added to openStores to be closed later). JSON hash files
+# have to be loaded and sorted in memory, one file at a time
+def openHashStreams(filename,whichHashes,digestSize,openStores):
+	sourceStreams = {}
+	if isHashStore(filename):
+		store = HashStore(filename)
+		openStores.append(store)
+		fields = getSelectedFields(store.fields,whichHashes)
+		for section in store.sections:
+			sourceStreams[section.source] = iterSectionHashValues(section,fields,store.digestSize,digestSize)
+	else:
+		with open(filename) as f:
+			allHashes = json.load(f)
+		emptyDigest = b'\0' * digestSize
+		for source,pmidHashes in allHashes.items():
+			pmidValues = []
+			for pmid,hashes in pmidHashes.items():
+				fields = getSelectedFields(hashes.keys(),whichHashes)
+				value = b''.join( bytes.fromhex(hashes[field])[:digestSize] or emptyDigest for field in fields )
+				pmidValues.append((int(pmid),value))
+			sourceStreams[source] = iter(sorted(pmidValues))
+	return sourceStreams
+
+# Tags each item of a stream with the position of its source file, so that the merged stream has the versions of
+# each PMID in source file order
+def tagStream(stream,sourceIndex):
+	for pmid,hashVal in stream:
+		yield pmid,sourceIndex,hashVal
+
+# The PMIDs for each output file are buffered and appended to it in batches, so that the files don't all need to be
+# open at once (there are more Pubmed files than the usual limit on open files). They are written to temporary files
+# that only replace the output files once all of them are complete, so a failed run leaves the previous outputs alone
+pmidBufferSize = 1000000
+
+def getTempFilename(filename):
+	return os.path.join(os.path.dirname(filename),'.%d%s' % (os.getpid(),os.path.basename(filename)))
+
+class PMIDOutputs:
+	def __init__(self,outNames,pmidExclusions):
+		self.outNames = outNames
+		self.pmidExclusions = pmidExclusions
+		self.buffers = defaultdict(list)
+		self.bufferedCount = 0
+
+		# Two source files with the same name share an output file, which is for the later one
+		self.outNameToSourceIndex = { outName:sourceIndex for sourceIndex,outName in enumerate(outNames) }
+
+		self.tempNames = { outName:getTempFilename(outName) for outName in outNames }
+		for tempName in self.tempNames.values():
+			open(tempName,'w').close()
+
+	def add(self,sourceIndex,pmid):
+		if self.outNameToSourceIndex[self.outNames[sourceIndex]] != sourceIndex:
+			return
+		if not self.pmidExclusions is None and pmid in self.pmidExclusions:
+			return
+
+		self.buffers[sourceIndex].append(pmid)
+		self.bufferedCount += 1
+		if self.bufferedCount >= pmidBufferSize:
+			self.flush()
+
+	def flush(self):
+		for sourceIndex,pmids in sorted(self.buffers.items()):
+			with open(self.tempNames[self.outNames[sourceIndex]],'a') as f:
+				f.write("".join( "%d\n" % pmid for pmid in pmids ))
+		self.buffers.clear()
+		self.bufferedCount = 0
+
+	# Moves the complete files into place and returns their signatures. An output file that hasn't changed is kept as
+	# it is so that its modified date stays the same
+	def finish(self):
+		self.flush()
+		signatures = {}
+		for outName,tempName in sorted(self.tempNames.items()):
+			sha256 = pubrunner.calcSHA256(tempName)
+			if os.path.isfile(outName) and pubrunner.calcSHA256(outName) == sha256:
+				os.remove(tempName)
+			else:
+				os.replace(tempName,outName)
+			signatures[os.path.basename(outName)] = [os.path.getsize(outName),sha256]
+		return signatures
+
+	def discard(self):
+		for tempName in self.tempNames.values():
+			if os.path.isfile(tempName):
+				os.remove(tempName)
+
+# What has to match for a previous state to be used, as the hash values depend on them
+def getStateSettings(whichHashes,digestAlgorithm,digestSize):
+	return {'whichHashes':whichHashes, 'digestAlgorithm':digestAlgorithm, 'digestSize':digestSize}
+
+def getHashFileSignature(filename):
+	return [os.path.getsize(filename),os.path.getmtime(filename)]
+
+# The output files are checked against their contents as the modified dates of unchanged ones are kept
+def getOutputSignature(filename):
+	return [os.path.getsize(filename),pubrunner.calcSHA256(filename)]
+
+def getOutNames(outPMIDDir,sources):
+	return [ os.path.join(outPMIDDir,os.path.basename(source)+'.pmids') for source in sources ]
+
+def readPMIDFile(filename):
+	with open(filename) as f:
+		return set( int(line) for line in f if line.strip() )
+
+# Applies the hash files that have been added since the last run to its state, so that only the new hashes need to
+# be read and only the PMID files that change are rewritten. This can only be done if the new hash files are for new
+# source files that come after all the previous ones (as the daily Pubmed update files do) and nothing else has
+# changed, including the output files (which won't match the state if a run stopped part of the way through writing
+# them). Returns False if it can't be done (and everything has to be gathered again)
+def gatherPMIDsIncrementally(files,outPMIDDir,whichHashes,digestAlgorithm,digestSize,pmidExclusions):
+	state = loadPMIDState(outPMIDDir)
+	if state is None:
+		return False
+
+	with state:
+		metadata = state.metadata
+		if metadata['settings'] != getStateSettings(whichHashes,digestAlgorithm,digestSize):
+			return False
+
+		# The hash files that were already applied must not have changed
+		appliedFiles = metadata['hashFiles']
+		currentFiles = { os.path.basename(filename):filename for filename in files }
+		for name,signature in appliedFiles.items():
+			if not name in currentFiles or getHashFileSignature(currentFiles[name]) != signature:
+				return False
+		newFiles = [ filename for filename in files if not os.path.basename(filename) in appliedFiles ]
+
+		sources = metadata['sources']
+		outNames = getOutNames(outPMIDDir,sources)
+		outputSignatures = metadata.get('outputs',{})
+		for outName in set(outNames):
+			if not os.path.isfile(outName) or getOutputSignature(outName) != outputSignatures.get(os.path.basename(outName)):
+				return False
+
+		openStores = []
+		try:
+			hashStreams = {}
+			for filename in newFiles:
+				hashStreams.update(openHashStreams(filename,whichHashes,digestSize,openStores))
+			newSources = sorted(hashStreams.keys())
+			newOutNames = getOutNames(outPMIDDir,newSources)
+
+			if newSources and sources and newSources[0] <= sources[-1]:
+				return False
+			if len(set(newOutNames)) != len(newOutNames) or set(newOutNames).intersection(outNames):
+				return False
+
+			# Each PMID in the new source files is checked against the version it had in the state. The changes are
+			# the PMIDs that now belong to a new source file
+			changes = []
+			mergedStream = heapq.merge(*[ tagStream(hashStreams[source],len(sources)+i) for i,source in enumerate(newSources) ])
+			for pmid,group in itertools.groupby(mergedStream,key=lambda item: item[0]):
+				i = state.find(pmid)
+				if i is None:
+					previousOwner,owner,value = None,None,None
+				else:
+					previousOwner,owner,value = state.owners[i],state.owners[i],state.getValue(i)
+
+				for _,sourceIndex,hashVal in group:
+					valueDigest = digestHashValue(hashVal)
+					if valueDigest != value:
+						owner,value = sourceIndex,valueDigest
+
+				if owner != previousOwner:
+					changes.append((pmid,i,owner,value))
+		finally:
+			for store in openStores:
+				store.close()
+
+		allSources = sources + newSources
+		allOutNames = outNames + newOutNames
+		outNameToSourceIndex = { outName:sourceIndex for sourceIndex,outName in enumerate(allOutNames) }
+
+		exclusions = sorted(pmidExclusions) if pmidExclusions is not None else []
+		excluded = set(exclusions)
+
+		# The PMIDs to add to and remove from the file of each source
+		additions = defaultdict(set)
+		removals = defaultdict(set)
+		newOwners = {}
+		for pmid,i,owner,_ in changes:
+			if i is not None:
+				removals[state.owners[i]].add(pmid)
+			if not pmid in excluded:
+				additions[owner].add(pmid)
+			newOwners[pmid] = owner
+
+		exclusionsChanged = packPMIDs(exclusions) != state.exclusionBytes
+		if not newFiles and not exclusionsChanged:
+			print("No new hash files to apply to the previous PMID state")
+			return True
+
+		# PMIDs that have been newly excluded are removed from their files and ones that are no longer excluded are added back
+		if exclusionsChanged:
+			previousExcluded = set(state.exclusions)
+			for pmid in excluded.symmetric_difference(previousExcluded):
+				owner = newOwners.get(pmid)
+				if owner is None:
+					i = state.find(pmid)
+					if i is None:
+						continue
+					owner = state.owners[i]
+
+				if pmid in excluded:
+					removals[owner].add(pmid)
+				else:
+					additions[owner].add(pmid)
+
+		outputSignatures = dict(outputSignatures)
+		for sourceIndex in sorted(set(additions.keys()).union(removals.keys()).union(range(len(sources),len(allSources)))):
+			outName = allOutNames[sourceIndex]
+			if outNameToSourceIndex[outName] != sourceIndex:
+				continue
+
+			previousPMIDs = readPMIDFile(outName) if os.path.isfile(outName) else None
+			pmids = (previousPMIDs or set()).difference(removals[sourceIndex]).union(additions[sourceIndex])
+			if pmids != previousPMIDs:
+				tempName = getTempFilename(outName)
+				with open(tempName,'w') as f:
+					f.write("".join( "%d\n" % pmid for pmid in sorted(pmids) ))
+				os.replace(tempName,outName)
+				outputSignatures[os.path.basename(outName)] = getOutputSignature(outName)
+
+		metadata = dict(metadata)
+		metadata['outputs'] = outputSignatures
+		metadata['hashFiles'] = dict(appliedFiles)
+		for filename in newFiles:
+			metadata['hashFiles'][os.path.basename(filename)] = getHashFileSignature(filename)
+		metadata['sources'] = allSources
+		writeUpdatedPMIDState(outPMIDDir,state,changes,metadata,exclusions)
+
+	print("Applied %d new hash file(s) to the previous PMID state (%d PMIDs changed)" % (len(newFiles),len(changes)))
+	return True
+
+def gatherPMIDs(inHashDir,outPMIDDir,whichHashes=None,pmidExclusions=None,incremental=True):
 	# Check the age of inHashDir files and outPMIDDir files and check if anything is actually needed
 	#if os.path.isdir(outPMIDDir):
 	#	inHashDir_modifieds = [ os.path.getmtime(os.path.join(root,f)) for root, dir, files in os.walk(inHashDir) for f in files ]
@@ -15,64 +303,61 @@ def gatherPMIDs(inHashDir,outPMIDDir,whichHashes=None,pmidExclusions=None):
 	#		print("No PMID update necessary")
 	#		return
 
-	files = sorted([ os.path.join(inHashDir,f) for f in os.listdir(inHashDir) ])
-	hashes = {}
-	for filename in files:
-		with open(filename) as f:
-			tmpHashes = json.load(f)
-			hashes.update(tmpHashes)
-
-	pmidHashes = defaultdict(list)
-	pmidToFilename = {}
-	for filename in sorted(hashes.keys()):
-		for pmid in hashes[filename].keys():
-			if whichHashes is None:
-				hashVal = hashes[filename][pmid]
-			else:
-				try:
-					hashVal = [ hashes[filename][pmid][h] for h in whichHashes ]
-				except KeyError as e:
-					raise RuntimeError("The selected hash (%s) from the 'usePubmedHashes' option has not been found in the hash files." % (str(e)))
-
-			pmidInt = int(pmid)
-			if pmidHashes[pmidInt] != hashVal:
-				pmidHashes[pmidInt] = hashVal
-				pmidToFilename[pmidInt] = filename
+	files = sorted([ os.path.join(inHashDir,f) for f in os.listdir(inHashDir) if not f.startswith('.') ])
 
-	filenameToPMIDs = defaultdict(list)
-	for pmid,filename in pmidToFilename.items():
-		filenameToPMIDs[filename].append(pmid)
+	whichHashes = expandHashAliases(whichHashes)
+	digestAlgorithm,digestSize = getComparableDigest(files)
 
 	if not os.path.isdir(outPMIDDir):
 		os.makedirs(outPMIDDir)
 
-	for filename in sorted(hashes.keys()):
-		basename = os.path.basename(filename)
-		outName = os.path.join(outPMIDDir,basename+'.pmids')
-		pmids = sorted(filenameToPMIDs[filename])
+	if incremental and gatherPMIDsIncrementally(files,outPMIDDir,whichHashes,digestAlgorithm,digestSize,pmidExclusions):
+		return
+
+	openStores = []
+	outputs = None
+	stateWriter = PMIDStateWriter(outPMIDDir)
+	try:
+		# A source file in a later hash file replaces the same one in an earlier hash file
+		hashStreams = {}
+		for filename in files:
+			hashStreams.update(openHashStreams(filename,whichHashes,digestSize,openStores))
+		sources = sorted(hashStreams.keys())
+		outNames = getOutNames(outPMIDDir,sources)
 
-		if not pmidExclusions is None:
-			pmids = [ pmid for pmid in pmids if not pmid in pmidExclusions ]
-		
-		fileAlreadyExists = os.path.isfile(outName)
-		if fileAlreadyExists:
-			timestamp = os.path.getmtime(outName)
-			beforeHash = pubrunner.calcSHA256(outName)
+		# The sorted streams of every source file are merged so that all the versions of a PMID come together (in
+		# source file order). A PMID belongs to the latest source file where its selected hashes changed
+		outputs = PMIDOutputs(outNames,pmidExclusions)
+		mergedStream = heapq.merge(*[ tagStream(hashStreams[source],sourceIndex) for sourceIndex,source in enumerate(sources) ])
+		for pmid,group in itertools.groupby(mergedStream,key=lambda item: item[0]):
+			currentHash,currentSourceIndex = None,None
+			for _,sourceIndex,hashVal in group:
+				if hashVal != currentHash:
+					currentHash,currentSourceIndex = hashVal,sourceIndex
+			outputs.add(currentSourceIndex,pmid)
+			stateWriter.add(pmid,currentSourceIndex,digestHashValue(currentHash))
+	except:
+		if outputs is not None:
+			outputs.discard()
+		stateWriter.discard()
+		raise
+	finally:
+		for store in openStores:
+			store.close()
 
-		with open(outName,'w') as f:
-			for pmid in pmids:
-				f.write("%d\n" % pmid)
+	# The previous state no longer matches the outputs once any of them are replaced
+	removePMIDState(outPMIDDir)
+	outputSignatures = outputs.finish()
 
-		if fileAlreadyExists:
-			afterHash = pubrunner.calcSHA256(outName)
-			if beforeHash == afterHash: # File hasn't changed so move the modified date back
-				os.utime(outName,(timestamp,timestamp))
+	metadata = {'settings':getStateSettings(whichHashes,digestAlgorithm,digestSize), 'hashFiles':{ os.path.basename(filename):getHashFileSignature(filename) for filename in files }, 'sources':sources, 'outputs':outputSignatures}
+	stateWriter.finish(metadata,sorted(pmidExclusions) if pmidExclusions is not None else [])
 
 def main():
 	parser = argparse.ArgumentParser('Use a set of Pubmed hashes to generate the list of PMIDs that should be processed for each file')
-	parser.add_argument('--hashDir',required=True,type=str,help='Directory containing hash JSON files')
-	parser.add_argument('--whichHashes',type=str,help='Comma-delimited list of which hashes to use')
+	parser.add_argument('--hashDir',required=True,type=str,help='Directory containing hash files (in the binary or JSON format)')
+	parser.add_argument('--whichHashes',type=str,help='Comma-delimited list of which hashes to use (e.g. title,abstract or rawArticle for the fingerprints)')
 	parser.add_argument('--outDir',required=True,type=str,help='Directory to output PMID lists')
+	parser.add_argument('--rebuild',action='store_true',help='Go through all the hashes again instead of only applying new hash files to the state from the last run')
 	args = parser.parse_args()
 
 	if args.whichHashes:
@@ -80,7 +365,7 @@ def main():
 	else:
 		whichHashes = None
 
-	gatherPMIDs(args.hashDir,args.outDir,whichHashes)
+	gatherPMIDs(args.hashDir,args.outDir,whichHashes,incremental=not args.rebuild)
 
 
 
@@ -16,6 +16,7 @@ import requests
 import datetime
 import time
 import re
+from pubrunner.inputfiles import isArchive,stripCompressionSuffix
 
 def calcSHA256(filename):
 	return hashlib.sha256(open(filename, 'rb').read()).hexdigest()
@@ -52,7 +53,7 @@ def downloadFTP(path,out,host,fileSuffixFilter=None,tries=5):
 				if not checkFileSuffixFilter(path,fileSuffixFilter):
 					doDownload = False
 
-				if os.path.isdir(out):
+				if os.path.isfile(out):
 					localTimestamp = os.path.getmtime(out)
 					if not remoteTimestamp > localTimestamp:
 						doDownload = False
@@ -152,9 +153,17 @@ def chunks(l, n):
 		yield l[i:i + n]
 
 
-def generatePubmedHashes(inDir,outDir):
+def generatePubmedHashes(inDir,outDir,cacheDocuments=False,digestAlgorithm=None,workers=None,hashMode=None):
 	snakeFile = os.path.join(pubrunner.__path__[0],'Snakefiles','PubmedHashes.py')
 	parameters = {'INDIR':inDir,'OUTDIR':outDir}
+	if cacheDocuments:
+		parameters['CACHEDOCUMENTS'] = '1'
+	if digestAlgorithm is not None:
+		parameters['DIGEST'] = digestAlgorithm
+	if workers is not None:
+		parameters['WORKERS'] = str(workers)
+	if hashMode is not None:
+		parameters['HASHMODE'] = hashMode
 	pubrunner.launchSnakemake(snakeFile,parameters=parameters)
 	
 def getResourceInfo(resource):
@@ -229,10 +238,16 @@ def getResource(resource):
 			assert isinstance(url,six.string_types), 'Each URL for the dir resource must be a string'
 			download(url,os.path.join(thisResourceDir,basename),fileSuffixFilter)
 
-		if 'unzip' in resourceInfo and resourceInfo['unzip'] == True:
+		# Archives can be kept compressed as the converters can read .gz files and stream the members of .tar.gz files
+		keepCompressed = 'keepCompressed' in resourceInfo and resourceInfo['keepCompressed'] == True
+
+		if 'unzip' in resourceInfo and resourceInfo['unzip'] == True and not keepCompressed:
 			print("  Unzipping archives...")
 			for filename in os.listdir(thisResourceDir):
-				if filename.endswith('.tar.gz') or filename.endswith('.tgz'):
+				# Hidden files are our own caches (e.g. gzipped documents cached while hashing Pubmed files)
+				if filename.startswith('.'):
+					continue
+				elif filename.endswith('.tar.gz') or filename.endswith('.tgz'):
 					tar = tarfile.open(os.path.join(thisResourceDir,filename), "r:gz")
 					tar.extractall(thisResourceDir)
 					tar.close()
@@ -244,7 +259,16 @@ def getResource(resource):
 			print("  Removing files not matching filter (%s)..." % fileSuffixFilter)
 			for root, subdirs, files in os.walk(thisResourceDir):
 				for f in files:
-					if not f.endswith(fileSuffixFilter):
+					# Hidden files are left alone (e.g. cached offsets for Pubmed files)
+					if f.startswith('.'):
+						continue
+					elif keepCompressed:
+						# The filter then applies to the members of archives and to compressed files without the .gz
+						matchesFilter = isArchive(f) or stripCompressionSuffix(f).endswith(fileSuffixFilter)
+					else:
+						matchesFilter = f.endswith(fileSuffixFilter)
+
+					if not matchesFilter:
 						fullpath = os.path.join(root,f)
 						os.unlink(fullpath)
 
@@ -254,7 +278,19 @@ def getResource(resource):
 			if not os.path.isdir(hashDir):
 				os.makedirs(hashDir)
 
-			generatePubmedHashes(thisResourceDir,hashDir)
+			# Citations can be fingerprinted from their raw XML instead of hashing their extracted fields (for the rawArticle,
+			# rawTitle and rawAbstract values of usePubmedHashes)
+			hashMode = resourceInfo.get('pubmedHashMode')
+
+			# The documents extracted while hashing can be cached for the conversion so that each file is only parsed
+			# once (but they aren't extracted for fingerprints). This is off unless a resource sets it, as a cached file
+			# is converted whole rather than split into byte ranges across the conversion workers
+			cacheDocuments = resourceInfo.get('cachePubmedDocuments') == True and hashMode != 'fingerprint'
+
+			# The digest has to stay the same once there are hashes (or they all have to be regenerated)
+			digestAlgorithm = resourceInfo.get('pubmedHashDigest')
+			workers = resourceInfo.get('pubmedHashWorkers')
+			generatePubmedHashes(thisResourceDir,hashDir,cacheDocuments,digestAlgorithm,workers,hashMode)
 
 		#generateFileListing(thisResourceDir)
 
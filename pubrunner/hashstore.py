@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+
+# A compact binary alternative to the JSON .hashes files from pubmed_hash. Each file holds one or more sections (one
+# per Pubmed XML file) with a sorted array of PMIDs followed by a fixed-width digest of each field for every PMID, so
+# that a file can be memory mapped and read without parsing. The digests are a hash of each field (MD5 truncated to
+# the digest size, or another digest algorithm of that size) with all zero bytes for a missing field (an empty hash in
+# the JSON files). The digest algorithm is recorded so that files hashed with different ones aren't compared.
+#
+# Layout (little-endian, every array starts on an 8 byte boundary so it can be viewed directly, e.g. with
+# numpy.frombuffer(mm, dtype='<u8', count=count, offset=pmidsOffset)):
+#   header:   magic (8 bytes), version (u32), digest size (u32), field count (u32), section count (u32)
+#   digest:   name length (u16) and name of the digest algorithm, padded to 8 bytes (not in version 1 files, which
+#             are all MD5)
+#   fields:   name length (u16) and UTF-8 name for each field, padded to 8 bytes
+#   sections: source filename length (u16) and UTF-8 filename, padded to 8 bytes, PMID count (u64),
+#             PMIDs (u64 each, ascending) and then for each field in order the digests (digest size bytes each)
+
+hashStoreMagic = b'PMHASHES'
+hashStoreVersion = 2
+
+# 64 bit digests are plenty to tell if one field of a citation has changed between versions of it
+defaultDigestSize = 8
+allowedDigestSizes = [8,16]
+
+headerStruct = struct.Struct('<8sIIII')
+lengthStruct = struct.Struct('<H')
+countStruct = struct.Struct('<Q')
+
+# MD5 digests can be truncated to any size and still be compared, but the other algorithms give different digests
+# for each size
+truncatableDigestAlgorithms = ['md5']
+
+def isHashStore(filename):
+	with open(filename,'rb') as f:
+		return f.read(len(hashStoreMagic)) == hashStoreMagic
+
+def padding(size):
+	return b'\0' * (-size % 8)
+
+def encodeName(name):
+	encoded = name.encode('utf-8')
+	return lengthStruct.pack(len(encoded)) + encoded
+
+# A raw MD5 digest (as calculated by pubmed_hash) cut down to the digest size, or zeros if there isn't one
+def truncateDigest(digest,digestSize):
+	return digest[:digestSize] if digest else b'\0' * digestSize
+
+# Writes the hashes of each source file, given as (sourceFilename, {pmid: {field: digest}}), to a hash store
+def writeHashStore(filename,sections,fields,digestSize=defaultDigestSize,digestAlgorithm='md5'):
+	if not digestSize in allowedDigestSizes:
+		raise RuntimeError("The digest size must be one of %s bytes, not %d" % (str(allowedDigestSizes),digestSize))
+
+	with open(filename,'wb') as f:
+		f.write(headerStruct.pack(hashStoreMagic,hashStoreVersion,digestSize,len(fields),len(sections)))
+
+		encodedAlgorithm = encodeName(digestAlgorithm)
+		f.write(encodedAlgorithm + padding(len(encodedAlgorithm)))
+
+		encodedFields = b''.join( encodeName(field) for field in fields )
+		f.write(encodedFields + padding(len(encodedFields)))
+
+		for sourceFilename,pmidHashes in sections:
+			encodedSource = encodeName(sourceFilename)
+			f.write(encodedSource + padding(len(encodedSource)))
+
+			pmids = sorted(pmidHashes.keys())
+			f.write(countStruct.pack(len(pmids)))
+			f.write(struct.pack('<%dQ' % len(pmids),*pmids))
+			for field in fields:
+				digests = b''.join( truncateDigest(pmidHashes[pmid].get(field),digestSize) for pmid in pmids )
+				f.write(digests + padding(len(digests)))
+
+class HashStoreSection:
+	def __init__(self,source,count,pmids,digests):
+		self.source = source
+		self.count = count
+		self.pmids = pmids
+		self.digests = digests
+
+# Reads a hash store through a memory map. The PMIDs of each section are a memoryview of unsigned 64 bit integers and
+# the digests of each field are a memoryview of count*digestSize bytes
+class HashStore:
+	def __init__(self,filename):
+		self.filename = filename
+		self.file = open(filename,'rb')
+		self.mm = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+		self.view = memoryview(self.mm)
+
+		magic,version,self.digestSize,fieldCount,sectionCount = headerStruct.unpack_from(self.mm,0)
+		if magic != hashStoreMagic:
+			raise RuntimeError("Not a Pubmed hash store: %s" % filename)
+		if not version in [1,hashStoreVersion]:
+			raise RuntimeError("Unsupported version (%d) of Pubmed hash store: %s" % (version,filename))
+
+		pos = headerStruct.size
+		self.digestAlgorithm = 'md5'
+		if version >= 2:
+			start = pos
+			self.digestAlgorithm,pos = self.readName(pos)
+			pos += -(pos-start) % 8
+
+		self.fields = []
+		start = pos
+		for _ in range(fieldCount):
+			name,pos = self.readName(pos)
+			self.fields.append(name)
+		pos += -(pos-start) % 8
+
+		self.sections = []
+		for _ in range(sectionCount):
+			start = pos
+			source,pos = self.readName(pos)
+			pos += -(pos-start) % 8
+
+			count, = countStruct.unpack_from(self.mm,pos)
+			pos += countStruct.size
+			pmids = self.view[pos:pos+8*count]
+			pmids = pmids.cast('Q') if sys.byteorder == 'little' else struct.unpack('<%dQ' % count,pmids)
+			pos += 8*count
+
+			digests = {}
+			for field in self.fields:
+				size = count*self.digestSize
+				digests[field] = self.view[pos:pos+size]
+				pos += size + (-size % 8)
+
+			self.sections.append(HashStoreSection(source,count,pmids,digests))
+
+	def readName(self,pos):
+		length, = lengthStruct.unpack_from(self.mm,pos)
+		pos += lengthStruct.size
+		return bytes(self.mm[pos:pos+length]).decode('utf-8'),pos+length
+
+	def close(self):
+		# The views into the memory map have to be released before it can be closed
+		for section in self.sections:
+			if isinstance(section.pmids,memoryview):
+				section.pmids.release()
+			for digests in section.digests.values():
+				digests.release()
+		self.sections = []
+		self.view.release()
+		self.mm.close()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+# Converts a JSON .hashes file (from an older pubmed_hash) to a hash store
+def convertJSONToHashStore(jsonFilename,outFilename,digestSize=defaultDigestSize):
+	with open(jsonFilename) as f:
+		allHashes = json.load(f)
+
+	fields = sorted(set( field for pmidHashes in allHashes.values() for hashes in pmidHashes.values() for field in hashes.keys() ))
+
+	sections = []
+	for sourceFilename in sorted(allHashes.keys()):
+		pmidHashes = {}
+		for pmid,hashes in allHashes[sourceFilename].items():
+			pmidHashes[int(pmid)] = { field:bytes.fromhex(hexDigest) for field,hexDigest in hashes.items() }
+		sections.append((sourceFilename,pmidHashes))
+
+	writeHashStore(outFilename,sections,fields,digestSize)
+
+# Converts JSON hash files to hash stores in place (keeping the filenames and modification times so that Snakemake
+# doesn't see them as changed). Files that are already hash stores are left alone
+def convertHashFiles(filenames,digestSize=defaultDigestSize):
+	converted = 0
+	for filename in filenames:
+		if isHashStore(filename):
+			continue
+
+		timestamp = os.path.getmtime(filename)
+		tempFilename = os.path.join(os.path.dirname(filename), '.%d%s' % (os.getpid(),os.path.basename(filename)))
+		convertJSONToHashStore(filename,tempFilename,digestSize)
+		os.utime(tempFilename,(timestamp,timestamp))
+		os.replace(tempFilename,filename)
+		converted += 1
+	return converted
+
+def main():
+	parser = argparse.ArgumentParser(description='Convert Pubmed hash files from the old JSON format to the compact binary format (in place)')
+	parser.add_argument('--hashes',required=True,type=str,help='Comma-delimited hash files or directories of hash files to convert')
+	parser.add_argument('--digestBits',type=int,default=8*defaultDigestSize,help='Size of the stored digests in bits (64 or 128)')
+	args = parser.parse_args()
+
+	filenames = []
+	for location in args.hashes.split(','):
+		if os.path.isdir(location):
+			filenames += sorted( os.path.join(location,f) for f in os.listdir(location) if not f.startswith('.') )
+		else:
+			filenames.append(location)
+
+	converted = convertHashFiles(filenames,args.digestBits // 8)
+	print("Converted %d of %d hash files to the binary format" % (converted,len(filenames)))
+
+if __name__ == '__main__':
+	main()
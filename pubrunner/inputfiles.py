@@ -0,0 +1,140 @@
+import os
+import io
+import json
+import tarfile
+import pubrunner.compression
+import pubrunner.profiling as profiling
+from pubrunner.compression import openInputFile
+
+archiveSuffixes = ('.tar.gz','.tgz','.tar')
+compressionSuffixes = tuple(pubrunner.compression.compressionSuffixes.keys())
+
+# A member of an archive can be used as an input file without extracting it with a "virtual" filename
+# of the archive and member name, e.g. comm_use.A-B.xml.tar.gz::Cell_Rep/PMC1234567.nxml
+virtualFileSeparator = '::'
+
+def isArchive(filename):
+	return filename.endswith(archiveSuffixes)
+
+def isVirtualFile(filename):
+	return virtualFileSeparator in filename
+
+def makeVirtualFilename(archive,member):
+	return archive + virtualFileSeparator + member
+
+# Splits a virtual filename into the archive and member name. A normal filename has no member name (None)
+def splitVirtualFilename(filename):
+	if isVirtualFile(filename):
+		archive,member = filename.split(virtualFileSeparator,1)
+		return archive,member
+	else:
+		return filename,None
+
+# Removes any compression suffix so that the name can be compared to the expected file type (e.g. x.xml.gz -> x.xml)
+def stripCompressionSuffix(filename):
+	for suffix in archiveSuffixes + compressionSuffixes:
+		if filename.endswith(suffix):
+			return filename[:-len(suffix)]
+	return filename
+
+# The member names of an archive are cached in a hidden file next to it, e.g. .comm_use.A-B.xml.tar.gz.members,
+# as listing the members of a gzipped tar file means decompressing all of it
+def getMembersCacheFilename(archive):
+	return os.path.join(os.path.dirname(archive), '.' + os.path.basename(archive) + '.members')
+
+# Gets the names of the files in an archive (in the order they are stored) that have one of the memberSuffixes
+def listArchiveMembers(archive,memberSuffixes=None):
+	cacheFilename = getMembersCacheFilename(archive)
+	size,mtime = os.path.getsize(archive),os.path.getmtime(archive)
+
+	members = None
+	if os.path.isfile(cacheFilename):
+		try:
+			with open(cacheFilename) as f:
+				cache = json.load(f)
+			if cache['size'] == size and cache['mtime'] == mtime:
+				members = cache['members']
+		except (ValueError,KeyError):
+			pass
+
+	if members is None:
+		with tarfile.open(archive,'r|*') as tar:
+			members = [ member.name for member in tar if member.isfile() ]
+
+		try:
+			with open(cacheFilename,'w') as f:
+				json.dump({'size':size, 'mtime':mtime, 'members':members},f)
+		except OSError:
+			# The resource directory may not be writeable so just don't cache
+			pass
+
+	if memberSuffixes is not None:
+		members = [ m for m in members if m.endswith(memberSuffixes) ]
+
+	return members
+
+# Streams the members of an archive that are wanted (or all those with one of the memberSuffixes if wanted is None)
+def iterArchiveStreams(archive,wanted,memberSuffixes):
+	remaining = None if wanted is None else set(wanted)
+	with tarfile.open(archive,'r|*') as tar:
+		for member in tar:
+			if not member.isfile():
+				continue
+
+			if remaining is None:
+				if memberSuffixes is not None and not member.name.endswith(memberSuffixes):
+					continue
+			elif member.name in remaining:
+				remaining.remove(member.name)
+			else:
+				continue
+
+			profiling.addCount('inputBytes',member.size)
+			yield makeVirtualFilename(archive,member.name), tar.extractfile(member)
+
+			# Stop reading the archive once all the wanted members have been found
+			if remaining is not None and len(remaining) == 0:
+				break
+
+	if remaining:
+		raise RuntimeError("Couldn't find %d member(s) in archive %s, e.g. %s" % (len(remaining),archive,sorted(remaining)[0]))
+
+# The contents of an archive member that has already been read (e.g. to be sent to a worker process) with its virtual
+# filename. It can be used in place of the virtual filename as an input file
+class ArchiveMember:
+	def __init__(self,name,data):
+		self.name = name
+		self.data = data
+
+	def __str__(self):
+		return self.name
+
+# Reads each of the members of an archive input (a whole archive or a list of its virtual files) in a single pass
+def iterArchiveMembers(filename,memberSuffixes=None):
+	for name,stream in iterInputStreams(filename,memberSuffixes):
+		yield ArchiveMember(name,stream.read())
+
+# Yields a (name,file object) pair for each document file inside an input file. For a tar archive (e.g. the
+# PMCOA bulk packages), the members are streamed one after another without being extracted to disk and only
+# those with one of the memberSuffixes are used. A virtual filename (archive::member) streams just that member
+# and a list of virtual filenames from the same archive streams those members in a single pass in the order
+# that they are stored in the archive. A member that has already been read (ArchiveMember) is used from memory.
+# Any other file is used directly (decompressed if needed)
+def iterInputStreams(filename,memberSuffixes=None):
+	if isinstance(filename,ArchiveMember):
+		yield filename.name, io.BytesIO(filename.data)
+	elif isinstance(filename,list):
+		archives = set( splitVirtualFilename(f)[0] for f in filename )
+		assert len(archives) == 1 and all( isVirtualFile(f) for f in filename ), "A list of input files must all be members of the same archive"
+		for name,stream in iterArchiveStreams(archives.pop(), [ splitVirtualFilename(f)[1] for f in filename ], memberSuffixes):
+			yield name,stream
+	elif isVirtualFile(filename):
+		archive,member = splitVirtualFilename(filename)
+		for name,stream in iterArchiveStreams(archive, [member], memberSuffixes):
+			yield name,stream
+	elif isArchive(filename):
+		for name,stream in iterArchiveStreams(filename, None, memberSuffixes):
+			yield name,stream
+	else:
+		with openInputFile(filename) as f:
+			yield filename, f
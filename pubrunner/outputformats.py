@@ -0,0 +1,138 @@
+import jsonlines
+from pubrunner.compression import openOutputTextFile
+import pubrunner.profiling as profiling
+
+try:
+	import pyarrow
+	import pyarrow.ipc
+	import pyarrow.parquet
+except ImportError:
+	pyarrow = None
+
+# Number of documents in each record batch (and Parquet row group)
+recordBatchSize = 1000
+
+# Infons are written as strings (as in BioC) except for missing values which are left as null
+def infonValue(value):
+	return None if value is None else str(value)
+
+def biocDocumentToDict(biocDoc):
+	document = {'id':infonValue(biocDoc.id), 'infons':{}, 'passages':[]}
+	for k,v in biocDoc.infons.items():
+		document['infons'][k] = infonValue(v)
+	for passage in biocDoc.passages:
+		passageInfons = { k:infonValue(v) for k,v in passage.infons.items() }
+		document['passages'].append({'offset':passage.offset, 'infons':passageInfons, 'text':passage.text})
+	return document
+
+# Writes one JSON object per line for each document with its ID, infons and passages
+def writeDocumentsToJSONL(biocDocs, jsonlFilename, zstdDictionaryFilename=None):
+	with openOutputTextFile(jsonlFilename, zstdDictionaryFilename) as f, jsonlines.Writer(f) as writer:
+		for biocDoc in biocDocs:
+			with profiling.stage('encode'):
+				document = biocDocumentToDict(biocDoc)
+			writer.write(document)
+
+# Returns a function that writes documents as JSON lines to an open (binary) stream
+def openJSONLDocumentWriter(stream):
+	writer = jsonlines.Writer(stream)
+	def writeDocument(biocDoc):
+		with profiling.stage('encode'):
+			document = biocDocumentToDict(biocDoc)
+		writer.write(document)
+	return writeDocument
+
+def iterDocumentBatches(biocDocs, batchSize):
+	batch = []
+	for biocDoc in biocDocs:
+		batch.append(biocDoc)
+		if len(batch) == batchSize:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+# The columns are the document ID, one string column per document infon and a list of passages that have their
+# offset, text and one field per passage infon. The infon keys are taken from the first batch of documents
+# which works as every document from an input format has the same infons (with None for missing values)
+class ArrowDocumentSchema:
+	def __init__(self,biocDocs):
+		self.documentInfonKeys,self.passageInfonKeys = [],[]
+		for biocDoc in biocDocs:
+			self.addKeys(self.documentInfonKeys, biocDoc.infons.keys())
+			for passage in biocDoc.passages:
+				self.addKeys(self.passageInfonKeys, passage.infons.keys())
+
+		for k in self.documentInfonKeys:
+			if k in ['id','passages']:
+				raise RuntimeError("Document infon (%s) clashes with a column name for the output" % k)
+		for k in self.passageInfonKeys:
+			if k in ['offset','text']:
+				raise RuntimeError("Passage infon (%s) clashes with a column name for the output" % k)
+
+		passageFields = [ pyarrow.field('offset',pyarrow.int64()), pyarrow.field('text',pyarrow.string()) ]
+		passageFields += [ pyarrow.field(k,pyarrow.string()) for k in self.passageInfonKeys ]
+
+		fields = [ pyarrow.field('id',pyarrow.string()) ]
+		fields += [ pyarrow.field(k,pyarrow.string()) for k in self.documentInfonKeys ]
+		fields.append(pyarrow.field('passages',pyarrow.list_(pyarrow.struct(passageFields))))
+
+		self.schema = pyarrow.schema(fields)
+
+	@staticmethod
+	def addKeys(keys, newKeys):
+		for k in newKeys:
+			if not k in keys:
+				keys.append(k)
+
+	def checkKeys(self, keys, expectedKeys):
+		for k in keys:
+			if not k in expectedKeys:
+				raise RuntimeError("Unexpected infon (%s) that was not in the first documents written to the output" % k)
+
+	def toTable(self,biocDocs):
+		columns = { k:[] for k in ['id','passages'] + self.documentInfonKeys }
+		for biocDoc in biocDocs:
+			self.checkKeys(biocDoc.infons.keys(), self.documentInfonKeys)
+
+			columns['id'].append(infonValue(biocDoc.id))
+			for k in self.documentInfonKeys:
+				columns[k].append(infonValue(biocDoc.infons.get(k)))
+
+			passages = []
+			for passage in biocDoc.passages:
+				self.checkKeys(passage.infons.keys(), self.passageInfonKeys)
+
+				passageRow = {'offset':passage.offset, 'text':passage.text}
+				for k in self.passageInfonKeys:
+					passageRow[k] = infonValue(passage.infons.get(k))
+				passages.append(passageRow)
+			columns['passages'].append(passages)
+
+		return pyarrow.Table.from_pydict(columns, schema=self.schema)
+
+# Writes the documents in record batches using a writer (for Parquet or Arrow IPC) created once the schema is known
+def writeDocumentsWithArrow(biocDocs, outFilename, openWriter):
+	if pyarrow is None:
+		raise RuntimeError("The pyarrow package is required for the Parquet and Arrow output formats. Install it with: pip install pyarrow")
+
+	writer,documentSchema = None,None
+	for batch in iterDocumentBatches(biocDocs, recordBatchSize):
+		if writer is None:
+			documentSchema = ArrowDocumentSchema(batch)
+			writer = openWriter(outFilename, documentSchema.schema)
+		writer.write_table(documentSchema.toTable(batch))
+
+	# Still create the file if there were no documents
+	if writer is None:
+		documentSchema = ArrowDocumentSchema([])
+		writer = openWriter(outFilename, documentSchema.schema)
+
+	writer.close()
+
+def writeDocumentsToParquet(biocDocs, parquetFilename):
+	writeDocumentsWithArrow(biocDocs, parquetFilename, lambda filename,schema : pyarrow.parquet.ParquetWriter(filename, schema))
+
+# Uses the Arrow IPC file format (random access and can be memory-mapped)
+def writeDocumentsToArrow(biocDocs, arrowFilename):
+	writeDocumentsWithArrow(biocDocs, arrowFilename, lambda filename,schema : pyarrow.ipc.new_file(filename, schema))
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import mmap
+import struct
+import bisect
+import shutil
+import hashlib
+
+# The state kept by gatherPMIDs between runs so that new Pubmed update files can be applied without going through all
+# the hashes again. It is a hidden file in the PMID directory that records for every PMID the source file that it is
+# assigned to and a digest of its selected hashes in that file, along with the hash files that have been applied and
+# the PMIDs that were excluded from the outputs
+#
+# Layout (little-endian, each array starts on an 8 byte boundary so the file can be memory mapped):
+#   header:   magic (8 bytes), version (u32), padding (u32), metadata length (u64)
+#   metadata: JSON (with the settings, hash files, source files and the counts of the arrays), padded to 8 bytes
+#   arrays:   PMIDs (u64 each, ascending), source index of each PMID (u32 each), hash digest of each PMID (8 bytes
+#             each) and the excluded PMIDs (u64 each, ascending)
+
+pmidStateMagic = b'PMIDSTAT'
+pmidStateVersion = 1
+
+valueDigestSize = 8
+
+headerStruct = struct.Struct('<8sIIQ')
+
+def getPMIDStateFilename(outPMIDDir):
+	return os.path.join(outPMIDDir,'.pmids.state')
+
+# The selected hashes of a PMID are stored as a short digest as they can be any length
+def digestHashValue(hashVal):
+	return hashlib.blake2b(hashVal,digest_size=valueDigestSize).digest()
+
+def padding(size):
+	return b'\0' * (-size % 8)
+
+def packPMIDs(pmids):
+	return struct.pack('<%dQ' % len(pmids),*pmids)
+
+class PMIDState:
+	def __init__(self,filename):
+		self.filename = filename
+		self.file = open(filename,'rb')
+		try:
+			self.mm = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+		except ValueError: # An empty file can't be mapped
+			self.file.close()
+			raise
+		self.views = []
+
+		magic,version,_,metadataLength = headerStruct.unpack_from(self.mm,0)
+		if magic != pmidStateMagic or version != pmidStateVersion:
+			self.close()
+			raise ValueError("Not a usable PMID state file: %s" % filename)
+
+		pos = headerStruct.size
+		self.metadata = json.loads(bytes(self.mm[pos:pos+metadataLength]).decode('utf-8'))
+		pos += metadataLength + (-metadataLength % 8)
+
+		self.count = self.metadata['pmidCount']
+		self.pmidBytes,pos = self.getView(pos,8*self.count)
+		self.ownerBytes,pos = self.getView(pos,4*self.count)
+		self.valueBytes,pos = self.getView(pos,valueDigestSize*self.count)
+		self.exclusionBytes,pos = self.getView(pos,8*self.metadata['exclusionCount'])
+
+		self.pmids = self.castView(self.pmidBytes,'Q')
+		self.owners = self.castView(self.ownerBytes,'I')
+		self.exclusions = self.castView(self.exclusionBytes,'Q')
+
+	def getView(self,pos,size):
+		view = memoryview(self.mm)[pos:pos+size]
+		self.views.append(view)
+		return view,pos+size+(-size % 8)
+
+	def castView(self,view,typecode):
+		if sys.byteorder == 'little':
+			cast = view.cast(typecode)
+			self.views.append(cast)
+			return cast
+		return struct.unpack('<%d%s' % (len(view) // struct.calcsize(typecode),typecode),view)
+
+	# The position of a PMID in the arrays (or None if it isn't in them)
+	def find(self,pmid):
+		i = bisect.bisect_left(self.pmids,pmid)
+		if i < self.count and self.pmids[i] == pmid:
+			return i
+		return None
+
+	def getValue(self,i):
+		return bytes(self.valueBytes[i*valueDigestSize:(i+1)*valueDigestSize])
+
+	def close(self):
+		# The views into the memory map have to be released before it can be closed
+		for view in reversed(self.views):
+			view.release()
+		self.views = []
+		self.mm.close()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+# Loads the state (or returns None if there isn't a usable one)
+def loadPMIDState(outPMIDDir):
+	try:
+		return PMIDState(getPMIDStateFilename(outPMIDDir))
+	except (OSError,ValueError,KeyError,struct.error):
+		return None
+
+def removePMIDState(outPMIDDir):
+	stateFilename = getPMIDStateFilename(outPMIDDir)
+	if os.path.isfile(stateFilename):
+		os.remove(stateFilename)
+
+# Writes the state to a temporary file that replaces the previous state once it is complete. Each column writer
+# writes one of the arrays (PMIDs, source indices and hash digests) for count PMIDs
+def writePMIDState(outPMIDDir,metadata,count,columnWriters,exclusions):
+	metadata = dict(metadata)
+	metadata['pmidCount'] = count
+	metadata['exclusionCount'] = len(exclusions)
+	encodedMetadata = json.dumps(metadata,sort_keys=True).encode('utf-8')
+
+	stateFilename = getPMIDStateFilename(outPMIDDir)
+	tempFilename = os.path.join(outPMIDDir,'.%d%s' % (os.getpid(),os.path.basename(stateFilename)))
+	with open(tempFilename,'wb') as f:
+		f.write(headerStruct.pack(pmidStateMagic,pmidStateVersion,0,len(encodedMetadata)))
+		f.write(encodedMetadata + padding(len(encodedMetadata)))
+		for writeColumn in columnWriters:
+			start = f.tell()
+			writeColumn(f)
+			f.write(padding(f.tell()-start))
+		f.write(packPMIDs(exclusions))
+	os.replace(tempFilename,stateFilename)
+
+# Streams the state for a full run of gatherPMIDs (in ascending PMID order) into temporary column files that are put
+# together into the state file at the end, so that the state doesn't need to be held in memory
+class PMIDStateWriter:
+	columnSizes = [8,4,valueDigestSize]
+
+	def __init__(self,outPMIDDir):
+		self.outPMIDDir = outPMIDDir
+		self.tempFilenames = [ os.path.join(outPMIDDir,'.%d.pmids.state.column%d' % (os.getpid(),i)) for i in range(len(self.columnSizes)) ]
+		self.columnFiles = [ open(tempFilename,'wb') for tempFilename in self.tempFilenames ]
+		self.count = 0
+
+	def add(self,pmid,owner,valueDigest):
+		pmidFile,ownerFile,valueFile = self.columnFiles
+		pmidFile.write(struct.pack('<Q',pmid))
+		ownerFile.write(struct.pack('<I',owner))
+		valueFile.write(valueDigest)
+		self.count += 1
+
+	def copyColumn(self,tempFilename):
+		def writeColumn(f):
+			with open(tempFilename,'rb') as columnFile:
+				shutil.copyfileobj(columnFile,f)
+		return writeColumn
+
+	def finish(self,metadata,exclusions):
+		for columnFile in self.columnFiles:
+			columnFile.close()
+		try:
+			writePMIDState(self.outPMIDDir,metadata,self.count,[ self.copyColumn(tempFilename) for tempFilename in self.tempFilenames ],exclusions)
+		finally:
+			self.discard()
+
+	def discard(self):
+		for columnFile,tempFilename in zip(self.columnFiles,self.tempFilenames):
+			columnFile.close()
+			if os.path.isfile(tempFilename):
+				os.remove(tempFilename)
+
+# Writes a new state that is the previous state with some PMIDs changed or added. The changes are (pmid, position of
+# the PMID in the previous state or None if it is new, source index, hash digest) in ascending PMID order, so that
+# each array can be copied across in chunks between the changes
+def writeUpdatedPMIDState(outPMIDDir,state,changes,metadata,exclusions):
+	# Where each change goes in the previous arrays, and whether it replaces the item that is there
+	positions = []
+	for pmid,i,_,_ in changes:
+		if i is None:
+			positions.append((bisect.bisect_left(state.pmids,pmid),False))
+		else:
+			positions.append((i,True))
+
+	def updateColumn(oldBytes,itemSize,newItems):
+		def writeColumn(f):
+			previous = 0
+			for (position,replaces),newItem in zip(positions,newItems):
+				f.write(oldBytes[previous*itemSize:position*itemSize])
+				f.write(newItem)
+				previous = position+1 if replaces else position
+			f.write(oldBytes[previous*itemSize:])
+		return writeColumn
+
+	columnWriters = [
+		updateColumn(state.pmidBytes,8,[ struct.pack('<Q',pmid) for pmid,_,_,_ in changes ]),
+		updateColumn(state.ownerBytes,4,[ struct.pack('<I',owner) for _,_,owner,_ in changes ]),
+		updateColumn(state.valueBytes,valueDigestSize,[ valueDigest for _,_,_,valueDigest in changes ])
+	]
+	addedCount = sum( 1 for _,replaces in positions if not replaces )
+	writePMIDState(outPMIDDir,metadata,state.count+addedCount,columnWriters,exclusions)
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import resource
+import contextlib
+from collections import defaultdict
+
+# Instrumentation of the conversion pipeline that times each stage (XML parsing, text extraction, cleanup, ID
+# filtering and output encoding) and counts the documents and bytes converted. It is turned on with --profile
+# or the PUBRUNNER_PROFILE environmental variable. The conversion code marks the boundaries of each stage with
+# stage() (or timeIterator() for the items of a parser), which only does anything while stats are being collected
+
+profileEnvironmentalVariable = 'PUBRUNNER_PROFILE'
+
+def isProfilingRequested():
+	return os.environ.get(profileEnvironmentalVariable,'') not in ['','0']
+
+# The stats collected for a conversion (or for a task of it in a worker process). The seconds and calls are for the
+# time spent in each stage itself (not in any other stage that it contains)
+class Profile:
+	def __init__(self):
+		self.stageSeconds = defaultdict(float)
+		self.stageCalls = defaultdict(int)
+		self.counters = defaultdict(int)
+
+		# The stages that are currently running (innermost last) and when the innermost one last started or resumed
+		self.stageStack = []
+		self.stageSwitchTime = 0.0
+
+	def enterStage(self,stage):
+		now = time.perf_counter()
+		if self.stageStack:
+			self.stageSeconds[self.stageStack[-1]] += now - self.stageSwitchTime
+		self.stageStack.append(stage)
+		self.stageCalls[stage] += 1
+		self.stageSwitchTime = now
+
+	def exitStage(self):
+		now = time.perf_counter()
+		self.stageSeconds[self.stageStack.pop()] += now - self.stageSwitchTime
+		self.stageSwitchTime = now
+
+	# The stats of a worker process, to be added to those of the main process
+	def getStats(self):
+		return {'stageSeconds':dict(self.stageSeconds), 'stageCalls':dict(self.stageCalls), 'counters':dict(self.counters)}
+
+	def addStats(self,stats):
+		for stage,seconds in stats['stageSeconds'].items():
+			self.stageSeconds[stage] += seconds
+		for stage,calls in stats['stageCalls'].items():
+			self.stageCalls[stage] += calls
+		for name,count in stats['counters'].items():
+			self.counters[name] += count
+
+# The stats being collected in this process, if any. This is only set inside collectStats
+currentProfile = None
+
+# Collects the stats of everything run inside it (if enabled) into a new Profile. Whatever was being collected
+# before is put back afterwards, so nothing carries over from one conversion (or worker task) to the next
+@contextlib.contextmanager
+def collectStats(enabled=True):
+	global currentProfile
+	previousProfile = currentProfile
+	currentProfile = Profile() if enabled else None
+	try:
+		yield currentProfile
+	finally:
+		currentProfile = previousProfile
+
+def isEnabled():
+	return currentProfile is not None
+
+class StageTimer:
+	def __init__(self,profile,stage):
+		self.profile = profile
+		self.stage = stage
+
+	def __enter__(self):
+		self.profile.enterStage(self.stage)
+
+	def __exit__(self,excType,excValue,traceback):
+		self.profile.exitStage()
+
+class NotTimed:
+	def __enter__(self):
+		pass
+
+	def __exit__(self,excType,excValue,traceback):
+		pass
+
+notTimed = NotTimed()
+
+# A context manager for a block of code in a stage of the conversion
+def stage(name):
+	return notTimed if currentProfile is None else StageTimer(currentProfile,name)
+
+# Times getting each item from an iterator (e.g. the elements from a parser) but not what is done with them
+def timeIterator(name,iterable):
+	if currentProfile is None:
+		return iterable
+	return iterTimed(currentProfile,name,iter(iterable))
+
+def iterTimed(profile,name,iterator):
+	while True:
+		profile.enterStage(name)
+		try:
+			item = next(iterator)
+		except StopIteration:
+			return
+		finally:
+			profile.exitStage()
+		yield item
+
+def addCount(name,count):
+	if currentProfile is not None:
+		currentProfile.counters[name] += count
+
+def addStats(stats):
+	if currentProfile is not None:
+		currentProfile.addStats(stats)
+
+# Peak resident memory in bytes (ru_maxrss is in kilobytes on Linux)
+def getPeakRSS(who):
+	return resource.getrusage(who).ru_maxrss * 1024
+
+# The stats are saved in a hidden file next to the output, e.g. .PUBMED.00000001.bioc.stats.json
+def getStatsFilename(outFile):
+	return os.path.join(os.path.dirname(outFile), '.' + os.path.basename(outFile) + '.stats.json')
+
+def rate(count,seconds):
+	return count / seconds if seconds > 0 else None
+
+# Saves the stats of a Profile for an output file converted in the given number of seconds. With multiple workers,
+# the stage times are added up across the workers so can total more than the elapsed time
+def writeStats(profile,outFile,seconds,details):
+	stageSeconds,stageCalls,counters = profile.stageSeconds,profile.stageCalls,profile.counters
+	documents = counters.get('documents',0)
+	inputBytes = counters.get('inputBytes',0)
+	outputBytes = os.path.getsize(outFile) if os.path.isfile(outFile) else 0
+
+	stats = dict(details)
+	stats['seconds'] = seconds
+	stats['documents'] = documents
+	stats['documentsPerSecond'] = rate(documents,seconds)
+	stats['inputBytes'] = inputBytes
+	stats['inputBytesPerSecond'] = rate(inputBytes,seconds)
+	stats['outputBytes'] = outputBytes
+	stats['outputBytesPerSecond'] = rate(outputBytes,seconds)
+	stats['peakRSSBytes'] = getPeakRSS(resource.RUSAGE_SELF)
+	stats['peakWorkerRSSBytes'] = getPeakRSS(resource.RUSAGE_CHILDREN)
+
+	stats['stages'] = {}
+	for stage in sorted(stageSeconds.keys()):
+		stats['stages'][stage] = {'seconds':stageSeconds[stage], 'calls':stageCalls[stage]}
+	stats['unstagedSeconds'] = max(0.0, seconds - sum(stageSeconds.values())) if details.get('workers',1) == 1 else None
+	stats['counters'] = dict(counters)
+
+	statsFilename = getStatsFilename(outFile)
+	with open(statsFilename,'w') as f:
+		json.dump(stats,f,indent=2,sort_keys=True)
+
+	print("Profile: %d documents in %.1f seconds (%s). Stats saved to %s" % (documents,seconds,", ".join( "%s %.1fs" % (stage,stageSeconds[stage]) for stage in sorted(stageSeconds.keys()) ),statsFilename))
@@ -2,53 +2,252 @@ import pubrunner
 import argparse
 import hashlib
 import json
+import re
+import io
+import multiprocessing
 from collections import defaultdict
+from pubrunner.documentcache import loadCachedDocuments,openDocumentCacheWriter,hasDocumentCache
+from pubrunner.hashstore import writeHashStore,defaultDigestSize
+from pubrunner.compression import getCompression
+from pubrunner.articleoffsets import splitIntoByteRanges,findStartTag,iterElementBytes
+from pubrunner.inputfiles import iterInputStreams
+from pubrunner.convert import xmlMemberSuffixes
 
-def md5(text):
-	if text is None:
-		return ''
+try:
+	import xxhash
+except ImportError:
+	xxhash = None
+
+def getFieldBytes(text):
 	if isinstance(text,list):
 		text = "\n".join(text)
 	if not isinstance(text,str):
 		text = str(text)
+	return text.encode('utf8')
 
-	m = hashlib.md5()
-	m.update(text.encode('utf8'))
-	return m.hexdigest()
+# The algorithms that fields can be hashed with. MD5 is the default so that new hashes can be compared with existing
+# ones. BLAKE2b (with the digest size as its output size) is quicker and xxhash (XXH3) is quicker again if it is installed
+digestAlgorithms = ['md5','blake2b','xxhash']
 
-def pubmed_hash(pubmedXMLFiles,outHashJSON):
-	if not isinstance(pubmedXMLFiles,list):
-		pubmedXMLFiles = [pubmedXMLFiles]
+def getDigestFunction(digestAlgorithm,digestSize):
+	if digestAlgorithm == 'md5':
+		return lambda data: hashlib.md5(data).digest()
+	elif digestAlgorithm == 'blake2b':
+		return lambda data: hashlib.blake2b(data,digest_size=digestSize).digest()
+	elif digestAlgorithm == 'xxhash':
+		if xxhash is None:
+			raise RuntimeError("The xxhash package must be installed to use xxhash digests")
+		return xxhash.xxh3_64_digest if digestSize == 8 else xxhash.xxh3_128_digest
+	raise RuntimeError("Unknown digest algorithm: %s. Options are: %s" % (digestAlgorithm,"/".join(digestAlgorithms)))
 
-	allHashes = defaultdict(dict)
-	docCount = 0
+# The fields of each citation that are hashed (and the document values that they come from)
+hashFields = {'year':'pubYear', 'title':'title', 'abstract':'abstract', 'journal':'journal', 'journalISO':'journalISO'}
+
+hashFormats = ['binary','json']
+
+# Instead of hashing the extracted fields, the raw XML of each citation (and of its title and abstract) can be hashed
+# as a fingerprint. This only needs a scan for the tags, so is much quicker, but any change to the citation (e.g. to
+# its MeSH headings or history dates) changes the rawArticle fingerprint. The fingerprints are selected in the
+# usePubmedHashes option like the other hashes (e.g. usePubmedHashes: rawTitle,rawAbstract)
+fingerprintFields = {'rawArticle':'PubmedArticle', 'rawTitle':'ArticleTitle', 'rawAbstract':'Abstract'}
+
+hashModes = ['fields','fingerprint']
+
+pmidRegex = re.compile(rb'<PMID[^>]*>\s*([0-9]+)\s*</PMID>')
+whitespaceBetweenTagsRegex = re.compile(rb'>\s+<')
+
+# The XML is canonicalized so that only changes to the content (and not to the indentation or line endings) change it
+def canonicalizeXML(xmlBytes):
+	return whitespaceBetweenTagsRegex.sub(b'><', xmlBytes.replace(b'\r\n',b'\n')).strip()
+
+# The bytes of the first element with a tag in the XML of a citation (or None if there isn't one)
+def findElementBytes(articleBytes,tag):
+	start = findStartTag(articleBytes,tag,0)
+	if start == -1:
+		return None
+	closeTag = ('</%s>' % tag).encode('utf8')
+	end = articleBytes.find(closeTag,start)
+	if end == -1:
+		return None
+	return articleBytes[start:end+len(closeTag)]
+
+# Yields the raw XML of each citation in a Pubmed file (or a byte range of it)
+def iterPubmedArticleBytes(pubmedXMLFile,byteRange=None):
+	if byteRange is None:
+		for name,stream in iterInputStreams(pubmedXMLFile,xmlMemberSuffixes['pubmedxml']):
+			for articleBytes in iterElementBytes(stream,'PubmedArticle'):
+				yield articleBytes
+	else:
+		start,end = byteRange
+		with open(pubmedXMLFile,'rb') as f:
+			f.seek(start)
+			stream = io.BytesIO(f.read(end-start))
+		for articleBytes in iterElementBytes(stream,'PubmedArticle'):
+			yield articleBytes
+
+# The PMID of a citation is the first one in it (that of the MedlineCitation, before any in the comments and corrections)
+def fingerprintPubmedArticle(articleBytes,digestFunction):
+	pmidMatch = pmidRegex.search(articleBytes)
+	assert pmidMatch, "Couldn't find the PMID of a citation"
+	pmid = pmidMatch.group(1).decode('ascii')
+
+	hashes = {}
+	for field,tag in fingerprintFields.items():
+		elementBytes = articleBytes if tag == 'PubmedArticle' else findElementBytes(articleBytes,tag)
+		hashes[field] = b'' if elementBytes is None else digestFunction(canonicalizeXML(elementBytes))
+	return pmid,hashes
+
+# Streams the documents of a Pubmed file from its document cache if it has one. Otherwise it is parsed and, with
+# cacheDocuments, the documents are cached as they go past so that the conversion can use them later
+def iterDocumentsAndCache(pubmedXMLFile,cacheDocuments):
+	docs = loadCachedDocuments(pubmedXMLFile)
+	if docs is not None:
+		for doc in docs:
+			yield doc
+		return
+
+	cacheWriter = openDocumentCacheWriter(pubmedXMLFile) if cacheDocuments else None
+	if cacheWriter is None:
+		for doc in pubrunner.processMedlineFile(pubmedXMLFile):
+			yield doc
+		return
+
+	try:
+		for doc in pubrunner.processMedlineFile(pubmedXMLFile):
+			cacheWriter.write(doc)
+			yield doc
+	except:
+		cacheWriter.discard()
+		raise
+	cacheWriter.close()
+
+# Splits up the Pubmed files into tasks for the workers. Uncompressed files are split into byte ranges (one per worker)
+# unless their documents are cached (so are quick to read) or are going to be cached (which needs the whole file)
+def getHashTasks(pubmedXMLFiles,cacheDocuments,digestAlgorithm,digestSize,workers,hashMode):
+	tasks = []
 	for f in pubmedXMLFiles:
-		for doc in pubrunner.processMedlineFile(f):
-			pmid = doc['pmid']
+		byteRanges = []
+		if workers > 1 and getCompression(f) is None and not hasDocumentCache(f) and not cacheDocuments:
+			byteRanges = splitIntoByteRanges(f,'PubmedArticle',workers)
+
+		if len(byteRanges) > 0:
+			for byteRange in byteRanges:
+				tasks.append( (f,byteRange,cacheDocuments,digestAlgorithm,digestSize,hashMode) )
+		else:
+			tasks.append( (f,None,cacheDocuments,digestAlgorithm,digestSize,hashMode) )
+	return tasks
+
+# Hashes the citations in a task and returns them as a list of (pmid, {field: digest})
+def hashPubmedTask(task):
+	f,byteRange,cacheDocuments,digestAlgorithm,digestSize,hashMode = task
+	digestFunction = getDigestFunction(digestAlgorithm,digestSize)
+
+	if hashMode == 'fingerprint':
+		return f,[ fingerprintPubmedArticle(articleBytes,digestFunction) for articleBytes in iterPubmedArticleBytes(f,byteRange) ]
+
+	docs = iterDocumentsAndCache(f,cacheDocuments) if byteRange is None else pubrunner.processMedlineFile(f,byteRange=byteRange)
+
+	pmidHashes = []
+	for doc in docs:
+		hashes = { field:(b'' if doc[key] is None else digestFunction(getFieldBytes(doc[key]))) for field,key in hashFields.items() }
+		pmidHashes.append((doc['pmid'],hashes))
+	return f,pmidHashes
+
+# Yields the hashes of each Pubmed file (in order) as the file name and a list of (pmid, {field: digest}). With multiple
+# workers, the files (and parts of them) are hashed in parallel
+def iterPubmedHashes(pubmedXMLFiles,cacheDocuments,digestAlgorithm,digestSize,workers,hashMode):
+	tasks = getHashTasks(pubmedXMLFiles,cacheDocuments,digestAlgorithm,digestSize,workers,hashMode)
+
+	if workers > 1 and len(tasks) > 1:
+		pool = multiprocessing.Pool(min(workers,len(tasks)))
+		results = pool.imap(hashPubmedTask, tasks)
+	else:
+		pool = None
+		results = map(hashPubmedTask, tasks)
+
+	try:
+		# The parts of a file are put back together
+		current,currentHashes = None,[]
+		for f,pmidHashes in results:
+			if f != current and current is not None:
+				yield current,currentHashes
+				currentHashes = []
+			current = f
+			currentHashes += pmidHashes
+		if current is not None:
+			yield current,currentHashes
+	finally:
+		if pool is not None:
+			pool.terminate()
+
+def writePubmedHashes(outHashFile,fileHashes,hashFormat,digestAlgorithm,digestSize,hashMode):
+	allHashes = defaultdict(dict)
+	for f,pmidHashes in fileHashes:
+		# A citation that appears twice in a file is hashed as its last version
+		for pmid,hashes in pmidHashes:
+			if hashFormat == 'binary':
+				allHashes[f][int(pmid)] = hashes
+			else:
+				allHashes[f][pmid] = { field:digest.hex() for field,digest in hashes.items() }
+
+	if hashFormat == 'binary':
+		sections = [ (f,allHashes[f]) for f,_ in fileHashes ]
+		fields = fingerprintFields if hashMode == 'fingerprint' else hashFields
+		writeHashStore(outHashFile,sections,sorted(fields.keys()),digestSize,digestAlgorithm)
+	else:
+		with open(outHashFile,'w') as f:
+			json.dump(allHashes,f,indent=2,sort_keys=True)
+
+def checkHashSettings(hashFormat,digestAlgorithm,hashMode,cacheDocuments):
+	if not hashMode in hashModes:
+		raise RuntimeError("Unknown hash mode: %s. Options are: %s" % (hashMode,"/".join(hashModes)))
+	if hashMode == 'fingerprint' and cacheDocuments:
+		raise RuntimeError("Documents can't be cached when hashing fingerprints as they aren't extracted")
+	if not hashFormat in hashFormats:
+		raise RuntimeError("Unknown hash format: %s. Options are: %s" % (hashFormat,"/".join(hashFormats)))
+	if not digestAlgorithm in digestAlgorithms:
+		raise RuntimeError("Unknown digest algorithm: %s. Options are: %s" % (digestAlgorithm,"/".join(digestAlgorithms)))
+	if hashFormat == 'json' and digestAlgorithm != 'md5':
+		raise RuntimeError("The JSON hash format only has MD5 digests")
+
+# Hashes each field of every citation in the Pubmed files (or with the fingerprint hashMode, the raw XML of them). The
+# hashes are written in the compact binary format (see hashstore.py) with digests of digestSize bytes or in the older
+# JSON format of hex MD5 digests
+def pubmed_hash(pubmedXMLFiles,outHashFile,cacheDocuments=False,hashFormat='binary',digestSize=defaultDigestSize,digestAlgorithm='md5',workers=1,hashMode='fields'):
+	if not isinstance(pubmedXMLFiles,list):
+		pubmedXMLFiles = [pubmedXMLFiles]
+	checkHashSettings(hashFormat,digestAlgorithm,hashMode,cacheDocuments)
 
-			hashes = {}
-			hashes['year'] = md5(doc['pubYear'])
-			hashes['title'] = md5(doc['title'])
-			hashes['abstract'] = md5(doc['abstract'])
-			hashes['journal'] = md5(doc['journal'])
-			hashes['journalISO'] = md5(doc['journalISO'])
+	fileHashes = list(iterPubmedHashes(pubmedXMLFiles,cacheDocuments,digestAlgorithm,digestSize,workers,hashMode))
+	writePubmedHashes(outHashFile,fileHashes,hashFormat,digestAlgorithm,digestSize,hashMode)
 
-			allHashes[f][pmid] = hashes
-			docCount += 1
+	docCount = sum( len(pmidHashes) for _,pmidHashes in fileHashes )
+	print("Hashes for %d documents across %d Pubmed XML files written to %s" % (docCount,len(pubmedXMLFiles),outHashFile))
 
-	with open(outHashJSON,'w') as f:
-		json.dump(allHashes,f,indent=2,sort_keys=True)
+# Hashes each Pubmed file to its own hash file, with the files shared out between the workers
+def hashPubmedFiles(pubmedXMLFiles,outHashFiles,cacheDocuments=False,hashFormat='binary',digestSize=defaultDigestSize,digestAlgorithm='md5',workers=1,hashMode='fields'):
+	assert len(pubmedXMLFiles) == len(outHashFiles)
+	checkHashSettings(hashFormat,digestAlgorithm,hashMode,cacheDocuments)
 
-	print("Hashes for %d documents across %d Pubmed XML files written to %s" % (docCount,len(pubmedXMLFiles),outHashJSON))
+	outHashFilenames = dict(zip(pubmedXMLFiles,outHashFiles))
+	for f,pmidHashes in iterPubmedHashes(pubmedXMLFiles,cacheDocuments,digestAlgorithm,digestSize,workers,hashMode):
+		writePubmedHashes(outHashFilenames[f],[(f,pmidHashes)],hashFormat,digestAlgorithm,digestSize,hashMode)
+		print("Hashes for %d documents in %s written to %s" % (len(pmidHashes),f,outHashFilenames[f]))
 
 def main():
-	parser = argparse.ArgumentParser(description='Calculate MD5 hashes for the different sections of a Pubmed file. Used to evaluate the Pubmed updates')
-	parser.add_argument('--pubmedXMLFiles',required=True,type=str,help='Comma-delimited Pubmed XML files to calculate hashes for')
-	parser.add_argument('--outHashJSON',required=True,type=str,help='Output file (in JSON format) containing hashes associated with each PMID')
+	parser = argparse.ArgumentParser(description='Calculate hashes for the different sections of a Pubmed file. Used to evaluate the Pubmed updates')
+	parser.add_argument('--pubmedXMLFiles',required=True,type=str,help='Comma-delimited Pubmed XML files (optionally gzipped) to calculate hashes for')
+	parser.add_argument('--outHashes','--outHashJSON',dest='outHashes',required=True,type=str,help='Output file containing hashes associated with each PMID')
+	parser.add_argument('--hashFormat',type=str,default='binary',help='Format of the output file. Options: %s' % "/".join(hashFormats))
+	parser.add_argument('--digestBits',type=int,default=8*defaultDigestSize,help='Size of the digests in bits for the binary format (64 or 128)')
+	parser.add_argument('--digest',type=str,default='md5',help='Digest algorithm for the binary format. Options: %s (all the hash files used together must have the same one)' % "/".join(digestAlgorithms))
+	parser.add_argument('--workers',type=int,default=1,help='Number of processes to use to hash the Pubmed files')
+	parser.add_argument('--hashMode',type=str,default='fields',help='Whether to hash the extracted fields of each citation or to fingerprint its raw XML. Options: %s' % "/".join(hashModes))
+	parser.add_argument('--cacheDocuments',action='store_true',help='Cache the documents extracted from each Pubmed file next to it so that converting it later does not need to parse it again')
 	args = parser.parse_args()
 
 	pubmedXMLFiles = args.pubmedXMLFiles.split(',')
-	pubmed_hash(pubmedXMLFiles,args.outHashJSON)
+	pubmed_hash(pubmedXMLFiles,args.outHashes,args.cacheDocuments,args.hashFormat,args.digestBits // 8,args.digest,args.workers,args.hashMode)
 
 
 
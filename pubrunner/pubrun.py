@@ -13,6 +13,7 @@ import codecs
 from collections import defaultdict
 from Bio import Entrez
 import sys
+from pubrunner.inputfiles import isArchive,isVirtualFile,makeVirtualFilename,splitVirtualFilename,listArchiveMembers
 
 def extractVariables(command):
 	assert isinstance(command,six.string_types)
@@ -59,7 +60,7 @@ def prepareConversionAndHashingRuns(toolSettings,mode,workingDirectory):
 	resourcesWithHashes = []
 	for resourceGroupName in ["all",mode]:
 		for resName,projectSettings in toolSettings["resources"][resourceGroupName]:
-			allowed = ['rename','format','removePMCOADuplicates','usePubmedHashes','pmids','pmcids']
+			allowed = ['rename','format','compression','zstdDictionary','workers','removePMCOADuplicates','usePubmedHashes','pmids','pmcids']
 			for k in projectSettings.keys():
 				assert k in allowed, "Unexpected attribute (%s) for resource %s" % (k,resName)
 
@@ -118,6 +119,19 @@ def prepareConversionAndHashingRuns(toolSettings,mode,workingDirectory):
 				outDir = nameToUse
 				outFormat = projectSettings["format"]
 
+				# The converted files can be compressed (optionally with a zstd dictionary trained on a sample of them)
+				outCompression = projectSettings.get("compression")
+				assert outCompression in [None,'gzip','zstd'], "ERROR in pubrunner.yml: compression for resource %s must be gzip or zstd" % resName
+				assert outCompression is None or outFormat in pubrunner.convert.compressibleOutFormats, "ERROR in pubrunner.yml: compression for resource %s can only be used with %s output, not %s" % (resName,"/".join(pubrunner.convert.compressibleOutFormats),outFormat)
+				zstdDictionary = projectSettings.get("zstdDictionary")
+				assert zstdDictionary is None or outCompression == 'zstd', "ERROR in pubrunner.yml: zstdDictionary for resource %s can only be used with zstd compression" % resName
+				if zstdDictionary is not None:
+					zstdDictionary = os.path.abspath(zstdDictionary)
+
+				# Each chunk can be converted with several processes (e.g. to split up large Pubmed files)
+				workers = projectSettings.get("workers")
+				assert workers is None or (isinstance(workers,int) and workers > 0), "ERROR in pubrunner.yml: workers for resource %s must be a positive integer" % resName
+
 				removePMCOADuplicates = False
 				if "removePMCOADuplicates" in projectSettings and projectSettings["removePMCOADuplicates"] == True:
 					removePMCOADuplicates = True
@@ -130,6 +144,9 @@ def prepareConversionAndHashingRuns(toolSettings,mode,workingDirectory):
 				conversionInfo['outDir'] = os.path.join(workingDirectory,outDir)
 				conversionInfo['outFormat'] = outFormat
 				conversionInfo['chunkSize'] = chunkSize
+				conversionInfo['outCompression'] = outCompression
+				conversionInfo['zstdDictionary'] = zstdDictionary
+				conversionInfo['workers'] = workers
 				conversions.append( conversionInfo )
 
 				whichHashes = None
@@ -221,16 +238,28 @@ def chunks(l, n):
 	for i in range(0, len(l), n):
 		yield l[i:i + n]
 
-def findFiles(dirName):
+# Finds all the files in a directory. If memberSuffixes are given, any archive is replaced by
+# virtual files (archive::member) for each of its members with one of the suffixes
+def findFiles(dirName,memberSuffixes=None):
 	allFiles = []
 	for root, dirs, files in os.walk(dirName):
-		allFiles += [ os.path.join(root,f) for f in files ]
+		for f in files:
+			# Skip hidden files (e.g. cached offsets for Pubmed files)
+			if f.startswith('.'):
+				continue
+
+			path = os.path.join(root,f)
+			if memberSuffixes is not None and isArchive(path):
+				allFiles += [ (path,i,makeVirtualFilename(path,member)) for i,member in enumerate(listArchiveMembers(path,memberSuffixes)) ]
+			else:
+				allFiles.append((path,0,path))
 	
-	# We're going to extract the last set of digits from each filename and sort by that
-	nums = [ re.findall('[0-9]+',f) for f in allFiles ]
+	# We're going to extract the last set of digits from each filename and sort by that. The members of an archive are
+	# kept together in the order they are stored in it (which is the order they are converted in)
+	nums = [ re.findall('[0-9]+',path) for path,_,_ in allFiles ]
 	nums = [ 0 if num == [] else int(num[-1]) for num in nums ]
-	sortedByNum = sorted(list(zip(nums,allFiles)))
-	sortedFilepaths = [ filepath for num,filepath in sortedByNum ]
+	sortedByNum = sorted( (num,path,i,filepath) for num,(path,i,filepath) in zip(nums,allFiles) )
+	sortedFilepaths = [ filepath for num,path,i,filepath in sortedByNum ]
 	
 	return sortedFilepaths
 
@@ -249,6 +278,11 @@ class OutputFileNamer:
 		raise RuntimeError("Unable to create an output file that doesn't already exist")
 
 def getPMCIDFromFilename(filename):
+	# Only use the member name for a file inside an archive
+	archive,member = splitVirtualFilename(filename)
+	if member is not None:
+		filename = member
+
 	pmcidSearch = re.search('PMC\d+',filename)
 	if pmcidSearch:
 		return pmcidSearch.group()
@@ -256,6 +290,7 @@ def getPMCIDFromFilename(filename):
 		return None
 
 def assignFilesForConversion(files, previousAssignmentFile, outDir, outPattern, maxChunkSize, pmcidsToLastUpdate=None):
+	inputFiles = files
 	if not pmcidsToLastUpdate is None:
 		print("Sorting files by PMC last update metadata")
 		filesWithUpdates = [ (pmcidsToLastUpdate[getPMCIDFromFilename(f)],f) for f in files ]
@@ -278,10 +313,34 @@ def assignFilesForConversion(files, previousAssignmentFile, outDir, outPattern,
 	for f in missingFiles:
 		del assignedChunks[f]
 
-	if len(assignedChunks) > 0:
+	# An archive can only be decompressed from the start, so splitting one across chunks would mean decompressing it
+	# again for each one. Instead all the members of an archive go in a single chunk (of any size) with nothing else,
+	# which is converted in one pass over the archive. Any previous chunks that don't follow this are redone
+	chunkSources = defaultdict(set)
+	for f,outputFile in assignedChunks.items():
+		archive,member = splitVirtualFilename(f)
+		chunkSources[outputFile].add(archive if member is not None else None)
+	archiveChunks = defaultdict(set)
+	for outputFile,sources in chunkSources.items():
+		for source in sources:
+			if source is not None:
+				archiveChunks[source].add(outputFile)
+
+	redoneChunks = set( outputFile for outputFile,sources in chunkSources.items() if len(sources) > 1 and any( source is not None for source in sources ) )
+	for archive,outputFiles in archiveChunks.items():
+		if len(outputFiles) > 1:
+			redoneChunks.update(outputFiles)
+	for f in [ f for f,outputFile in assignedChunks.items() if outputFile in redoneChunks ]:
+		del assignedChunks[f]
+	dirtyOutputFiles.update(redoneChunks)
+
+	archiveChunk = { archive:list(outputFiles)[0] for archive,outputFiles in archiveChunks.items() if not outputFiles.intersection(redoneChunks) }
+
+	regularChunks = [ outputFile for f,outputFile in assignedChunks.items() if not isVirtualFile(f) ]
+	if len(regularChunks) > 0:
 		# We're just take the last chunk alphabetically
-		currentChunk = sorted(assignedChunks.values())[-1]
-		currentChunkSize = len( [ f for f in assignedChunks.values() if f == currentChunk ] )
+		currentChunk = sorted(regularChunks)[-1]
+		currentChunkSize = len( [ f for f in regularChunks if f == currentChunk ] )
 	else:
 		currentChunk = None
 		currentChunkSize = 0
@@ -289,7 +348,13 @@ def assignFilesForConversion(files, previousAssignmentFile, outDir, outPattern,
 	outputFileNamer = OutputFileNamer(outDir,outPattern)
 
 	for f in files:
-		if not f in assignedChunks:
+		archive,member = splitVirtualFilename(f)
+		if not f in assignedChunks and member is not None:
+			if not archive in archiveChunk:
+				archiveChunk[archive] = outputFileNamer.next()
+			assignedChunks[f] = archiveChunk[archive]
+			dirtyOutputFiles.add(archiveChunk[archive])
+		elif not f in assignedChunks:
 			if currentChunk is None or currentChunkSize >= maxChunkSize:
 				currentChunk = outputFileNamer.next()
 				currentChunkSize = 0
@@ -304,9 +369,11 @@ def assignFilesForConversion(files, previousAssignmentFile, outDir, outPattern,
 			os.unlink(dirtyOutputFile)
 			print("Removing:", dirtyOutputFile)
 
+	# The files of each chunk are in the same order as they are given, before any sorting by update (so the members of
+	# an archive are in the order they are stored in it, which is the order they are converted in)
 	outputFilesWithChunks = defaultdict(list)
-	for f,outputFile in assignedChunks.items():
-		outputFilesWithChunks[outputFile].append(f)
+	for f in inputFiles:
+		outputFilesWithChunks[assignedChunks[f]].append(f)
 
 	return outputFilesWithChunks
 
@@ -361,6 +428,8 @@ def pubrun(directory,doTest,doGetResources,forceresource_dir=None,forceresource_
 			singleConversion["outDir"] = toolSettings["conversions"][0]["outDir"]
 			singleConversion["outFormat"] = toolSettings["conversions"][0]["outFormat"]
 			singleConversion["chunkSize"] = 1
+			singleConversion["outCompression"] = toolSettings["conversions"][0]["outCompression"]
+			singleConversion["zstdDictionary"] = toolSettings["conversions"][0]["zstdDictionary"]
 			for conversion in toolSettings["conversions"][1:]:
 				# Remove the symlink to the normal resource and create an empty directory instead (and remove the conversion for this resource)
 				os.unlink(conversion["inDir"])
@@ -418,14 +487,24 @@ def pubrun(directory,doTest,doGetResources,forceresource_dir=None,forceresource_
 			with open(chunksFile,'r') as f:
 				previousChunks = json.load(f)
 
-		allInputFiles = findFiles(inDir)
-		#timestamps = { f:os.path.getmtime(f) for f in allInputFiles }
-		timestamps = [ os.path.getmtime(f) for f in allInputFiles ]
-		allInputFiles = sorted(list(zip(timestamps,allInputFiles)))
-		timestampMap = { f:timestamp for timestamp,f in allInputFiles }
-		allInputFiles = [ f for timestamp,f in allInputFiles ]
+		allInputFiles = findFiles(inDir,pubrunner.convert.xmlMemberSuffixes.get(inFormat))
+
+		# Members of an archive use the timestamp of the archive so each archive is only checked once. They stay
+		# in the order that findFiles gives them (the order they are stored in the archive)
+		archiveTimestamps = {}
+		sortKeys = []
+		for i,f in enumerate(allInputFiles):
+			archive,_ = splitVirtualFilename(f)
+			if not archive in archiveTimestamps:
+				archiveTimestamps[archive] = os.path.getmtime(archive)
+			sortKeys.append((archiveTimestamps[archive],archive,i))
+		sortedInputFiles = sorted(zip(sortKeys,allInputFiles))
+		timestampMap = { f:key[0] for key,f in sortedInputFiles }
+		allInputFiles = [ f for key,f in sortedInputFiles ]
 
 		outPattern = os.path.basename(inDir).replace('_UNCONVERTED','') + ".%08d." + outFormat
+		if conversionInfo['outCompression'] is not None:
+			outPattern += {'gzip':'.gz','zstd':'.zst'}[conversionInfo['outCompression']]
 		newChunks = assignFilesForConversion(allInputFiles, previousChunks, outDir, outPattern, chunkSize)
 
 		with open(chunksFile,'w') as f:
@@ -444,6 +523,10 @@ def pubrun(directory,doTest,doGetResources,forceresource_dir=None,forceresource_
 			#print(latestTimestamp)
 
 		parameters = {'CHUNKDIR':chunkDir,'OUTDIR':outDir,'INFORMAT':inFormat,'OUTFORMAT':outFormat}
+		if conversionInfo['zstdDictionary'] is not None:
+			parameters['ZSTDDICTIONARY'] = conversionInfo['zstdDictionary']
+		if conversionInfo['workers'] is not None:
+			parameters['WORKERS'] = str(conversionInfo['workers'])
 
 		if useHashes:
 			pmidDir = inDir.rstrip('/') + '.pmids'
@@ -0,0 +1,105 @@
+import os
+import xml.etree.ElementTree as stdlibEtree
+
+try:
+	import lxml.etree as lxmlEtree
+except ImportError:
+	lxmlEtree = None
+
+# Removes a child element and all the children before it from an element. The parser may already have
+# added later siblings so the search starts at the end
+def removeUpToChild(parent, child):
+	for i in range(len(parent)-1, -1, -1):
+		if parent[i] is child:
+			del parent[:i+1]
+			return
+
+# Streams XML elements with a specific tag out of a large file (e.g. PubmedArticle in a Pubmed
+# XML file) using the standard library ElementTree parser
+class StdlibBackend:
+	name = 'stdlib'
+	ParseError = stdlibEtree.ParseError
+
+	def iterparse(self, source, tag):
+		# The open elements are tracked so that each element of interest can be removed from its parent
+		# once processed. Clearing it isn't enough as the empty element would stay attached to the tree
+		openElems = []
+		for event, elem in stdlibEtree.iterparse(source, events=('start','end')):
+			if event == 'start':
+				openElems.append(elem)
+				continue
+
+			openElems.pop()
+			if elem.tag == tag:
+				yield elem
+
+				# Important: clear the current element from memory to keep memory usage low
+				elem.clear()
+
+				# Remove it and any earlier siblings (which have been fully parsed) from the parent. Anything nested
+				# inside another element of interest is left for that element to be processed
+				if openElems and not any( e.tag == tag for e in openElems ):
+					removeUpToChild(openElems[-1], elem)
+
+	def findall(self, elem, path):
+		return elem.findall(path)
+
+	def find(self, elem, path):
+		return elem.find(path)
+
+# The same using lxml which filters the tags while parsing (so no Python callback is needed for
+# every other element) and uses compiled XPath for the fixed paths to fields
+class LxmlBackend:
+	name = 'lxml'
+	ParseError = lxmlEtree.XMLSyntaxError if lxmlEtree else None
+
+	def __init__(self):
+		self.compiledPaths = {}
+
+	def iterparse(self, source, tag):
+		# Comments and processing instructions are dropped to match the standard library tree builder
+		for event, elem in lxmlEtree.iterparse(source, events=('end',), tag=tag, remove_comments=True, remove_pis=True, huge_tree=True):
+			yield elem
+
+			# Clear the element and remove any earlier siblings (already processed elements or
+			# others that weren't needed) so that the tree doesn't grow through the file. Anything
+			# nested inside another element of interest is left for that element to be processed
+			elem.clear(keep_tail=True)
+			if next(elem.iterancestors(tag), None) is None:
+				parent = elem.getparent()
+				while elem.getprevious() is not None:
+					del parent[0]
+
+	def findall(self, elem, path):
+		compiled = self.compiledPaths.get(path)
+		if compiled is None:
+			compiled = lxmlEtree.XPath(path)
+			self.compiledPaths[path] = compiled
+		return compiled(elem)
+
+	def find(self, elem, path):
+		found = self.findall(elem, path)
+		return found[0] if found else None
+
+# The standard library backend can also be used with lxml elements (for anything but iterparse)
+stdlibBackend = StdlibBackend()
+
+backends = {'stdlib':stdlibBackend}
+if lxmlEtree is not None:
+	backends['lxml'] = LxmlBackend()
+
+# Errors that could be raised by any of the XML backends
+ParseErrors = tuple( backend.ParseError for backend in backends.values() )
+
+# The backend can be chosen with the PUBRUNNER_XML_BACKEND environmental variable. Otherwise lxml
+# is used if it is installed and the standard library parser if not
+def getXMLBackend(name=None):
+	if name is None:
+		name = os.environ.get('PUBRUNNER_XML_BACKEND')
+	if name is None:
+		name = 'lxml' if 'lxml' in backends else 'stdlib'
+
+	if not name in backends:
+		raise RuntimeError("Unknown or unavailable XML backend: %s. Options are: %s" % (name, "/".join(sorted(backends.keys()))))
+
+	return backends[name]
@@ -44,7 +44,9 @@ setup(name='pubrunner',
 	entry_points = {
 		'console_scripts': ['pubrunner=pubrunner.command_line:main',
 		                    'pubrunner_convert=pubrunner.convert:main',
-		                    'pubmed_hash=pubrunner.pubmed_hash:main'],
+		                    'pubmed_hash=pubrunner.pubmed_hash:main',
+		                    'pubrunner_convert_hashes=pubrunner.hashstore:main',
+		                    'pubrunner_train_zstd_dictionary=pubrunner.compression:main'],
 	},
 	zip_safe=False,
 	test_suite='nose.collector',
@@ -0,0 +1,58 @@
+import re
+import io
+import tarfile
+from pubrunner.compression import openInputFile
+
+# Synthetic input files and other helpers shared by the tests
+
+def writePubmedBookArticle(f,pmid):
+	f.write('<PubmedBookArticle><BookDocument><PMID Version="1">%d</PMID><ArticleTitle>Chapter %d</ArticleTitle>' % (pmid,pmid))
+	f.write('<Abstract><AbstractText>Abstract of chapter %d.</AbstractText></Abstract></BookDocument>' % pmid)
+	f.write('<PubmedBookData><PublicationStatus>ppublish</PublicationStatus></PubmedBookData></PubmedBookArticle>\n')
+
+# With bookArticles, the file has a DOCTYPE like the real Pubmed files and PubmedBookArticle elements (and a comment)
+# before the first PubmedArticle and between some of the others
+def writeSyntheticPubmedFile(filename,articleCount,bookArticles=False):
+	with open(filename,'w') as f:
+		f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+		if bookArticles:
+			f.write('<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2019//EN" "https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_190101.dtd">\n')
+		f.write('<PubmedArticleSet>\n')
+		if bookArticles:
+			f.write('<!-- Book chapters come first -->\n')
+			writePubmedBookArticle(f,900000000)
+		for i in range(articleCount):
+			pmid = i+1
+			f.write('<PubmedArticle><MedlineCitation><PMID>%d</PMID><Article>' % pmid)
+			f.write('<Journal><JournalIssue><PubDate><Year>2001</Year><Month>Mar</Month></PubDate></JournalIssue><Title>Journal %d</Title></Journal>' % (pmid % 100))
+			f.write('<ArticleTitle>Title of article %d</ArticleTitle>' % pmid)
+			f.write('<Abstract><AbstractText>Abstract text of article %d that goes on for a little while.</AbstractText></Abstract>' % pmid)
+			f.write('<AuthorList><Author><LastName>Smith</LastName><ForeName>Jane</ForeName></Author></AuthorList>')
+			f.write('</Article></MedlineCitation><PubmedData><History>')
+			f.write('<PubMedPubDate PubStatus="pubmed"><Year>2001</Year><Month>3</Month><Day>1</Day></PubMedPubDate>')
+			f.write('</History></PubmedData></PubmedArticle>\n')
+			if bookArticles and pmid % 40 == 0:
+				writePubmedBookArticle(f,900000000+pmid)
+		f.write('</PubmedArticleSet>\n')
+
+# A tar.gz of PMC articles like the PMCOA bulk packages. The members aren't stored in alphabetical order
+def writeSyntheticPMCArchive(filename,articleCount):
+	with tarfile.open(filename,'w:gz') as tar:
+		for i in range(articleCount):
+			pmcid = (i * 7) % articleCount + 1
+			data = '<?xml version="1.0" encoding="utf-8"?>\n<article article-type="research-article"><front><article-meta>'
+			data += '<article-id pub-id-type="pmid">%d</article-id><article-id pub-id-type="pmc">%d</article-id>' % (500+pmcid,pmcid)
+			data += '<title-group><article-title>Title of PMC article %d</article-title></title-group>' % pmcid
+			data += '<abstract><p>Abstract of PMC article %d.</p></abstract></article-meta></front>' % pmcid
+			data += '<body><sec><title>Introduction</title><p>Body text of PMC article %d.</p></sec></body></article>\n' % pmcid
+			data = data.encode('utf8')
+			info = tarfile.TarInfo('PMC%03d/PMC%d.nxml' % (pmcid % 3,pmcid))
+			info.size = len(data)
+			tar.addfile(info,io.BytesIO(data))
+
+# Reads a converted output file (which may be compressed)
+def readOutput(filename):
+	with openInputFile(filename) as f:
+		data = f.read()
+	# The BioC header has the date of the conversion
+	return re.sub(rb'<date>[^<]*</date>', b'', data)
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import pubrunner.convert
+import pubrunner.biocwriter
+from pubrunner.biocwriter import BiocWriter
+from helpers import writeSyntheticPubmedFile,readOutput
+
+# A raw file that only writes part of what it is given each time
+class ShortWriter:
+	def __init__(self,outFile):
+		self.outFile = outFile
+
+	def fileno(self):
+		return self.outFile.fileno()
+
+	def write(self,data):
+		return self.outFile.write(data[:1000])
+
+def test_copied_documents_match_rewritten(monkeypatch):
+	originalCopyByteRange = pubrunner.biocwriter.copyByteRange
+	copied = []
+	def copyByteRange(inFile,outFile,start,end,useSendfile=True):
+		copied.append(inFile.name)
+		originalCopyByteRange(inFile,ShortWriter(outFile),start,end,useSendfile=False)
+	monkeypatch.setattr(pubrunner.biocwriter,'copyByteRange',copyByteRange)
+
+	with tempfile.TemporaryDirectory() as tmpDir:
+		biocFiles = []
+		for i,articleCount in enumerate([2000,0,50]):
+			xmlFile = os.path.join(tmpDir,'pubmed%d.xml' % i)
+			writeSyntheticPubmedFile(xmlFile,articleCount)
+			biocFiles.append(xmlFile + '.bioc')
+			pubrunner.convert.convertFiles([xmlFile],'pubmedxml',biocFiles[-1],'bioc')
+		assert os.path.getsize(biocFiles[0]) > pubrunner.biocwriter.copyBufferSize
+
+		# Merging uncompressed BioC files copies the documents across without parsing them
+		copiedFile = os.path.join(tmpDir,'copied.bioc')
+		pubrunner.convert.convertFiles(biocFiles,'bioc',copiedFile,'bioc')
+		assert copied == [biocFiles[0],biocFiles[2]]
+
+		rewrittenFile = os.path.join(tmpDir,'rewritten.bioc')
+		with BiocWriter(rewrittenFile) as writer:
+			for biocFile in biocFiles:
+				for biocDoc in pubrunner.convert.bioc2biocDocuments(biocFile):
+					writer.writedocument(biocDoc)
+
+		assert readOutput(copiedFile) == readOutput(rewrittenFile)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import pytest
+import pubrunner.convert
+import pubrunner.checkpoint as checkpoint
+from helpers import writeSyntheticPubmedFile,readOutput
+
+class Killed(Exception):
+	pass
+
+# Kills the conversion (like a SIGKILL would) after killAfter documents have been written. The written documents
+# are flushed first so that the partial file has data past the last checkpoint that the resumed run has to drop
+def killConversionAfter(monkeypatch,killAfter):
+	originalOpen = checkpoint.ResumableOutput.open
+	written = [0]
+	def open(self,append):
+		originalOpen(self,append)
+		writeDocument = self.writeDocument
+		def killingWriteDocument(doc):
+			writeDocument(doc)
+			written[0] += 1
+			if written[0] == killAfter:
+				self.stream.flush()
+				raise Killed()
+		self.writeDocument = killingWriteDocument
+	monkeypatch.setattr(checkpoint.ResumableOutput,'open',open)
+
+@pytest.mark.parametrize('outName,outFormat', [('out.bioc','bioc'), ('out.jsonl.gz','jsonl'), ('out.txt.gz','txt')])
+def test_resumed_conversion_matches_uninterrupted(monkeypatch,outName,outFormat):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		inFile = os.path.join(tmpDir,'pubmed.xml')
+		writeSyntheticPubmedFile(inFile,200)
+
+		referenceFile = os.path.join(tmpDir,'reference.' + outName)
+		pubrunner.convert.convertFiles([inFile],'pubmedxml',referenceFile,outFormat)
+
+		outFile = os.path.join(tmpDir,outName)
+		with monkeypatch.context() as m:
+			killConversionAfter(m,73)
+			with pytest.raises(Killed):
+				pubrunner.convert.convertFiles([inFile],'pubmedxml',outFile,outFormat,checkpointInterval=0)
+
+		assert not os.path.exists(outFile)
+		assert os.path.isfile(checkpoint.getPartialFilename(outFile))
+		assert os.path.isfile(checkpoint.getCheckpointFilename(outFile))
+
+		pubrunner.convert.convertFiles([inFile],'pubmedxml',outFile,outFormat,checkpointInterval=0)
+
+		assert readOutput(outFile) == readOutput(referenceFile)
+		assert not os.path.exists(checkpoint.getPartialFilename(outFile))
+		assert not os.path.exists(checkpoint.getCheckpointFilename(outFile))
+
+def test_checkpoint_not_resumed_when_input_changes(monkeypatch):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		inFile = os.path.join(tmpDir,'pubmed.xml')
+		outFile = os.path.join(tmpDir,'out.bioc')
+		writeSyntheticPubmedFile(inFile,100)
+
+		with monkeypatch.context() as m:
+			killConversionAfter(m,50)
+			with pytest.raises(Killed):
+				pubrunner.convert.convertFiles([inFile],'pubmedxml',outFile,'bioc',checkpointInterval=0)
+
+		# A different input file (which changes its size) means that the checkpoint doesn't apply
+		tasks = pubrunner.convert.getConversionTasks([inFile],'pubmedxml',[None],1)
+		oldSettings = pubrunner.convert.getCheckpointSettings(tasks,'pubmedxml','bioc',None)
+		assert checkpoint.loadCheckpoint(outFile,oldSettings) is not None
+		assert checkpoint.loadCheckpoint(outFile,dict(oldSettings,outFormat='txt')) is None
+
+		writeSyntheticPubmedFile(inFile,120)
+		newSettings = pubrunner.convert.getCheckpointSettings(tasks,'pubmedxml','bioc',None)
+		assert checkpoint.loadCheckpoint(outFile,newSettings) is None
+
+		pubrunner.convert.convertFiles([inFile],'pubmedxml',outFile,'bioc',checkpointInterval=0)
+
+		referenceFile = os.path.join(tmpDir,'reference.bioc')
+		pubrunner.convert.convertFiles([inFile],'pubmedxml',referenceFile,'bioc')
+		assert readOutput(outFile) == readOutput(referenceFile)
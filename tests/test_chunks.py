@@ -0,0 +1,25 @@
+import os
+import tempfile
+from pubrunner.pubrun import assignFilesForConversion
+
+def test_archive_members_stay_in_one_chunk():
+	files = ['a.xml','b.xml','pmc1.tar.gz::PMC2.nxml','pmc1.tar.gz::PMC1.nxml','pmc1.tar.gz::PMC3.nxml','c.xml','pmc2.tar.gz::PMC5.nxml','d.xml']
+	with tempfile.TemporaryDirectory() as tmpDir:
+		chunks = assignFilesForConversion(files,{},tmpDir,'%08d.bioc',2)
+		assert sorted(chunks.values()) == sorted([ ['a.xml','b.xml'], ['c.xml','d.xml'], ['pmc1.tar.gz::PMC2.nxml','pmc1.tar.gz::PMC1.nxml','pmc1.tar.gz::PMC3.nxml'], ['pmc2.tar.gz::PMC5.nxml'] ])
+		for outputFile in chunks:
+			open(outputFile,'w').close()
+
+		# An archive that a previous assignment split across chunks is redone in a single chunk, and new members go
+		# in the chunk of their archive
+		splitChunk = os.path.join(tmpDir,'00000099.bioc')
+		open(splitChunk,'w').close()
+		previous = dict(chunks)
+		previous[splitChunk] = ['pmc2.tar.gz::PMC4.nxml']
+		newFiles = files + ['pmc2.tar.gz::PMC4.nxml','pmc1.tar.gz::PMC0.nxml','e.xml']
+		newChunks = assignFilesForConversion(newFiles,previous,tmpDir,'%08d.bioc',2)
+
+		assert not splitChunk in newChunks and not os.path.isfile(splitChunk)
+		assert sorted(newChunks.values()) == sorted([ ['a.xml','b.xml'], ['c.xml','d.xml'], ['e.xml'], ['pmc1.tar.gz::PMC2.nxml','pmc1.tar.gz::PMC1.nxml','pmc1.tar.gz::PMC3.nxml','pmc1.tar.gz::PMC0.nxml'], ['pmc2.tar.gz::PMC5.nxml','pmc2.tar.gz::PMC4.nxml'] ])
+		for outputFile,chunk in newChunks.items():
+			assert os.path.isfile(outputFile) == (chunk in [ ['a.xml','b.xml'], ['c.xml','d.xml'] ])
@@ -0,0 +1,92 @@
+import os
+import hashlib
+import tempfile
+from pubrunner.pubmed_hash import pubmed_hash,fingerprintPubmedArticle
+from pubrunner.gather_pmids import gatherPMIDs
+
+def getArticleXML(pmid,title,abstract,commentPMID=None,indent=False):
+	parts = [ '<PubmedArticle>', '<MedlineCitation Status="MEDLINE" Owner="NLM">', '<PMID Version="1">%d</PMID>' % pmid, '<Article PubModel="Print">' ]
+	parts += [ '<Journal>', '<Title>Journal of tests</Title>', '</Journal>' ]
+	parts += [ '<ArticleTitle>%s</ArticleTitle>' % title, '<Abstract>', '<AbstractText>%s</AbstractText>' % abstract, '</Abstract>', '</Article>' ]
+	if commentPMID is not None:
+		parts += [ '<CommentsCorrectionsList>', '<CommentsCorrections RefType="CommentOn">', '<RefSource>J Tests. 2001</RefSource>', '<PMID Version="1">%d</PMID>' % commentPMID, '</CommentsCorrections>', '</CommentsCorrectionsList>' ]
+	parts += [ '</MedlineCitation>', '<PubmedData>', '<PublicationStatus>ppublish</PublicationStatus>', '</PubmedData>', '</PubmedArticle>' ]
+
+	if indent:
+		depth = 0
+		lines = []
+		for part in parts:
+			if part.startswith('</'):
+				depth -= 1
+			lines.append('  '*depth + part)
+			if not part.startswith('</') and not '</' in part:
+				depth += 1
+		return "\r\n".join(lines) + "\r\n"
+	return "".join(parts) + "\n"
+
+def writePubmedFile(filename,articles):
+	with open(filename,'w',newline='') as f:
+		f.write('<?xml version="1.0" encoding="utf-8"?>\n<PubmedArticleSet>\n')
+		for article in articles:
+			f.write(article)
+		f.write('</PubmedArticleSet>\n')
+
+def digest(data):
+	return hashlib.md5(data).digest()
+
+def gatherFingerprints(tmpDir,fileArticles,whichHashes):
+	hashDir = os.path.join(tmpDir,'hashes')
+	pmidDir = os.path.join(tmpDir,'pmids')
+	os.makedirs(hashDir)
+	for i,articles in enumerate(fileArticles):
+		xmlFile = os.path.join(tmpDir,'pubmed%03d.xml' % (i+1))
+		writePubmedFile(xmlFile,articles)
+		pubmed_hash(xmlFile,os.path.join(hashDir,os.path.basename(xmlFile)+'.hashes'),hashMode='fingerprint')
+
+	gatherPMIDs(hashDir,pmidDir,whichHashes,incremental=False)
+	pmids = {}
+	for i in range(len(fileArticles)):
+		with open(os.path.join(pmidDir,'pubmed%03d.xml.pmids' % (i+1))) as f:
+			pmids[i+1] = [ int(line) for line in f ]
+	return pmids
+
+def test_fingerprint_ignores_whitespace():
+	article = getArticleXML(1,'A title','An abstract').encode('utf8')
+	indented = getArticleXML(1,'A title','An abstract',indent=True).encode('utf8')
+	assert article != indented
+	assert fingerprintPubmedArticle(article,digest) == fingerprintPubmedArticle(indented,digest)
+
+	changed = getArticleXML(1,'A title','A different abstract').encode('utf8')
+	pmid,hashes = fingerprintPubmedArticle(changed,digest)
+	_,originalHashes = fingerprintPubmedArticle(article,digest)
+	assert hashes['rawTitle'] == originalHashes['rawTitle']
+	assert hashes['rawAbstract'] != originalHashes['rawAbstract']
+	assert hashes['rawArticle'] != originalHashes['rawArticle']
+
+def test_reindented_file_has_no_changes():
+	with tempfile.TemporaryDirectory() as tmpDir:
+		original = [ getArticleXML(pmid,'Title %d' % pmid,'Abstract %d' % pmid) for pmid in range(1,20) ]
+		reindented = [ getArticleXML(pmid,'Title %d' % pmid,'Abstract %d' % pmid,indent=True) for pmid in range(1,20) ]
+		pmids = gatherFingerprints(tmpDir,[original,reindented],['fingerprint'])
+		assert pmids == {1:list(range(1,20)), 2:[]}
+
+def test_title_change_only_moves_title_fingerprint():
+	original = [ getArticleXML(pmid,'Title %d' % pmid,'Abstract %d' % pmid) for pmid in range(1,20) ]
+	update = [ getArticleXML(pmid,'Corrected title %d' % pmid if pmid == 7 else 'Title %d' % pmid,'Abstract %d' % pmid) for pmid in range(5,10) ]
+	with tempfile.TemporaryDirectory() as tmpDir:
+		assert gatherFingerprints(tmpDir,[original,update],['rawTitle']) == {1:[ pmid for pmid in range(1,20) if pmid != 7 ], 2:[7]}
+	with tempfile.TemporaryDirectory() as tmpDir:
+		assert gatherFingerprints(tmpDir,[original,update],['rawAbstract']) == {1:list(range(1,20)), 2:[]}
+	with tempfile.TemporaryDirectory() as tmpDir:
+		assert gatherFingerprints(tmpDir,[original,update],['fingerprint']) == {1:[ pmid for pmid in range(1,20) if pmid != 7 ], 2:[7]}
+
+def test_pmid_from_medline_citation():
+	article = getArticleXML(12,'A reply','An abstract',commentPMID=3).encode('utf8')
+	pmid,_ = fingerprintPubmedArticle(article,digest)
+	assert pmid == '12'
+
+	# A citation that comments on another one only moves its own PMID
+	original = [ getArticleXML(pmid,'Title %d' % pmid,'Abstract %d' % pmid) for pmid in range(1,6) ]
+	update = [ getArticleXML(5,'Title 5','Abstract 5',commentPMID=3) ]
+	with tempfile.TemporaryDirectory() as tmpDir:
+		assert gatherFingerprints(tmpDir,[original,update],['fingerprint']) == {1:[1,2,3,4], 2:[5]}
@@ -0,0 +1,156 @@
+import os
+import hashlib
+import tempfile
+import pytest
+import pubrunner.gather_pmids
+from pubrunner.hashstore import writeHashStore
+from pubrunner.gather_pmids import gatherPMIDs
+
+class Killed(Exception):
+	pass
+
+def digest(text):
+	return hashlib.md5(text.encode('utf8')).digest()
+
+# Writes a hash file with the title and abstract hashes of each PMID for a source file
+def writeHashFile(hashDir,name,titles,abstracts):
+	pmidHashes = { pmid:{'title':digest(titles[pmid]),'abstract':digest(abstracts[pmid])} for pmid in titles }
+	writeHashStore(os.path.join(hashDir,name+'.hashes'),[('/data/'+name,pmidHashes)],['title','abstract'],8,'md5')
+
+# The contents of every file in the PMID directory (including the hidden state file)
+def readPMIDFiles(directory):
+	pmids = {}
+	for name in sorted(os.listdir(directory)):
+		with open(os.path.join(directory,name),'rb') as f:
+			pmids[name] = f.read()
+	return pmids
+
+# Fails the merge of gatherPMIDs part of the way through
+def killGatherAfter(monkeypatch,killAfter):
+	originalDigest = pubrunner.gather_pmids.digestHashValue
+	digested = [0]
+	def digestHashValue(hashVal):
+		digested[0] += 1
+		if digested[0] == killAfter:
+			raise Killed()
+		return originalDigest(hashVal)
+	monkeypatch.setattr(pubrunner.gather_pmids,'digestHashValue',digestHashValue)
+
+def test_failed_gather_leaves_outputs(monkeypatch):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		hashDir = os.path.join(tmpDir,'hashes')
+		pmidDir = os.path.join(tmpDir,'pmids')
+		os.makedirs(hashDir)
+		writeHashFile(hashDir,'pubmed001.xml',{ pmid:'Title %d' % pmid for pmid in range(1,100) },{ pmid:'Abstract %d' % pmid for pmid in range(1,100) })
+		writeHashFile(hashDir,'pubmed002.xml',{ pmid:'New title %d' % pmid for pmid in range(50,150) },{ pmid:'Abstract %d' % pmid for pmid in range(50,150) })
+
+		gatherPMIDs(hashDir,pmidDir,incremental=False)
+		before = readPMIDFiles(pmidDir)
+
+		with monkeypatch.context() as m:
+			killGatherAfter(m,75)
+			with pytest.raises(Killed):
+				gatherPMIDs(hashDir,pmidDir,['abstract'],incremental=False)
+
+		# The outputs (and the state) are as they were and there are no temporary files left
+		assert readPMIDFiles(pmidDir) == before
+
+# Hash files for up to four source files where later files change the titles and abstracts of some PMIDs
+hashFileContents = [
+	('pubmed001.xml', { pmid:'Title %d' % pmid for pmid in range(1,100) }, { pmid:'Abstract %d' % pmid for pmid in range(1,100) }),
+	('pubmed002.xml', { pmid:'New title %d' % pmid if pmid < 100 else 'Title %d' % pmid for pmid in range(50,150) }, { pmid:'Abstract %d' % pmid for pmid in range(50,150) }),
+	('pubmed003.xml', { pmid:'Newer title %d' % pmid for pmid in range(120,140) }, { pmid:'Changed abstract %d' % pmid if pmid >= 130 else 'Abstract %d' % pmid for pmid in range(120,140) }),
+	('pubmed004.xml', { pmid:'Title %d' % pmid for pmid in range(95,200) }, { pmid:'Abstract %d' % pmid for pmid in range(95,200) })
+]
+
+# Writes the first count hash files (leaving any that are already there alone)
+def writeHashFiles(hashDir,count):
+	os.makedirs(hashDir,exist_ok=True)
+	for name,titles,abstracts in hashFileContents[:count]:
+		if not os.path.isfile(os.path.join(hashDir,name+'.hashes')):
+			writeHashFile(hashDir,name,titles,abstracts)
+
+def readOutputs(directory):
+	return { name:contents for name,contents in readPMIDFiles(directory).items() if not name.startswith('.') }
+
+# The outputs of gathering everything again in a new directory
+def gatherReference(tmpDir,hashDir,whichHashes,pmidExclusions=None):
+	with tempfile.TemporaryDirectory(dir=tmpDir) as referenceDir:
+		gatherPMIDs(hashDir,referenceDir,whichHashes,pmidExclusions,incremental=False)
+		return readOutputs(referenceDir)
+
+# Fails gatherPMIDs when it moves the killAfter-th output file into place
+def killReplaceAfter(monkeypatch,killAfter):
+	originalReplace = os.replace
+	replaced = [0]
+	def replace(src,dst):
+		replaced[0] += 1
+		if replaced[0] == killAfter:
+			raise Killed()
+		return originalReplace(src,dst)
+	monkeypatch.setattr(os,'replace',replace)
+
+def test_rerun_after_failed_gather_with_other_hashes(monkeypatch,capsys):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		hashDir = os.path.join(tmpDir,'hashes')
+		pmidDir = os.path.join(tmpDir,'pmids')
+		writeHashFiles(hashDir,3)
+
+		gatherPMIDs(hashDir,pmidDir)
+		expected = readOutputs(pmidDir)
+		assert expected == gatherReference(tmpDir,hashDir,None)
+		assert expected['pubmed001.xml.pmids'] == "".join( "%d\n" % pmid for pmid in range(1,50) ).encode()
+
+		# The outputs for the abstract hashes are all different, and the run stops after replacing one of them
+		assert gatherReference(tmpDir,hashDir,['abstract'])['pubmed001.xml.pmids'] != expected['pubmed001.xml.pmids']
+		with monkeypatch.context() as m:
+			killReplaceAfter(m,2)
+			with pytest.raises(Killed):
+				gatherPMIDs(hashDir,pmidDir,['abstract'])
+		assert readOutputs(pmidDir) != expected
+
+		# The state from the first run can't be used with the outputs that were left
+		capsys.readouterr()
+		gatherPMIDs(hashDir,pmidDir)
+		assert not 'previous PMID state' in capsys.readouterr().out
+		assert readOutputs(pmidDir) == expected
+
+def test_changed_output_is_gathered_again(capsys):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		hashDir = os.path.join(tmpDir,'hashes')
+		pmidDir = os.path.join(tmpDir,'pmids')
+		writeHashFiles(hashDir,3)
+
+		gatherPMIDs(hashDir,pmidDir)
+		expected = readOutputs(pmidDir)
+
+		capsys.readouterr()
+		gatherPMIDs(hashDir,pmidDir)
+		assert 'No new hash files' in capsys.readouterr().out
+
+		# An output that doesn't match the state (e.g. from a run that stopped while writing it) isn't trusted
+		with open(os.path.join(pmidDir,'pubmed002.xml.pmids'),'w') as f:
+			f.write("50\n")
+		gatherPMIDs(hashDir,pmidDir)
+		assert not 'previous PMID state' in capsys.readouterr().out
+		assert readOutputs(pmidDir) == expected
+
+@pytest.mark.parametrize('whichHashes', [None,['title'],['abstract']])
+def test_incremental_gather_matches_rebuild(capsys,whichHashes):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		hashDir = os.path.join(tmpDir,'hashes')
+		pmidDir = os.path.join(tmpDir,'pmids')
+		writeHashFiles(hashDir,2)
+		gatherPMIDs(hashDir,pmidDir,whichHashes)
+
+		# The new files are applied to the state from the last run, along with a change to the excluded PMIDs
+		writeHashFiles(hashDir,4)
+		pmidExclusions = set([1,130,150])
+		capsys.readouterr()
+		gatherPMIDs(hashDir,pmidDir,whichHashes,pmidExclusions)
+		assert 'Applied 2 new hash file(s)' in capsys.readouterr().out
+		assert readOutputs(pmidDir) == gatherReference(tmpDir,hashDir,whichHashes,pmidExclusions)
+
+		gatherPMIDs(hashDir,pmidDir,whichHashes)
+		assert 'Applied 0 new hash file(s)' in capsys.readouterr().out
+		assert readOutputs(pmidDir) == gatherReference(tmpDir,hashDir,whichHashes)
@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+import pytest
+import pubrunner.convert
+import pubrunner.xmlbackend
+from helpers import readOutput
+
+# Small Pubmed and PMC files converted with the original conversion code. The outputs are checked against them so
+# that changes to the text extraction, normalization and encoding can't change what is written
+dataDir = os.path.join(os.path.dirname(__file__),'data')
+
+def convertFixture(tmpDir,name,inFormat,outFormat):
+	outFile = os.path.join(tmpDir,'out.' + outFormat)
+	pubrunner.convert.convertFiles([os.path.join(dataDir,name)],inFormat,outFile,outFormat)
+	return readOutput(outFile)
+
+def readExpected(name):
+	return readOutput(os.path.join(dataDir,name))
+
+# The PMC article has inline markup nested inside other markup and inside ignored elements (e.g. xref and tables),
+# text in the tails of all of them, lists, figures, back matter, floats and a sub-article
+def test_pmc_text_matches_expected():
+	with tempfile.TemporaryDirectory() as tmpDir:
+		assert convertFixture(tmpDir,'pmc_golden.nxml','pmcxml','txt') == readExpected('pmc_golden.txt')
+
+# The single loop that walks and merges the text gives the same as walking it and then merging, for every element
+@pytest.mark.parametrize('xmlBackend', sorted(pubrunner.xmlbackend.backends.keys()))
+def test_text_walk_matches_merge(xmlBackend):
+	backend = pubrunner.xmlbackend.getXMLBackend(xmlBackend)
+	with open(os.path.join(dataDir,'pmc_golden.nxml'),'rb') as f:
+		article = next(iter(backend.iterparse(f,'article')))
+		for elem in article.iter():
+			if not isinstance(elem.tag,str):
+				continue
+			merged = pubrunner.convert.extractTextFromElemList_merge(pubrunner.convert.iterTextFromElemList([elem]))
+			assert pubrunner.convert.extractRawTextFromElemList([elem]) == merged
+
+# The Pubmed citations have commas next to periods, repeated commas, brackets without any words in them, escaped
+# entities, no-break spaces, newlines and an older "[Title]." style title
+def test_pubmed_text_matches_expected():
+	with tempfile.TemporaryDirectory() as tmpDir:
+		assert convertFixture(tmpDir,'pubmed_golden.xml','pubmedxml','txt') == readExpected('pubmed_golden.txt')
+
+# What the original cleanupText, removeWeirdBracketsFromOldTitles (for titles), htmlUnescape and
+# removeBracketsWithoutWords gave for each passage
+normalizationCases = [
+	('Rates rose , , and fell ,.', 'Rates rose , and fell .', 'Rates rose , and fell .'),
+	('A list,,, of items , ,.', 'A list, of items .', 'A list, of items .'),
+	('Commas ,. , . before periods', 'Commas . . before periods', 'Commas . . before periods'),
+	('No change, here.', 'No change, here.', 'No change, here.'),
+	('Multi\nline\xa0text\u2028with separators\u200b.', 'Multi line text with separators.', 'Multi line text with separators.'),
+	('Values &amp;lt; 5 &amp;amp; (  ) [ - ] { ; } remain.', 'Values &lt; 5 &amp;       remain.', 'Values &lt; 5 &amp;       remain.'),
+	('Keep (p < 0.05) and [1] and {x}.', 'Keep (p < 0.05) and [1] and {x}.', 'Keep (p < 0.05) and [1] and {x}.'),
+	('&lt;b&gt; escaped , tags &#x3b1;-helix', '<b> escaped , tags \u03b1-helix', '<b> escaped , tags \u03b1-helix'),
+	('  \t padded \t ', 'padded', 'padded'),
+	('[An old title].', '[An old title].', 'An old title.'),
+	('[Not old] title.', '[Not old] title.', '[Not old] title.')
+]
+
+@pytest.mark.parametrize('text,expected,expectedTitle', normalizationCases)
+def test_normalization_matches_expected(text,expected,expectedTitle):
+	assert pubrunner.convert.normalizeTextList([text]) == [expected]
+	assert pubrunner.convert.normalizeTextList([text],isTitle=True) == [expectedTitle]
+
+def test_empty_passages_are_dropped():
+	assert pubrunner.convert.normalizeTextList(['', ' , ', '\u200b', 'Kept.'],isTitle=True) == [',', 'Kept.']
+
+# The documents extracted from each citation and article (before they are made into BioC documents) with their
+# dates, authors, chemicals, MeSH headings and journal names
+@pytest.mark.parametrize('xmlBackend', sorted(pubrunner.xmlbackend.backends.keys()))
+@pytest.mark.parametrize('name,process', [('pubmed_golden.xml',pubrunner.convert.processMedlineFile), ('pmc_golden.nxml',pubrunner.convert.processPMCFile)])
+def test_extracted_documents_match_expected(xmlBackend,name,process):
+	with open(os.path.join(dataDir,os.path.splitext(name)[0] + '.json')) as f:
+		expected = json.load(f)
+	assert list(process(os.path.join(dataDir,name),xmlBackend=xmlBackend)) == expected
+
+# The BioC output (apart from the date in the header) is the same as bioc.iterwrite gave, including the escaping
+# of special characters and the "None" infons for missing values
+@pytest.mark.parametrize('name,inFormat', [('pubmed_golden.xml','pubmedxml'), ('pmc_golden.nxml','pmcxml')])
+def test_bioc_matches_expected(name,inFormat):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		assert convertFixture(tmpDir,name,inFormat,'bioc') == readExpected(os.path.splitext(name)[0] + '.bioc')
@@ -0,0 +1,100 @@
+import os
+import hashlib
+import tempfile
+import pubrunner.hashstore as hashstore
+from pubrunner.pubmed_hash import pubmed_hash
+from pubrunner.gather_pmids import gatherPMIDs
+
+def writePubmedFile(filename,pmids,changedTitles=set()):
+	with open(filename,'w') as f:
+		f.write('<?xml version="1.0" encoding="utf-8"?>\n<PubmedArticleSet>\n')
+		for pmid in pmids:
+			title = 'Changed title of article %d' % pmid if pmid in changedTitles else 'Title of article %d' % pmid
+			f.write('<PubmedArticle><MedlineCitation><PMID>%d</PMID><Article>' % pmid)
+			f.write('<Journal><JournalIssue><PubDate><Year>2001</Year><Month>Mar</Month></PubDate></JournalIssue><Title>Journal %d</Title></Journal>' % (pmid % 10))
+			f.write('<ArticleTitle>%s</ArticleTitle>' % title)
+			f.write('<Abstract><AbstractText>Abstract of article %d</AbstractText></Abstract>' % pmid)
+			f.write('</Article></MedlineCitation><PubmedData><History>')
+			f.write('<PubMedPubDate PubStatus="pubmed"><Year>2001</Year><Month>3</Month><Day>1</Day></PubMedPubDate>')
+			f.write('</History></PubmedData></PubmedArticle>\n')
+		f.write('</PubmedArticleSet>\n')
+
+def md5(text):
+	return hashlib.md5(text.encode('utf8')).digest()
+
+def test_hash_store_round_trip():
+	sections = [
+		('/data/pubmed001.xml', {30:{'title':md5('c'),'year':md5('2001')}, 10:{'title':md5('a'),'year':b''}}),
+		('/data/pubmed002.xml', {})
+	]
+	with tempfile.TemporaryDirectory() as tmpDir:
+		filename = os.path.join(tmpDir,'hashes')
+		hashstore.writeHashStore(filename,sections,['title','year'],8,'blake2b')
+		assert hashstore.isHashStore(filename)
+
+		with hashstore.HashStore(filename) as store:
+			assert store.digestAlgorithm == 'blake2b'
+			assert store.digestSize == 8
+			assert store.fields == ['title','year']
+			assert [ section.source for section in store.sections ] == ['/data/pubmed001.xml','/data/pubmed002.xml']
+
+			first,second = store.sections
+			assert list(first.pmids) == [10,30]
+			assert bytes(first.digests['title']) == md5('a')[:8] + md5('c')[:8]
+			assert bytes(first.digests['year']) == b'\0'*8 + md5('2001')[:8]
+			assert second.count == 0 and list(second.pmids) == []
+
+def test_json_conversion_matches_binary():
+	with tempfile.TemporaryDirectory() as tmpDir:
+		xmlFile = os.path.join(tmpDir,'pubmed001.xml')
+		writePubmedFile(xmlFile,range(1,50))
+
+		jsonFile = os.path.join(tmpDir,'json.hashes')
+		binaryFile = os.path.join(tmpDir,'binary.hashes')
+		pubmed_hash(xmlFile,jsonFile,hashFormat='json')
+		pubmed_hash(xmlFile,binaryFile,hashFormat='binary',digestSize=16)
+		assert not hashstore.isHashStore(jsonFile)
+
+		assert hashstore.convertHashFiles([jsonFile,binaryFile],16) == 1
+		with open(jsonFile,'rb') as f, open(binaryFile,'rb') as g:
+			assert f.read() == g.read()
+
+def readPMIDFiles(directory):
+	pmids = {}
+	for name in sorted(os.listdir(directory)):
+		if not name.startswith('.'):
+			with open(os.path.join(directory,name)) as f:
+				pmids[name] = f.read()
+	return pmids
+
+def test_json_and_binary_hashes_give_same_pmids():
+	with tempfile.TemporaryDirectory() as tmpDir:
+		xmlFiles = [ os.path.join(tmpDir,'pubmed%03d.xml' % i) for i in range(3) ]
+		writePubmedFile(xmlFiles[0],range(1,200))
+		writePubmedFile(xmlFiles[1],range(150,250),changedTitles=set(range(150,160)))
+		writePubmedFile(xmlFiles[2],range(155,165))
+
+		results = {}
+		for hashFormat in ['json','binary']:
+			hashDir = os.path.join(tmpDir,hashFormat+'.hashes')
+			os.makedirs(hashDir)
+			for xmlFile in xmlFiles:
+				pubmed_hash(xmlFile,os.path.join(hashDir,os.path.basename(xmlFile)+'.hashes'),hashFormat=hashFormat)
+
+			for whichHashes in [None,['title'],['abstract']]:
+				pmidDir = os.path.join(tmpDir,'%s.%s.pmids' % (hashFormat,whichHashes))
+				gatherPMIDs(hashDir,pmidDir,whichHashes,incremental=False)
+				results[(hashFormat,str(whichHashes))] = readPMIDFiles(pmidDir)
+
+		for whichHashes in [None,['title'],['abstract']]:
+			assert results[('json',str(whichHashes))] == results[('binary',str(whichHashes))]
+
+		titlePMIDs = results[('binary',"['title']")]
+		assert titlePMIDs['pubmed000.xml.pmids'] == "".join( "%d\n" % pmid for pmid in range(1,200) if not pmid in range(150,160) )
+		assert titlePMIDs['pubmed001.xml.pmids'] == "".join( "%d\n" % pmid for pmid in range(150,250) if not pmid in range(155,200) )
+		assert titlePMIDs['pubmed002.xml.pmids'] == "".join( "%d\n" % pmid for pmid in range(155,160) )
+
+		abstractPMIDs = results[('binary',"['abstract']")]
+		assert abstractPMIDs['pubmed000.xml.pmids'] == "".join( "%d\n" % pmid for pmid in range(1,200) )
+		assert abstractPMIDs['pubmed001.xml.pmids'] == "".join( "%d\n" % pmid for pmid in range(200,250) )
+		assert abstractPMIDs['pubmed002.xml.pmids'] == ""
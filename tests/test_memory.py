@@ -0,0 +1,46 @@
+import os
+import resource
+import tempfile
+import multiprocessing
+import pubrunner.xmlbackend
+from helpers import writeSyntheticPubmedFile
+
+def iterparseInChild(filename,backendName,queue):
+	backend = pubrunner.xmlbackend.getXMLBackend(backendName)
+	before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	docCount = 0
+	for elem in backend.iterparse(filename,'PubmedArticle'):
+		docCount += 1
+	after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	queue.put((docCount,after-before))
+
+# Streams the articles from a Pubmed file in a new (forked) process and returns how much its peak RSS grew by. The
+# RSS includes memory allocated by libxml2 for lxml, which tracemalloc can't see
+def getPeakMemoryGrowthForIterparse(filename,backendName):
+	context = multiprocessing.get_context('fork')
+	queue = context.Queue()
+	process = context.Process(target=iterparseInChild,args=(filename,backendName,queue))
+	process.start()
+	docCount,growth = queue.get()
+	process.join()
+	return docCount,growth
+
+# Peak memory for streaming the articles from a Pubmed file should stay roughly constant as the number
+# of articles grows, i.e. processed articles must not be kept attached to the tree
+def test_iterparse_memory_bounded():
+	with tempfile.TemporaryDirectory() as tmpDir:
+		smallFile = os.path.join(tmpDir,'small.xml')
+		largeFile = os.path.join(tmpDir,'large.xml')
+		writeSyntheticPubmedFile(smallFile,10000)
+		writeSyntheticPubmedFile(largeFile,100000)
+
+		# ru_maxrss is in kilobytes (bytes on macOS). Keeping the processed articles in the tree would take several
+		# times the size of the large file
+		allowance = os.path.getsize(largeFile) // 1024 // 4
+
+		for backend in sorted(pubrunner.xmlbackend.backends.keys()):
+			smallCount,smallGrowth = getPeakMemoryGrowthForIterparse(smallFile,backend)
+			largeCount,largeGrowth = getPeakMemoryGrowthForIterparse(largeFile,backend)
+
+			assert smallCount == 10000 and largeCount == 100000
+			assert largeGrowth < 2*smallGrowth + allowance, "Peak memory grew by %d with %d articles but %d with %d articles with the %s backend" % (smallGrowth,smallCount,largeGrowth,largeCount,backend)
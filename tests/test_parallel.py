@@ -0,0 +1,67 @@
+import os
+import re
+import tempfile
+import pytest
+import pubrunner.convert
+from pubrunner.pubmed_hash import pubmed_hash,getHashTasks
+from pubrunner.inputfiles import listArchiveMembers,makeVirtualFilename
+from helpers import writeSyntheticPubmedFile,writeSyntheticPMCArchive,readOutput
+
+# Large Pubmed files are split into byte ranges of PubmedArticle elements for the workers. Anything else before or
+# between the articles (e.g. PubmedBookArticle elements) isn't converted either way
+@pytest.mark.parametrize('outName,outFormat', [('out.bioc','bioc'), ('out.txt','txt')])
+def test_parallel_conversion_matches_serial(outName,outFormat):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		inFile = os.path.join(tmpDir,'pubmed.xml')
+		writeSyntheticPubmedFile(inFile,200,bookArticles=True)
+
+		tasks = pubrunner.convert.getConversionTasks([inFile],'pubmedxml',[None],3)
+		assert len(tasks) == 3 and all( byteRange is not None for _,_,_,byteRange,_ in tasks )
+
+		serialFile = os.path.join(tmpDir,'serial.' + outName)
+		parallelFile = os.path.join(tmpDir,'parallel.' + outName)
+		pubrunner.convert.convertFiles([inFile],'pubmedxml',serialFile,outFormat,workers=1)
+		pubrunner.convert.convertFiles([inFile],'pubmedxml',parallelFile,outFormat,workers=3)
+
+		assert readOutput(parallelFile) == readOutput(serialFile)
+		assert b'Title of article 200' in readOutput(serialFile)
+
+@pytest.mark.parametrize('hashMode', ['fields','fingerprint'])
+def test_parallel_hashing_matches_serial(hashMode):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		inFile = os.path.join(tmpDir,'pubmed.xml')
+		writeSyntheticPubmedFile(inFile,200,bookArticles=True)
+
+		tasks = getHashTasks([inFile],False,'md5',8,3,hashMode)
+		assert len(tasks) == 3 and all( byteRange is not None for _,byteRange,_,_,_,_ in tasks )
+
+		serialFile = os.path.join(tmpDir,'serial.hashes')
+		parallelFile = os.path.join(tmpDir,'parallel.hashes')
+		pubmed_hash([inFile],serialFile,workers=1,hashMode=hashMode)
+		pubmed_hash([inFile],parallelFile,workers=3,hashMode=hashMode)
+
+		with open(serialFile,'rb') as f, open(parallelFile,'rb') as g:
+			assert f.read() == g.read()
+
+# An archive is read once from the start with its members handed out to the workers. The documents come out in the
+# order that the members are stored in the archive, either way
+@pytest.mark.parametrize('asMembers', [False,True])
+def test_parallel_archive_conversion_matches_serial(asMembers):
+	with tempfile.TemporaryDirectory() as tmpDir:
+		archive = os.path.join(tmpDir,'pmc.tar.gz')
+		writeSyntheticPMCArchive(archive,30)
+		members = listArchiveMembers(archive)
+		inFiles = [ makeVirtualFilename(archive,member) for member in members ] if asMembers else [archive]
+
+		tasks = pubrunner.convert.getConversionTasks(inFiles,'pmcxml',[None]*len(inFiles),3)
+		assert len(tasks) == 1
+
+		serialFile = os.path.join(tmpDir,'serial.bioc')
+		parallelFile = os.path.join(tmpDir,'parallel.bioc')
+		pubrunner.convert.convertFiles(inFiles,'pmcxml',serialFile,'bioc',workers=1)
+		pubrunner.convert.convertFiles(inFiles,'pmcxml',parallelFile,'bioc',workers=3)
+
+		assert readOutput(parallelFile) == readOutput(serialFile)
+		pmcids = [ int(pmcid) for pmcid in re.findall(rb'<infon key="pmcid">(\d+)</infon>',readOutput(serialFile)) ]
+		assert pmcids == [ int(re.search(r'PMC(\d+)\.nxml',member).group(1)) for member in members ]
+		assert pmcids != sorted(pmcids)
@@ -0,0 +1,48 @@
+import os
+import json
+import tempfile
+import multiprocessing
+import pytest
+import pubrunner.convert
+import pubrunner.profiling as profiling
+from helpers import writeSyntheticPubmedFile
+
+def readStats(outFile):
+	with open(profiling.getStatsFilename(outFile)) as f:
+		return json.load(f)
+
+# The workers are sent whether to collect stats with each task and send them back with the results, so they are
+# the same whether the workers are forked or spawned (and don't inherit anything from the main process)
+@pytest.mark.parametrize('workers,startMethod', [(1,None), (3,'fork'), (3,'spawn')])
+def test_profile_counts_every_document(monkeypatch,workers,startMethod):
+	if startMethod is not None:
+		monkeypatch.setattr(pubrunner.convert.multiprocessing,'Pool',multiprocessing.get_context(startMethod).Pool)
+
+	with tempfile.TemporaryDirectory() as tmpDir:
+		inFile = os.path.join(tmpDir,'pubmed.xml')
+		outFile = os.path.join(tmpDir,'out.bioc')
+		writeSyntheticPubmedFile(inFile,200)
+
+		for _ in range(2):
+			pubrunner.convert.convertFiles([inFile],'pubmedxml',outFile,'bioc',workers=workers,profile=True)
+			assert profiling.currentProfile is None
+
+			# Nothing is carried over from the first conversion to the second
+			stats = readStats(outFile)
+			assert stats['documents'] == 200
+			assert stats['inputBytes'] == os.path.getsize(inFile)
+			assert stats['stages']['parse']['calls'] >= 200
+			assert stats['stages']['extract']['calls'] == 200
+			assert stats['stages']['encode']['calls'] == 200
+			assert stats['stages']['cleanup']['calls'] > 0
+
+def test_no_stats_without_profile(monkeypatch):
+	monkeypatch.delenv(profiling.profileEnvironmentalVariable,raising=False)
+	with tempfile.TemporaryDirectory() as tmpDir:
+		inFile = os.path.join(tmpDir,'pubmed.xml')
+		outFile = os.path.join(tmpDir,'out.bioc')
+		writeSyntheticPubmedFile(inFile,20)
+
+		pubrunner.convert.convertFiles([inFile],'pubmedxml',outFile,'bioc')
+		assert not os.path.isfile(profiling.getStatsFilename(outFile))
+		assert profiling.currentProfile is None